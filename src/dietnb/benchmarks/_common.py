@@ -0,0 +1,90 @@
+"""
+Shared helpers for the dietnb benchmarks.
+
+Benchmarks run headless on the Agg backend against a minimal fake shell, so
+they need neither a Jupyter server nor a real kernel.
+"""
+
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+# Allow running the scripts straight from a source checkout
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+class _Events:
+    def __init__(self):
+        self.callbacks = {"pre_run_cell": [], "post_run_cell": []}
+
+    def register(self, name, callback):
+        self.callbacks.setdefault(name, []).append(callback)
+
+    def unregister(self, name, callback):
+        self.callbacks[name].remove(callback)
+
+    def trigger(self, name, *args):
+        for callback in list(self.callbacks.get(name, [])):
+            callback(*args)
+
+
+class FakeShell:
+    """Minimal stand-in for an IPython shell, enough for dietnb's hot path."""
+
+    def __init__(self, notebook_path=None, cell_id="bench-cell"):
+        self.execution_count = 1
+        self.parent_header = {"metadata": {"cellId": cell_id}}
+        self.user_global_ns = {}
+        self.events = _Events()
+        self.display_formatter = SimpleNamespace(formatters={})
+        session = SimpleNamespace(path=str(notebook_path) if notebook_path else None)
+        self.kernel = SimpleNamespace(session=session)
+
+    def run_cell(self, cell_id=None):
+        """Starts a new execution, optionally of a different cell."""
+        self.execution_count += 1
+        if cell_id is not None:
+            self.parent_header = {"metadata": {"cellId": cell_id}}
+
+    def finish_cell(self):
+        self.events.trigger("post_run_cell", None)
+
+
+@contextmanager
+def temporary_notebook(name="bench.ipynb"):
+    """Yields a notebook path inside a fresh temporary working directory."""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="dietnb-bench-") as tmp:
+        os.chdir(tmp)
+        notebook = Path(tmp) / name
+        notebook.write_text('{"cells": [], "metadata": {}, "nbformat": 4, "nbformat_minor": 5}')
+        try:
+            yield notebook
+        finally:
+            os.chdir(previous)
+
+
+def tiny_png() -> bytes:
+    """A valid 1x1 PNG used where the benchmark must not measure rasterization."""
+    import base64
+
+    return base64.b64decode(
+        "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+    )
+
+
+def report(name: str, results: dict, argv=None) -> dict:
+    """Prints results as JSON, and writes them to ``--json PATH`` if given."""
+    argv = sys.argv[1:] if argv is None else argv
+    payload = {"benchmark": name, "results": results}
+    text = json.dumps(payload, indent=2, sort_keys=True)
+    print(text)
+    if "--json" in argv:
+        Path(argv[argv.index("--json") + 1]).write_text(text + "\n")
+    return payload
@@ -0,0 +1,80 @@
+"""
+Wall time of a cell that displays many figures in a loop, rendered in the
+kernel one by one versus inside ``dietnb.batch()`` on worker processes.
+
+The batch time includes pickling, rendering and waiting for every file on
+exit; the first batch also starts the worker processes, which is reported
+separately as ``pool_start_seconds``.
+
+    python benchmarks/bench_batch.py [--figures N] [--workers 1,2,4] [--json out.json]
+"""
+
+import os
+import sys
+import time
+
+from _common import FakeShell, report, temporary_notebook
+
+import matplotlib.pyplot as plt
+
+import dietnb
+from dietnb import _batch, _stats
+
+
+def group_figure(index: int):
+    fig, ax = plt.subplots(figsize=(6.4, 4.8))
+    ax.plot(range(500), [((i + index) * 37) % 101 for i in range(500)])
+    ax.set_title(f"group {index}")
+    return fig
+
+
+def run_cell(shell, figures: int, workers=None) -> float:
+    shell.run_cell()
+    started = time.perf_counter()
+    if workers is None:
+        for index in range(figures):
+            group_figure(index)._repr_html_()
+            plt.close("all")
+    else:
+        with dietnb.batch(workers):
+            for index in range(figures):
+                group_figure(index)._repr_html_()
+                plt.close("all")
+    elapsed = time.perf_counter() - started
+    shell.finish_cell()
+    return elapsed
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    figures = int(argv[argv.index("--figures") + 1]) if "--figures" in argv else 64
+    cpus = os.cpu_count() or 1
+    counts = (
+        [int(n) for n in argv[argv.index("--workers") + 1].split(",")]
+        if "--workers" in argv else sorted({1, 2, 4, cpus})
+    )
+
+    results = {"figures": figures, "cpus": cpus, "batch_seconds": {}, "pool_start_seconds": {}}
+    with temporary_notebook() as notebook:
+        shell = FakeShell(notebook)
+        dietnb.activate(shell)
+        try:
+            run_cell(shell, 2)  # Warm up fonts and caches
+            results["serial_seconds"] = run_cell(shell, figures)
+            for workers in counts:
+                results["pool_start_seconds"][str(workers)] = run_cell(shell, workers, workers)
+                _stats.reset()
+                results["batch_seconds"][str(workers)] = run_cell(shell, figures, workers)
+                pickle = _stats.snapshot()["timings"].get("batch_pickle", {})
+                results.setdefault("pickle_ms_per_figure", {})[str(workers)] = pickle.get("mean_ms")
+        finally:
+            dietnb.deactivate(shell)
+            _batch.shutdown()
+    results["speedup"] = {
+        workers: results["serial_seconds"] / seconds for workers, seconds in results["batch_seconds"].items()
+    }
+    return report("batch", results, argv)
+
+
+if __name__ == "__main__":
+    main()
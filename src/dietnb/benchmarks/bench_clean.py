@@ -0,0 +1,68 @@
+"""
+Times ``dietnb clean`` over a synthetic tree of notebooks, serially and on a
+process pool.
+
+Each notebook carries a few base64 image outputs next to its dietnb HTML so
+the streaming scan has realistic payloads to skip. Runs are dry runs, so the
+same tree is reused for every job count.
+
+    python benchmarks/bench_clean.py [--notebooks N] [--json out.json]
+"""
+
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _common import report
+
+from dietnb import _clean
+
+
+def build_tree(root: Path, notebooks: int, figures: int = 20) -> None:
+    payload = base64.b64encode(os.urandom(20_000)).decode()
+    for n in range(notebooks):
+        folder = root / f"project{n % 50}"
+        image_dir = folder / f"nb{n}_dietnb_imgs"
+        image_dir.mkdir(parents=True, exist_ok=True)
+        outputs = []
+        for i in range(figures):
+            name = f"{i + 1}_1_{n:06x}{i:06x}.png"
+            (image_dir / name).write_bytes(b"png")
+            (image_dir / f"0_{i + 1}_{n:06x}{i:06x}.png").write_bytes(b"stale")
+            outputs.append({
+                "output_type": "display_data",
+                "metadata": {},
+                "data": {
+                    "text/html": [f'<img src="{image_dir.name}/{name}" class="dietnb-img">\n'],
+                    "image/png": payload,
+                },
+            })
+        cells = [{"cell_type": "code", "execution_count": 1, "metadata": {}, "source": [], "outputs": outputs}]
+        (folder / f"nb{n}.ipynb").write_text(json.dumps({"cells": cells, "metadata": {}, "nbformat": 4}))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    notebooks = int(argv[argv.index("--notebooks") + 1]) if "--notebooks" in argv else 500
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        build_tree(root, notebooks)
+        results = {"notebooks": notebooks, "runs": []}
+        for jobs in sorted({1, 2, os.cpu_count() or 1}):
+            started = time.perf_counter()
+            summary = _clean.clean_tree([root], dry_run=True, jobs=jobs)
+            results["runs"].append({
+                "jobs": jobs,
+                "seconds": time.perf_counter() - started,
+                "would_delete": summary["deleted"],
+            })
+    return report("clean", results, argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Cost of stale-image cleanup in an image directory holding 10^4 files.
+
+``rerun`` re-executes cells of a populated directory and times releasing the
+cell's previous image and deleting it (``release_cell`` plus
+``_delete_orphaned_images``), which must not depend on the directory size.
+``clean_unused`` times both modes after a simulated kernel restart, with an
+older generation of images left on disk for half of the cells and a saved
+notebook referencing half of the current ones. Rendering is replaced by a
+constant PNG.
+
+    python benchmarks/bench_cleanup.py [--files N] [--json out.json]
+"""
+
+import json
+import sys
+import time
+
+from _common import FakeShell, report, temporary_notebook, tiny_png
+
+import matplotlib.pyplot as plt
+
+import dietnb
+from dietnb import _core, _manifest
+
+
+def populate(shell, fig, files: int) -> list:
+    """Displays one figure in each of ``files`` cells and returns the file names."""
+    names = []
+    for i in range(files):
+        shell.execution_count = i + 1
+        shell.parent_header = {"metadata": {"cellId": f"cell-{i}"}}
+        html = fig._repr_html_()
+        names.append(html.split('alt="', 1)[1].split('"', 1)[0])
+    return names
+
+
+def rerun(shell, fig, files: int, reruns: int) -> dict:
+    image_dir = _core._get_notebook_image_dir(shell)
+    manifest = _manifest.get_manifest(_core._directory_key(image_dir))
+    spent = [0.0]
+
+    def timed(function):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                spent[0] += time.perf_counter() - started
+        return wrapper
+
+    original_delete = _core._delete_orphaned_images
+    _core._delete_orphaned_images = timed(original_delete)
+    manifest.release_cell = timed(manifest.release_cell)
+    started = time.perf_counter()
+    try:
+        for i in range(reruns):
+            shell.execution_count = files + i + 1
+            shell.parent_header = {"metadata": {"cellId": f"cell-{i * files // reruns}"}}
+            fig._repr_html_()
+    finally:
+        _core._delete_orphaned_images = original_delete
+        del manifest.release_cell
+    elapsed = time.perf_counter() - started
+    return {
+        "reruns": reruns,
+        "figure_us": elapsed / reruns * 1e6,
+        "delete_previous_us": spent[0] / reruns * 1e6,
+        "files_left": sum(1 for _ in image_dir.iterdir()),
+    }
+
+
+def clean(files: int, mode: str, dry_run: bool) -> dict:
+    fig = plt.figure()
+    with temporary_notebook() as notebook:
+        shell = FakeShell(notebook)
+        dietnb.activate(shell)
+        original = _core.get_ipython
+        _core.get_ipython = lambda: shell
+        try:
+            names = populate(shell, fig, files)
+            image_dir = _core._get_notebook_image_dir(shell)
+            for name in names[::2]:
+                exec_count, idx, key = _manifest.parse_image_name(name)
+                (image_dir / f"0_{idx}_{key}.png").write_bytes(b"stale")
+            html = "".join(
+                f'<img src="{image_dir.name}/{name}" class="dietnb-img">' for name in names[: files // 2]
+            )
+            cells = [{"cell_type": "code", "metadata": {}, "source": [], "execution_count": 1,
+                      "outputs": [{"output_type": "display_data", "metadata": {}, "data": {"text/html": html}}]}]
+            notebook.write_text(json.dumps({"cells": cells, "metadata": {}, "nbformat": 4}))
+
+            # Kernel restart: nothing known but the files on disk
+            _core._registry.clear()
+            _manifest.clear()
+            started = time.perf_counter()
+            result = dietnb.clean_unused(mode=mode, dry_run=dry_run)
+            elapsed = time.perf_counter() - started
+        finally:
+            _core.get_ipython = original
+            dietnb.deactivate(shell)
+            _core._registry.clear()
+            plt.close(fig)
+    return {
+        "files": files + len(names[::2]),
+        "deleted": len(result["deleted"]),
+        "kept": len(result["kept"]),
+        "total_ms": elapsed * 1000.0,
+    }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    files = int(argv[argv.index("--files") + 1]) if "--files" in argv else 10_000
+
+    data = tiny_png()
+    original_render = _core._render_figure
+    _core._render_figure = lambda fig, fmt, dpi: data
+    try:
+        fig = plt.figure()
+        with temporary_notebook() as notebook:
+            shell = FakeShell(notebook)
+            dietnb.activate(shell)
+            try:
+                started = time.perf_counter()
+                populate(shell, fig, files)
+                populate_us = (time.perf_counter() - started) / files * 1e6
+                rerun_results = rerun(shell, fig, files, reruns=min(files, 200))
+            finally:
+                dietnb.deactivate(shell)
+                _core._registry.clear()
+                _manifest.clear()
+                plt.close(fig)
+
+        results = {
+            "files": files,
+            "figure_us": populate_us,
+            "rerun": rerun_results,
+            "clean_unused": {
+                f"{mode}{'_dry_run' if dry_run else ''}": clean(files, mode, dry_run)
+                for mode in _core.CLEAN_MODES
+                for dry_run in (True, False)
+            },
+        }
+    finally:
+        _core._render_figure = original_render
+    return report("cleanup", results, argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Per-figure cost of ``Figure._repr_html_`` and the notebook size it produces.
+
+Latency is measured on a minimal fake shell and on an in-process IPython
+shell, for the default settings and for the options that move work off the
+cell (``async_writes``, ``encoder="fast"``) or add background work
+(``thumbnail_width``); with ``async_writes`` only the part the cell waits
+for is timed. Notebook size compares the
+outputs dietnb emits (``output="full"`` and ``"compact"``) against inline
+base64 PNGs as the default inline backend would store them.
+
+    python benchmarks/bench_figure.py [--figures N] [--json out.json]
+"""
+
+import base64
+import io
+import json
+import statistics
+import sys
+import time
+
+from _common import FakeShell, report, temporary_notebook
+
+import matplotlib.pyplot as plt
+
+import dietnb
+from dietnb import _core
+
+CONFIGS = {
+    "default": {},
+    "async_writes": {"async_writes": True},
+    "fast_encoder": {"encoder": "fast"},
+    "thumbnails": {"thumbnail_width": 480},
+}
+
+
+def line_figure():
+    fig, ax = plt.subplots(figsize=(6.4, 4.8))
+    ax.plot(range(200), [(i * 37) % 101 for i in range(200)])
+    ax.set_title("bench")
+    return fig
+
+
+def in_process_shell(notebook):
+    from IPython.terminal.interactiveshell import TerminalInteractiveShell
+
+    TerminalInteractiveShell.clear_instance()
+    shell = TerminalInteractiveShell.instance()
+    shell.parent_header = {"metadata": {"cellId": "bench-cell"}}
+    shell.user_global_ns["__vsc_ipynb_file__"] = str(notebook)
+    return shell
+
+
+def next_cell(shell, exec_count):
+    shell.execution_count = exec_count
+    shell.parent_header = {"metadata": {"cellId": f"bench-cell-{exec_count}"}}
+
+
+def finish_cell(shell):
+    for callback in list(shell.events.callbacks.get("post_run_cell", [])):
+        callback(None)
+
+
+def latency(shell_kind: str, options: dict, figures: int) -> dict:
+    fig = line_figure()
+    samples = []
+    try:
+        with temporary_notebook() as notebook:
+            shell = FakeShell(notebook) if shell_kind == "fake" else in_process_shell(notebook)
+            dietnb.activate(shell, **options)
+            try:
+                fig._repr_html_()  # Warm up fonts and caches
+                for exec_count in range(2, figures + 2):
+                    next_cell(shell, exec_count)
+                    started = time.perf_counter()
+                    fig._repr_html_()
+                    samples.append(time.perf_counter() - started)
+                    finish_cell(shell)
+            finally:
+                dietnb.deactivate(shell)
+                _core._registry.clear()
+                if shell_kind != "fake":
+                    type(shell).clear_instance()
+    finally:
+        plt.close(fig)
+    samples.sort()
+    return {
+        "figures": figures,
+        "median_ms": statistics.median(samples) * 1000.0,
+        "p95_ms": samples[int(len(samples) * 0.95) - 1] * 1000.0,
+        "mean_ms": statistics.fmean(samples) * 1000.0,
+    }
+
+
+def notebook_bytes(outputs) -> int:
+    cells = [
+        {"cell_type": "code", "execution_count": i, "metadata": {}, "source": [], "outputs": [output]}
+        for i, output in enumerate(outputs, start=1)
+    ]
+    notebook = {"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}
+    return len(json.dumps(notebook, indent=1).encode())
+
+
+def notebook_size(figures: int) -> dict:
+    fig = line_figure()
+    results = {"figures": figures}
+    try:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", bbox_inches="tight")
+        inline = {
+            "output_type": "display_data",
+            "metadata": {},
+            "data": {"image/png": base64.b64encode(buffer.getvalue()).decode(), "text/plain": [repr(fig)]},
+        }
+        results["inline_base64"] = notebook_bytes([inline] * figures)
+
+        for output in ("full", "compact"):
+            with temporary_notebook() as notebook:
+                shell = FakeShell(notebook)
+                dietnb.activate(shell, output=output)
+                outputs = []
+                try:
+                    for exec_count in range(1, figures + 1):
+                        next_cell(shell, exec_count)
+                        html = fig._repr_html_()
+                        outputs.append({"output_type": "display_data", "metadata": {}, "data": {"text/html": html}})
+                finally:
+                    dietnb.deactivate(shell)
+                    _core._registry.clear()
+            results[f"dietnb_{output}"] = notebook_bytes(outputs)
+    finally:
+        plt.close(fig)
+    for key in ("inline_base64", "dietnb_full", "dietnb_compact"):
+        results[f"{key}_per_figure"] = results[key] / figures
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    figures = int(argv[argv.index("--figures") + 1]) if "--figures" in argv else 50
+
+    results = {
+        "latency": {
+            f"{shell_kind}/{name}": latency(shell_kind, options, figures)
+            for shell_kind in ("fake", "ipython")
+            for name, options in CONFIGS.items()
+        },
+        "notebook_size": notebook_size(figures),
+    }
+    return report("figure", results, argv)
+
+
+if __name__ == "__main__":
+    main()
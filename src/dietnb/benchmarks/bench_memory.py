@@ -0,0 +1,61 @@
+"""
+Peak memory of a cell that displays many figures in a loop without closing
+them, with and without ``release_figures``.
+
+Each mode runs in a fresh process so both start from the same RSS. Reported
+per mode: the cell's RSS growth from start to peak, the most figures pyplot
+held at once, and the wall time of the cell (from ``memory_report``).
+
+    python benchmarks/bench_memory.py [--figures N] [--json out.json]
+"""
+
+import multiprocessing
+import sys
+import time
+
+from _common import FakeShell, report, temporary_notebook
+
+
+def run_mode(notebook: str, release: bool, figures: int) -> dict:
+    import matplotlib.pyplot as plt
+
+    import dietnb
+
+    plt.rcParams["figure.max_open_warning"] = 0
+    shell = FakeShell(notebook)
+    dietnb.activate(shell, release_figures=release, memory_report=True)
+    try:
+        for count in (2, figures):  # The first cell warms up fonts and caches
+            shell.run_cell()
+            started = time.perf_counter()
+            for index in range(count):
+                fig, ax = plt.subplots(figsize=(6.4, 4.8))
+                ax.plot(range(500), [((i + index) * 37) % 101 for i in range(500)])
+                fig._repr_html_()
+            elapsed = time.perf_counter() - started
+            shell.finish_cell()
+        entry = dietnb.memory_report()[-1]
+        return {
+            "rss_growth_mib": entry["rss_growth_mib"],
+            "open_figures_peak": entry["open_figures_peak"],
+            "cell_seconds": elapsed,
+        }
+    finally:
+        dietnb.deactivate(shell)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    figures = int(argv[argv.index("--figures") + 1]) if "--figures" in argv else 100
+
+    results = {"figures": figures}
+    context = multiprocessing.get_context("spawn")
+    with temporary_notebook() as notebook:
+        for name, release in (("keep", False), ("release", True)):
+            with context.Pool(1) as pool:
+                results[name] = pool.apply(run_mode, (str(notebook), release, figures))
+    return report("memory", results, argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Throughput of parallel runs of one notebook writing to a shared image
+directory, as with ``papermill`` fanning out over parameters.
+
+Each run is a separate process with its own ``namespace`` and re-executes the
+same cells. Reported per number of processes: total figures per second, and
+how many of each run's latest images are missing or unreadable at the end
+(expected to be zero, since writes are atomic and runs only delete their own
+files).
+
+    python benchmarks/bench_parallel.py [--figures N] [--processes 1,2,4] [--json out.json]
+"""
+
+import multiprocessing
+import sys
+import time
+
+from _common import FakeShell, report, temporary_notebook
+
+CELLS = 5
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def run_notebook(notebook: str, namespace: str, figures: int) -> float:
+    import matplotlib.pyplot as plt
+
+    import dietnb
+
+    fig, ax = plt.subplots(figsize=(6.4, 4.8))
+    ax.plot(range(200), [(i * 37) % 101 for i in range(200)])
+    shell = FakeShell(notebook)
+    dietnb.activate(shell, namespace=namespace)
+    try:
+        started = time.perf_counter()
+        for index in range(figures):
+            shell.run_cell(f"cell-{index % CELLS}")
+            fig._repr_html_()
+            shell.finish_cell()
+        return time.perf_counter() - started
+    finally:
+        dietnb.deactivate(shell)
+
+
+def parallel(processes: int, figures: int) -> dict:
+    with temporary_notebook() as notebook:
+        context = multiprocessing.get_context("spawn")
+        namespaces = [f"run{index}" for index in range(processes)]
+        with context.Pool(processes) as pool:
+            started = time.perf_counter()
+            busy = pool.starmap(run_notebook, [(str(notebook), ns, figures) for ns in namespaces])
+            wall = time.perf_counter() - started
+
+        image_dir = notebook.with_name(f"{notebook.stem}_dietnb_imgs")
+        valid = {
+            path.name for path in image_dir.glob("*.png")
+            if path.read_bytes()[:8] == PNG_SIGNATURE
+        }
+        kept = sum(1 for name in valid if name.split("_")[2] in namespaces)
+        return {
+            "figures_per_second": processes * figures / wall,
+            "max_busy_seconds": max(busy),
+            "wall_seconds": wall,
+            "missing_images": processes * CELLS - kept,
+        }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    figures = int(argv[argv.index("--figures") + 1]) if "--figures" in argv else 100
+    counts = [int(n) for n in argv[argv.index("--processes") + 1].split(",")] if "--processes" in argv else [1, 2, 4]
+
+    results = {"figures_per_process": figures, "cpus": multiprocessing.cpu_count()}
+    results["processes"] = {str(n): parallel(n, figures) for n in counts}
+    return report("parallel", results, argv)
+
+
+if __name__ == "__main__":
+    main()
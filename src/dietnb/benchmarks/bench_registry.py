@@ -0,0 +1,96 @@
+"""
+Microbenchmark of ``_FigureRegistry`` for long-running kernels.
+
+Registers one figure for each of N cells, then re-executes every cell, and
+reports per-registration latency and the memory held by the registry, with
+and without a ``max_cells`` cap of 1,000 (the files of each cell are tracked
+by the directory manifest, not the registry). The previous flat-dict registry (scanning every key on each new execution) is
+included as a baseline; it is quadratic, so it only runs up to
+``--legacy-max`` cells.
+
+    python benchmarks/bench_registry.py [--cells 100000] [--legacy-max 5000] [--json out.json]
+"""
+
+import sys
+import time
+import tracemalloc
+from typing import Dict, Tuple
+
+from _common import report
+
+from dietnb import _core
+
+
+class LegacyRegistry:
+    """The registry as it was before the per-directory index."""
+
+    def __init__(self):
+        self._last_exec_per_cell: Dict[Tuple[str, str], int] = {}
+        self._indices: Dict[Tuple[str, str, int], int] = {}
+
+    def register(self, dir_key, cell_key, exec_count):
+        state_key = (dir_key, cell_key)
+        counter_key = (dir_key, cell_key, exec_count)
+        if self._last_exec_per_cell.get(state_key) != exec_count:
+            self._last_exec_per_cell[state_key] = exec_count
+            self._indices[counter_key] = 1
+            stale = [k for k in self._indices if k[0] == dir_key and k[1] == cell_key and k[2] != exec_count]
+            for k in stale:
+                del self._indices[k]
+            return 1, True
+        next_idx = self._indices.get(counter_key, 1) + 1
+        self._indices[counter_key] = next_idx
+        return next_idx, False
+
+    def active_cell_keys(self, dir_key):
+        return {c for (d, c) in self._last_exec_per_cell if d == dir_key}
+
+
+def measure(factory, cells: int) -> dict:
+    dir_key = "/tmp/bench_dietnb_imgs"
+    keys = [f"{i:012x}" for i in range(cells)]
+
+    tracemalloc.start()
+    registry = factory()
+    started = time.perf_counter()
+    for exec_count, key in enumerate(keys, start=1):
+        registry.register(dir_key, key, exec_count)
+    first_pass = time.perf_counter() - started
+    memory, _ = tracemalloc.get_traced_memory()
+
+    started = time.perf_counter()
+    for exec_count, key in enumerate(keys, start=cells + 1):
+        registry.register(dir_key, key, exec_count)
+    rerun_pass = time.perf_counter() - started
+
+    started = time.perf_counter()
+    registry.active_cell_keys(dir_key)
+    listing = time.perf_counter() - started
+    tracemalloc.stop()
+
+    return {
+        "cells": cells,
+        "register_us": first_pass / cells * 1e6,
+        "rerun_register_us": rerun_pass / cells * 1e6,
+        "active_cell_keys_ms": listing * 1000.0,
+        "memory_bytes": memory,
+        "memory_bytes_per_cell": memory / cells,
+    }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    cells = int(argv[argv.index("--cells") + 1]) if "--cells" in argv else 100_000
+    legacy_max = int(argv[argv.index("--legacy-max") + 1]) if "--legacy-max" in argv else 5_000
+
+    sizes = sorted({min(cells, n) for n in (1_000, 5_000, 10_000, cells)})
+    results = {
+        "indexed": [measure(_core._FigureRegistry, n) for n in sizes],
+        "indexed_lru_capped": measure(lambda: _core._FigureRegistry(max_cells=1_000), cells),
+        "legacy": [measure(LegacyRegistry, n) for n in sizes if n <= legacy_max],
+    }
+    return report("registry", results, argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Counts filesystem calls made while resolving paths for a 500-figure cell.
+
+Compares the per-execution resolution context against resolving the notebook
+path and image directory for every figure (the previous behaviour, emulated
+by dropping the context before each figure). Rendering is replaced by a
+constant PNG so only path handling and the registry are measured.
+
+    python benchmarks/bench_resolution.py [--figures N] [--json out.json]
+"""
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from _common import FakeShell, report, temporary_notebook, tiny_png
+
+import matplotlib.pyplot as plt
+
+import dietnb
+from dietnb import _core
+
+
+@contextmanager
+def count_syscalls():
+    """Counts stat/lstat/mkdir calls made through the ``os`` module."""
+    counts = {"stat": 0, "lstat": 0, "mkdir": 0}
+    originals = {name: getattr(os, name) for name in counts}
+
+    def wrap(name):
+        original = originals[name]
+
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return original(*args, **kwargs)
+
+        return counted
+
+    for name in counts:
+        setattr(os, name, wrap(name))
+    try:
+        yield counts
+    finally:
+        for name, original in originals.items():
+            setattr(os, name, original)
+
+
+def run(figures: int, per_figure_resolution: bool) -> dict:
+    data = tiny_png()
+    original_render = _core._render_figure
+    _core._render_figure = lambda fig, fmt, dpi: data
+    fig = plt.figure()
+    try:
+        with temporary_notebook() as notebook:
+            shell = FakeShell(notebook)
+            dietnb.activate(shell)
+            _core._registry.clear()
+            _core._context_cache = None
+            started = time.perf_counter()
+            with count_syscalls() as counts:
+                for _ in range(figures):
+                    if per_figure_resolution:
+                        _core._context_cache = None
+                    fig._repr_html_()
+            elapsed = time.perf_counter() - started
+            shell.finish_cell()
+            dietnb.deactivate(shell)
+    finally:
+        _core._render_figure = original_render
+        plt.close(fig)
+    return {**counts, "total_ms": elapsed * 1000.0, "per_figure_us": elapsed / figures * 1e6}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    figures = int(argv[argv.index("--figures") + 1]) if "--figures" in argv else 500
+    results = {
+        "figures": figures,
+        "per_figure_resolution": run(figures, per_figure_resolution=True),
+        "per_execution_context": run(figures, per_figure_resolution=False),
+    }
+    return report("resolution", results, argv)
+
+
+if __name__ == "__main__":
+    main()
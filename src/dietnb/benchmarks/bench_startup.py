@@ -0,0 +1,91 @@
+"""
+Kernel startup overhead of the IPython startup script installed by
+``dietnb install``.
+
+Each variant runs in a fresh interpreter: an IPython shell alone, the shell
+plus ``import dietnb``, eager ``dietnb.activate()`` (imports matplotlib),
+``dietnb.activate(lazy=True)`` (defers it until the kernel imports
+matplotlib), and the shell plus ``_startup.py``. Medians of wall time and of
+peak RSS over ``--repeat`` runs are reported, along with the overhead
+relative to the bare shell.
+
+    python benchmarks/bench_startup.py [--repeat N] [--json out.json]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from _common import report
+
+import dietnb
+
+STARTUP_SCRIPT = Path(dietnb.__file__).with_name("_startup.py")
+
+SHELL = (
+    "from IPython.terminal.interactiveshell import TerminalInteractiveShell as S\n"
+    "S.instance()\n"
+)
+
+VARIANTS = {
+    "ipython": SHELL,
+    "ipython_import_dietnb": SHELL + "import dietnb\n",
+    "ipython_activate_eager": SHELL + "import dietnb\ndietnb.activate()\n",
+    "ipython_activate_lazy": SHELL + "import dietnb\ndietnb.activate(lazy=True)\n",
+    "ipython_startup_script": SHELL + f"import runpy\nrunpy.run_path({str(STARTUP_SCRIPT)!r})\n",
+}
+
+# Peak resident set size of the interpreter in KiB. ``ru_maxrss`` would keep
+# the high-water mark of the (larger) benchmark process across fork+exec on
+# Linux, so the child reads its own ``VmHWM``; ``ru_maxrss`` (bytes on macOS)
+# is only the fallback where /proc is missing.
+MAX_RSS = """
+import sys
+try:
+    with open("/proc/self/status") as status:
+        peak = next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+except (OSError, StopIteration):
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak //= 1024 if sys.platform == "darwin" else 1
+print(peak)
+"""
+
+
+def run(code: str, repeat: int):
+    """Returns the median wall time (ms) and peak RSS (MiB) of ``code``."""
+    env = dict(os.environ, MPLBACKEND="Agg")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(STARTUP_SCRIPT.parents[1]), env.get("PYTHONPATH")]))
+    samples, rss = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", code + MAX_RSS], env=env, check=True,
+                                   capture_output=True, text=True)
+        samples.append(time.perf_counter() - started)
+        rss.append(int(completed.stdout.split()[-1]) / 1024.0)
+    return statistics.median(samples) * 1000.0, statistics.median(rss)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    repeat = int(argv[argv.index("--repeat") + 1]) if "--repeat" in argv else 5
+
+    run(SHELL, 1)  # Warm the filesystem cache
+    measured = {name: run(code, repeat) for name, code in VARIANTS.items()}
+    medians = {name: ms for name, (ms, _) in measured.items()}
+    rss = {name: mib for name, (_, mib) in measured.items()}
+    results = {"repeat": repeat, "median_ms": medians, "max_rss_mib": rss}
+    results["overhead_ms"] = {
+        name: medians[name] - medians["ipython"] for name in VARIANTS if name != "ipython"
+    }
+    results["overhead_rss_mib"] = {
+        name: rss[name] - rss["ipython"] for name in VARIANTS if name != "ipython"
+    }
+    return report("startup", results, argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Runs the dietnb benchmark suite and writes one JSON document, so results can
+be compared between releases.
+
+    python benchmarks/run.py [--quick] [--only figure,cleanup,...] [--json out.json]
+                             [--compare baseline.json]
+
+``--quick`` shrinks every benchmark for a smoke run. ``--compare`` prints
+each numeric result next to the same entry of an earlier run.
+"""
+
+import contextlib
+import importlib.metadata
+import io
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+
+import _common  # noqa: F401  (sets the Agg backend and the import path)
+
+import matplotlib
+
+import bench_batch
+import bench_cleanup
+import bench_clean
+import bench_figure
+import bench_memory
+import bench_parallel
+import bench_registry
+import bench_resolution
+import bench_startup
+
+SUITE = {
+    "batch": (bench_batch, ["--figures", "64"], ["--figures", "4", "--workers", "1"]),
+    "figure": (bench_figure, ["--figures", "50"], ["--figures", "5"]),
+    "memory": (bench_memory, ["--figures", "100"], ["--figures", "5"]),
+    "registry": (bench_registry, ["--cells", "100000"], ["--cells", "5000", "--legacy-max", "1000"]),
+    "resolution": (bench_resolution, ["--figures", "500"], ["--figures", "50"]),
+    "cleanup": (bench_cleanup, ["--files", "10000"], ["--files", "500"]),
+    "clean_cli": (bench_clean, ["--notebooks", "500"], ["--notebooks", "20"]),
+    "parallel": (bench_parallel, ["--figures", "100"], ["--figures", "5", "--processes", "1,2"]),
+    "startup": (bench_startup, ["--repeat", "5"], ["--repeat", "1"]),
+}
+
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from flatten(item, f"{prefix}{index}.")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix[:-1], value
+
+
+def compare(current: dict, baseline: dict) -> None:
+    previous = dict(flatten(baseline["benchmarks"]))
+    for key, value in flatten(current["benchmarks"]):
+        before = previous.get(key)
+        if before:
+            print(f"{key:70s} {before:14.2f} -> {value:14.2f} ({value / before:6.2f}x)")
+
+
+def dietnb_version() -> str:
+    try:
+        return importlib.metadata.version("dietnb")
+    except importlib.metadata.PackageNotFoundError:
+        return "source checkout"
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    quick = "--quick" in argv
+    only = argv[argv.index("--only") + 1].split(",") if "--only" in argv else list(SUITE)
+    unknown = sorted(set(only) - set(SUITE))
+    if unknown:
+        raise SystemExit(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    payload = {
+        "dietnb": dietnb_version(),
+        "python": platform.python_version(),
+        "matplotlib": matplotlib.__version__,
+        "platform": platform.platform(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "quick": quick,
+        "benchmarks": {},
+    }
+    for name in only:
+        module, full_args, quick_args = SUITE[name]
+        print(f"[dietnb] benchmark {name}...", file=sys.stderr)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = module.main(quick_args if quick else full_args)
+        payload["benchmarks"][name] = result["results"]
+        payload["benchmarks"][name]["wall_seconds"] = time.perf_counter() - started
+
+    text = json.dumps(payload, indent=2, sort_keys=True)
+    if "--json" in argv:
+        Path(argv[argv.index("--json") + 1]).write_text(text + "\n")
+    else:
+        print(text)
+    if "--compare" in argv:
+        compare(payload, json.loads(Path(argv[argv.index("--compare") + 1]).read_text()))
+    return payload
+
+
+if __name__ == "__main__":
+    main()
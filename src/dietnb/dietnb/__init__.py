@@ -1,18 +1,125 @@
+import sys
+from contextlib import contextmanager
 from pathlib import Path
-from IPython import get_ipython
 from typing import Optional
 
-# Import core logic and expose public functions
-from . import _core
+# Import core logic and expose public functions. ``_core`` imports matplotlib,
+# so it is only loaded when first needed (see ``activate(lazy=True)``).
+from . import _config, _display, _lazy, _manifest, _stats
 
 # Keep track of registered events to allow unloading
 _post_run_cell_handler = None
 
-def activate(ipython_instance=None):
+
+def get_ipython():
+    # Imported on use so ``dietnb clean`` / ``dietnb convert`` do not load IPython
+    from IPython import get_ipython
+
+    return get_ipython()
+
+
+def activate(ipython_instance=None, lazy: bool = False, **options):
     """Activates dietnb: Patches matplotlib Figure representation in IPython.
 
     Args:
         ipython_instance: Optional IPython shell instance. Auto-detected if None.
+        lazy: Defer patching until the user's code imports matplotlib, so
+            kernels that never plot do not pay for importing it. Options are
+            validated immediately, and ``externalize_min_bytes`` /
+            ``sidecar_min_bytes`` apply from the start; matplotlib is then
+            imported once an output is large enough to be moved. Used by the
+            startup script of ``dietnb install``. Defaults to False.
+        **options: Optional behaviour switches. Every call starts from the
+            defaults, so options not given here are reset.
+            async_writes (bool): Return the ``<img>`` HTML immediately and
+                encode and write the file on a background pool; the figure is
+                still drawn when it is displayed. Outstanding writes are
+                awaited at the end of each cell. Defaults to False.
+            max_workers (int): Background writer threads. Defaults to 2.
+            max_pending (int): Queued writes before displaying a figure blocks.
+                Defaults to 16.
+            storage (str): "cell" names files after the cell execution;
+                "content" names them by a hash of the rendered image so
+                identical figures share one file. Defaults to "cell".
+            render_cache (bool): Skip rasterization when a figure is unchanged
+                since the previous execution of the same cell, reusing the
+                earlier image bytes. Defaults to False.
+            render_cache_size (int): Maximum figures kept by the render cache.
+                Defaults to 256.
+            render_cache_bytes (int): Maximum image bytes kept by the render
+                cache. Defaults to 64 MiB.
+            max_tracked_cells (int): Forget the least recently executed cells
+                beyond this many; ``clean_unused()`` then only keeps their
+                latest images. Defaults to None (no cap).
+            format (str): Image format: "png", "svg", "jpeg", "webp", or
+                "auto" to write SVG for sparse figures and a raster format for
+                dense scatter plots, meshes and images. Defaults to "png".
+            dpi (int): Resolution of raster images. Defaults to 150.
+            auto_max_vector_elements (int): With ``format="auto"``, figures
+                with more points/paths/mesh cells than this are rasterized.
+                Defaults to 5000.
+            auto_raster_format (str): Raster format chosen by "auto".
+                Defaults to "png".
+            encoder (str): "fast" renders PNGs once on Agg and encodes the
+                RGBA buffer with a low deflate level, trading file size for
+                latency; "default" uses ``savefig``. Defaults to "default".
+            fast_compress_level (int): zlib level of the fast encoder (0-9).
+                Defaults to 1.
+            max_image_bytes (int): Byte budget per figure. Oversized figures
+                are re-rendered at a lower dpi, then as WebP/JPEG, until they
+                fit; the figure is rendered before returning even with
+                ``async_writes``. Defaults to None (no budget).
+            max_image_pixels (int): Pixel budget per figure, met by lowering
+                dpi before rendering. Defaults to None (no budget).
+            min_dpi (int): Lowest dpi the budgets may use. Defaults to 50.
+            optimize (bool): Recompress PNG files on a background thread
+                after they are written (lossless palette PNG or maximum
+                deflate) and swap them in atomically. Defaults to False.
+            optimize_tolerance (float): Mean per-channel error (0-255) allowed
+                when quantizing images with more than 256 colors. Defaults to
+                0 (lossless only).
+            output (str): ``"full"`` embeds the copy-button styles and
+                script in every figure's output; ``"compact"`` emits them once
+                per session (and again if the cell carrying them is re-run)
+                and gives each figure a minimal wrapper. Defaults to "full".
+            externalize_min_bytes (int): PNG and JPEG outputs of other
+                objects (PIL images, ``IPython.display.Image``, ...) at least
+                this large are saved to the image directory like figures
+                (e.g. 4096). Defaults to None (kept embedded).
+            sidecar_min_bytes (int): HTML (e.g. DataFrames), JSON and text
+                outputs at least this large are written to sidecar files in
+                the image directory and shown as a preview with a link. They
+                are cleaned up on rerun like images. Defaults to None (off).
+            sidecar_preview_chars (int): Length of that preview. Defaults
+                to 2000.
+            thumbnail_width (int): Show raster images wider than this many
+                CSS pixels through lazily loaded 1x/2x thumbnails written in
+                the background, with explicit width and height; copy and
+                download still use the full image. Defaults to None (off).
+            render_workers (int): Rasterize the figures of every cell on this
+                many worker processes, as inside ``dietnb.batch()``. Defaults
+                to 0 (render in the kernel).
+            release_figures (bool): Close each figure from pyplot and free
+                its Agg renderer buffer right after it is saved, so loops
+                that display many figures do not keep them all alive until
+                the cell ends. Further ``plt.*`` calls then draw on a new
+                figure. Defaults to False.
+            memory_report (bool): Record per-cell RSS and open-figure counts,
+                returned by ``dietnb.memory_report()``. Defaults to False.
+            stats_log (str): Path of a JSON-lines file to which every saved
+                figure (with per-stage timings in ms), failure and cleanup is
+                appended. Defaults to None (no log).
+            persistent_manifest (bool): Record every image (cell, execution,
+                size, hash, time) in ``.dietnb-manifest.sqlite`` inside the
+                image directory, so cleanup stays correct across kernel
+                restarts and concurrent kernels. Defaults to False.
+            namespace (str): Tag inserted into cell file names so parallel
+                runs of one notebook (papermill, several kernels) sharing an
+                image directory never write the same file; "kernel" uses an
+                id unique to this kernel. Rerun cleanup is scoped to the
+                namespace: images written under another namespace, or under
+                none, stay until ``clean_unused``. Defaults to None, which
+                reads the ``DIETNB_NAMESPACE`` environment variable.
     """
     global _post_run_cell_handler
 
@@ -22,8 +129,19 @@ def activate(ipython_instance=None):
         # Consider if a print warning is desired here if logging is removed
         return
 
-    # Apply the core patches, passing the ipython instance
-    _core._patch_figure_reprs(ip)
+    opts = _config.configure(**options)
+    if opts.memory_report:
+        from . import _memory
+
+        _memory.reset()
+    _stats.open_log(opts.stats_log)
+    _lazy.uninstall()
+    # The display-formatter hook does not need matplotlib
+    _display.update(ip)
+    if lazy and not _lazy.matplotlib_loaded():
+        _lazy.install(lambda: _patch(ip))
+    else:
+        _patch(ip)
 
     if _post_run_cell_handler:
         try:
@@ -32,11 +150,22 @@ def activate(ipython_instance=None):
             pass 
 
     def handler(_):
+        if _lazy.pending():
+            return  # matplotlib not imported yet: no figures to clean up
+        from . import _core
         _core._post_cell_cleanup_and_repatch(ip) 
 
     _post_run_cell_handler = handler
     ip.events.register('post_run_cell', _post_run_cell_handler)
 
+def _patch(ip):
+    from . import _core
+
+    _core._registry.set_max_cells(_config.options.max_tracked_cells)
+    _core._reset_assets()
+    # Apply the core patches, passing the ipython instance
+    _core._patch_figure_reprs(ip)
+
 def deactivate(ipython_instance=None):
     """Deactivates dietnb: Restores original matplotlib Figure representation (best effort)."""
     global _post_run_cell_handler
@@ -45,7 +174,16 @@ def deactivate(ipython_instance=None):
     if not ip:
         return
 
-    _core._restore_figure_reprs(ip)
+    _stats.open_log(None)
+    _display.remove(ip)
+    # Nothing was patched if activation is still waiting for matplotlib
+    if _lazy.uninstall() is None and f"{__name__}._core" in sys.modules:
+        from . import _core
+
+        _core._flush_background_writes()
+        _core._report_write_failures(_core._batch.shutdown())
+        _core._shutdown_optimizer()
+        _core._restore_figure_reprs(ip)
 
     if _post_run_cell_handler:
         try:
@@ -54,10 +192,119 @@ def deactivate(ipython_instance=None):
         except ValueError:
             pass # Consider print warning
 
-def clean_unused() -> dict:
+def clean_unused(mode: str = "session", dry_run: bool = False) -> dict:
     """Cleans up image files not associated with the current kernel state
     based on auto-detected notebook path or default folder.
+
+    Args:
+        mode: "session" keeps the current images of cells executed in this
+            session and the latest images of other cells (e.g. from before a
+            kernel restart). "notebook" keeps only the images referenced by
+            the saved notebook file, plus those of cells run in this session.
+        dry_run: Report what would be deleted without deleting anything.
+    """
+    from . import _core
+
+    return _core._clean_unused_images_logic(mode, dry_run)
+
+def sidecar_output(min_bytes: Optional[int] = None):
+    """Context manager that captures stdout and stderr of its block, e.g. a
+    long training log. Output of at least ``min_bytes`` (default: the
+    ``sidecar_min_bytes`` option, or any size if that is unset) goes to a
+    sidecar file shown as a preview with a link; shorter output is printed.
+
+    Example::
+
+        with dietnb.sidecar_output():
+            model.fit(x, y, verbose=2)
+    """
+    from . import _core
+
+    return _core._sidecar_output(min_bytes)
+
+@contextmanager
+def batch(workers: Optional[int] = None):
+    """Context manager that rasterizes the figures displayed in its block in
+    parallel on ``workers`` processes (default: one per CPU).
+
+    Each figure is pickled when displayed, so it may be changed or reused
+    afterwards, and its output appears in order right away; the block waits
+    on exit until every file is written. Figures that cannot be pickled are
+    rendered in the kernel, as are all figures with ``storage="content"`` or
+    ``max_image_bytes``, whose file names depend on the rendered bytes. Set
+    the ``render_workers`` option to do this for every cell.
+
+    Example::
+
+        with dietnb.batch():
+            for name, group in df.groupby("site"):
+                group.plot(title=name)
+                plt.show()
+    """
+    from . import _batch
+
+    _batch.enter(workers)
+    try:
+        yield
+    finally:
+        _batch.leave()
+        _core = sys.modules.get(f"{__name__}._core")
+        if _core is not None:
+            _core._flush_batch()
+
+
+def memory_report() -> list:
+    """Returns the per-cell memory report of the ``memory_report`` option,
+    oldest cell first.
+
+    Each entry has the cell key, execution count, figures saved, the most
+    figures pyplot held at once, and the kernel's resident set size at the
+    start of the cell, at its peak (sampled after every figure) and at the
+    end, in MiB. Compare cells run with and without ``release_figures``.
+    """
+    from . import _memory
+
+    return _memory.report()
+
+
+def disk_usage() -> dict:
+    """Reports files and bytes in the current image directory, including
+    how much is no longer referenced by any cell."""
+    from . import _core
+
+    ip = get_ipython()
+    if not ip:
+        return {}
+    context = _core._get_resolution_context(ip)
+    manifest = _manifest.get_manifest(context.dir_key, _config.options.persistent_manifest)
+    return manifest.usage()
+
+def stats(reset: bool = False) -> dict:
+    """Returns dietnb counters, timings (in ms) and gauges.
+
+    Each saved figure is timed per stage (``stage_resolve``, ``stage_registry``,
+    ``stage_cleanup``, ``stage_save``, ``stage_template``) and in total
+    (``figure_latency``). Counters include ``figures_saved``,
+    ``bytes_written``, ``files_deleted``, ``figure_failures`` (figures that
+    fell back to the default display) and cache hits.
+
+    Args:
+        reset: Clear all metrics after taking the snapshot.
     """
-    return _core._clean_unused_images_logic()
+    _core = sys.modules.get(f"{__name__}._core")  # Nothing to gauge before it is loaded
+    if _core is not None:
+        for pool in (_core._writer, _core._optimizer):
+            if pool is not None:
+                _stats.set_gauge(pool.gauge, pool.pending)
+        _stats.set_gauge("batch_queue_depth", _core._batch.pending())
+        if _core._render_cache is not None:
+            _stats.set_gauge("render_cache_entries", len(_core._render_cache))
+            _stats.set_gauge("render_cache_bytes", _core._render_cache.nbytes)
+    snapshot = _stats.snapshot()
+    if reset:
+        _stats.reset()
+    return snapshot
 
-__all__ = ['activate', 'deactivate', 'clean_unused'] 
\ No newline at end of file
+__all__ = [
+    'activate', 'deactivate', 'batch', 'clean_unused', 'disk_usage', 'memory_report', 'sidecar_output', 'stats',
+]
@@ -0,0 +1,161 @@
+"""
+Parallel rasterization of displayed figures on worker processes
+(``dietnb.batch()`` and the ``render_workers`` option).
+
+Rendering holds the GIL, so threads cannot spread it over cores. Instead
+each figure is pickled when it is displayed, which also snapshots it if the
+cell goes on to change or reuse it, and rendered by a pool of spawned
+processes using the Agg backend. The cell gets its ``<img>`` output right
+away, since cell-storage file names do not depend on the rendered bytes, so
+outputs keep their order; the bytes come back to the kernel and are written
+as each figure finishes. Leaving the batch (or, with ``render_workers``, the
+end of the cell) waits for all of them.
+
+Worker processes are kept between batches and only replaced when the number
+of workers changes.
+"""
+
+import io
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from . import _config, _stats
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_lock = threading.Lock()
+# Workers requested by the innermost open ``dietnb.batch()`` block
+_scopes: List[int] = []
+# (label, completion) of every figure submitted since the last flush
+_pending: List[Tuple[str, Future]] = []
+_slots: Optional[threading.BoundedSemaphore] = None
+
+
+def _init_worker() -> None:
+    os.environ["MPLBACKEND"] = "Agg"
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def render(payload: bytes, fmt: str, dpi: int, encoder: str, compress_level: int) -> bytes:
+    """Worker side: unpickles one figure and returns its encoded bytes."""
+    from . import _formats
+
+    fig = pickle.loads(payload)
+    try:
+        if encoder == "fast" and fmt == "png":
+            return _formats.render_png_fast(fig, dpi, compress_level)[0]
+        buffer = io.BytesIO()
+        _formats.save_figure(fig, buffer, fmt, dpi)
+        return buffer.getvalue()
+    finally:
+        if fig.canvas.manager is not None:
+            # Figures pickled from pyplot are restored into the worker's pyplot
+            import matplotlib.pyplot as plt
+
+            plt.close(fig)
+
+
+def enter(workers: Optional[int]) -> None:
+    _scopes.append(workers or os.cpu_count() or 1)
+
+
+def leave() -> None:
+    _scopes.pop()
+
+
+def workers() -> int:
+    """Worker processes to render the current figure with, 0 for in-process rendering."""
+    return _scopes[-1] if _scopes else _config.options.render_workers
+
+
+def _get_pool(count: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers, _slots
+    with _lock:
+        if _pool is not None and _pool_workers != count:
+            _pool.shutdown(wait=True)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=count, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            _pool_workers = count
+            # Bounds the pickled figures waiting for a worker
+            _slots = threading.BoundedSemaphore(max(2 * count, _config.options.max_pending))
+        return _pool
+
+
+def submit(fig, fmt: str, dpi: int, label: str, on_done: Callable[[bytes], None]) -> bool:
+    """Queues ``fig`` for rendering and calls ``on_done`` with its bytes.
+
+    Returns False if the figure cannot be pickled; the caller then renders it
+    in-process.
+    """
+    count = workers()
+    try:
+        with _stats.timer("batch_pickle"):
+            payload = pickle.dumps(fig, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        _stats.incr("batch_unpicklable")
+        return False
+    opts = _config.options
+    pool = _get_pool(count)
+    slots = _slots
+    slots.acquire()
+    completion: Future = Future()
+
+    def finished(future: Future) -> None:
+        try:
+            on_done(future.result())
+        except BaseException as error:
+            completion.set_exception(error)
+        else:
+            completion.set_result(None)
+        finally:
+            slots.release()
+
+    try:
+        future = pool.submit(render, payload, fmt, dpi, opts.encoder, opts.fast_compress_level)
+    except BaseException:
+        slots.release()
+        raise
+    with _lock:
+        _pending.append((label, completion))
+    future.add_done_callback(finished)
+    _stats.incr("figures_batched")
+    return True
+
+
+def pending() -> int:
+    with _lock:
+        return sum(1 for _, completion in _pending if not completion.done())
+
+
+def flush() -> List[Tuple[str, BaseException]]:
+    """Waits for every submitted figure and returns ``(label, error)`` for failures."""
+    with _lock:
+        pending_, _pending[:] = list(_pending), []
+    failures = []
+    with _stats.timer("batch_wait"):
+        for label, completion in pending_:
+            error = completion.exception()
+            if error is not None:
+                failures.append((label, error))
+    return failures
+
+
+def shutdown() -> List[Tuple[str, BaseException]]:
+    """Waits for submitted figures and stops the worker processes."""
+    global _pool
+    failures = flush()
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+    return failures
@@ -0,0 +1,287 @@
+"""
+Render cache that lets unchanged figures skip rasterization on rerun.
+
+A figure is fingerprinted by walking its artist tree and hashing the state of
+every artist (data arrays, text, styles, limits, formatter functions) together
+with rcParams, dpi and output format. The walk is conservative: anything that
+cannot be hashed deterministically (functions defined outside matplotlib and
+numpy, whose globals are not tracked, unknown C objects, state nested past
+``_MAX_DEPTH``) makes the figure uncacheable, so it is a cache miss and never
+a stale hit.
+"""
+
+import datetime
+import functools
+import hashlib
+import itertools
+import threading
+import types
+import weakref
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import matplotlib
+import numpy as np
+from matplotlib.artist import Artist
+from matplotlib.cbook import CallbackRegistry
+
+from . import _stats
+
+# Attributes that refer back up the artist tree, hold GUI/pyplot bookkeeping,
+# or change between otherwise identical figures.
+_SKIPPED_ATTRS = frozenset({
+    "figure", "axes", "_axes", "_parent_figure", "_root_figure", "_parent",
+    "canvas", "_canvas", "stale_callback", "_remove_method", "_parents",
+    "callbacks", "_callbacks", "callbacksSM", "_canvas_callbacks",
+    "_button_pick_id", "_scroll_pick_id", "_mouse_key_ids", "_mouseover_set",
+    "_stale", "stale", "number", "_number", "_cachedRenderer", "_renderer",
+    # Contour sets keep their computed paths; the generator is only used to
+    # compute more levels
+    "_contour_generator",
+})
+# Transform trees of ordinary figures nest about 20 levels deep
+_MAX_DEPTH = 32
+# Code from these packages is pinned by the matplotlib (and numpy) version,
+# so its functions and classes are identified by name.
+_LIBRARY_PACKAGES = frozenset({
+    "matplotlib", "mpl_toolkits", "cycler", "numpy", "builtins", "weakref", "functools",
+})
+# Values whose repr is their whole state
+_REPR_TYPES = (
+    bool, int, float, complex, str, range, slice, itertools.count,
+    datetime.date, datetime.time, datetime.timedelta, datetime.tzinfo,
+)
+
+
+class _Uncacheable(Exception):
+    """Raised when part of a figure cannot be fingerprinted."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+        self.path: list = []
+
+    def __str__(self) -> str:
+        return f"{self.reason} at {'.'.join(self.path) or '<figure>'}"
+
+
+class _Walk:
+    """State of one fingerprint: digests of the objects hashed so far, so
+    state shared between artists (transforms, fonts) is walked once."""
+
+    def __init__(self):
+        self.digests: dict = {}
+        self.active: set = set()
+
+
+def _library_name(value) -> Optional[str]:
+    module = getattr(value, "__module__", None) or ""
+    if module.partition(".")[0] not in _LIBRARY_PACKAGES:
+        return None
+    return f"{module}.{getattr(value, '__qualname__', type(value).__qualname__)}"
+
+
+def _feed_array(h, array: np.ndarray) -> None:
+    h.update(f"nd:{array.dtype.str}:{array.shape}".encode())
+    if array.dtype.hasobject:
+        for item in array.ravel():
+            h.update(repr(item).encode())
+        return
+    if array.size:
+        h.update(np.ascontiguousarray(array).data)
+    mask = np.ma.getmask(array)
+    if mask is not np.ma.nomask and mask.size:
+        h.update(np.ascontiguousarray(mask).data)
+
+
+def _digest_of(value, depth: int, walk: _Walk) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    _feed(h, value, depth, walk)
+    return h.digest()
+
+
+def _feed(h, value, depth: int, walk: _Walk) -> None:
+    if value is None or isinstance(value, _REPR_TYPES):
+        h.update(f"{type(value).__name__}:{value!r};".encode())
+        return
+    if isinstance(value, (bytes, bytearray)):
+        h.update(bytes(value))
+        return
+    if isinstance(value, np.ndarray):
+        _feed_array(h, value)
+        return
+    if isinstance(value, np.generic):
+        h.update(f"np:{value!r};".encode())
+        return
+    if isinstance(value, Artist):
+        # Children are visited by the artist tree walk itself.
+        h.update(f"artist:{type(value).__qualname__};".encode())
+        return
+    if isinstance(value, CallbackRegistry):
+        # Event bookkeeping (e.g. ``Figure._axobservers``), not drawn state
+        return
+    if depth <= 0:
+        raise _Uncacheable(f"nested deeper than {_MAX_DEPTH}")
+    key = id(value)
+    known = walk.digests.get(key)
+    if known is not None:
+        h.update(known[1])
+        return
+    if key in walk.active:
+        h.update(b"cycle;")
+        return
+    walk.active.add(key)
+    try:
+        digest = _digest_object(value, depth, walk)
+    finally:
+        walk.active.discard(key)
+    # Keeps ``value`` alive so its id is not reused during the walk
+    walk.digests[key] = (value, digest)
+    h.update(digest)
+
+
+def _digest_object(value, depth: int, walk: _Walk) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(value, (list, tuple)):
+        h.update(f"seq:{len(value)}[".encode())
+        for item in value:
+            _feed(h, item, depth - 1, walk)
+        h.update(b"]")
+    elif isinstance(value, (set, frozenset)):
+        for item_digest in sorted(_digest_of(item, depth - 1, walk) for item in value):
+            h.update(item_digest)
+    elif isinstance(value, dict):
+        keys = [k for k in value if k not in _SKIPPED_ATTRS]
+        h.update(f"dict:{len(keys)}".encode())
+        try:
+            if all(type(k) is str for k in keys):
+                # Attribute dicts; cheaper than sorting item digests
+                for k in sorted(keys):
+                    h.update(f"{k}=".encode())
+                    _feed(h, value[k], depth - 1, walk)
+            else:
+                items = []
+                for k in keys:
+                    items.append(_digest_of(k, depth - 1, walk) + _digest_of(value[k], depth - 1, walk))
+                for item_digest in sorted(items):
+                    h.update(item_digest)
+        except _Uncacheable as error:
+            error.path.insert(0, str(k))
+            raise
+    elif isinstance(value, functools.partial):
+        h.update(b"partial;")
+        _feed(h, (value.func, value.args, value.keywords), depth - 1, walk)
+    elif isinstance(value, types.BuiltinMethodType) and not isinstance(value.__self__, (types.ModuleType, type(None))):
+        # Methods of builtin objects, e.g. "{:.1f}".format
+        h.update(f"builtin:{value.__qualname__};".encode())
+        _feed(h, value.__self__, depth - 1, walk)
+    elif isinstance(value, types.MethodType):
+        _feed(h, value.__func__, depth - 1, walk)
+        _feed(h, value.__self__, depth - 1, walk)
+    elif isinstance(value, weakref.ref):
+        _feed(h, value(), depth - 1, walk)
+    elif isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType, np.ufunc)):
+        # A user function (e.g. a FuncFormatter callback) may read globals
+        # that change between runs, so only library code is identified by name.
+        name = _library_name(value)
+        if name is None:
+            raise _Uncacheable(f"function {value.__qualname__}")
+        h.update(f"code:{name};".encode())
+        for cell in getattr(value, "__closure__", None) or ():
+            try:
+                _feed(h, cell.cell_contents, depth - 1, walk)
+            except ValueError:  # empty cell
+                pass
+    elif callable(value) and _library_name(type(value)) is None:
+        raise _Uncacheable(f"callable {type(value).__qualname__}")
+    elif hasattr(value, "__dict__"):
+        h.update(f"obj:{type(value).__qualname__}".encode())
+        _feed(h, vars(value), depth - 1, walk)
+    else:
+        raise _Uncacheable(f"opaque {type(value).__qualname__}")
+    return h.digest()
+
+
+def figure_fingerprint(fig, fmt: str, dpi, extra: str = "") -> Optional[str]:
+    """Returns a hex fingerprint of everything that affects the rendered figure,
+    or None if the figure cannot be fingerprinted (see ``_Uncacheable``).
+
+    ``extra`` covers further render settings, such as size budgets.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{matplotlib.__version__}|{fmt}|{dpi}|{extra}".encode())
+    try:
+        walk = _Walk()
+        _feed(h, dict(dict.items(matplotlib.rcParams)), _MAX_DEPTH, walk)
+        for artist in fig.findobj(include_self=True):
+            h.update(f"<{type(artist).__qualname__}>".encode())
+            _feed(h, vars(artist), _MAX_DEPTH, walk)
+    except _Uncacheable as reason:
+        _stats.incr("render_cache_uncacheable")
+        _stats.log_event("render_cache_uncacheable", reason=str(reason))
+        return None
+    except Exception:
+        return None
+    return h.hexdigest()
+
+
+class _RenderCache:
+    """Size-bounded LRU of rendered image bytes.
+
+    Entries are keyed by a figure slot (directory, cell key, figure index) and
+    only returned when the stored fingerprint matches the current figure.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def get(self, slot: Hashable, fingerprint: Optional[str]) -> Optional[bytes]:
+        """Returns cached bytes when ``slot`` was last rendered with ``fingerprint``."""
+        entry = self.lookup(slot, fingerprint)
+        return entry[0] if entry is not None else None
+
+    def lookup(self, slot: Hashable, fingerprint: Optional[str]) -> Optional[tuple]:
+        """Like ``get`` but returns ``(data, info)`` as stored by ``put``."""
+        with self._lock:
+            entry = self._entries.get(slot) if fingerprint else None
+            if entry is not None and entry[0] == fingerprint:
+                self._entries.move_to_end(slot)
+                _stats.incr("render_cache_hits")
+                return entry[1], entry[2]
+        _stats.incr("render_cache_misses")
+        return None
+
+    def put(self, slot: Hashable, fingerprint: Optional[str], data: bytes, info=None) -> None:
+        """Stores rendered bytes (and optional ``info`` about them), evicting
+        least recently used entries."""
+        if not fingerprint or len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(slot, None)
+            if previous is not None:
+                self._bytes -= len(previous[1])
+            self._entries[slot] = (fingerprint, data, info)
+            self._bytes += len(data)
+            evicted = 0
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, old_data, _) = self._entries.popitem(last=False)
+                self._bytes -= len(old_data)
+                evicted += 1
+        if evicted:
+            _stats.incr("render_cache_evictions", evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
@@ -0,0 +1,151 @@
+"""
+Offline cleanup of dietnb image directories, used by ``dietnb clean``.
+
+Each ``X.ipynb`` is paired with its ``X_dietnb_imgs`` folder and every image
+that the saved notebook no longer references is removed. Image folders whose
+notebook was deleted or renamed are reported as orphans. Directories are
+processed in parallel on a process pool since scanning large notebooks is
+CPU bound.
+"""
+
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from . import _manifest, _nbscan
+from ._paths import DEFAULT_FOLDER_NAME
+
+IMAGE_DIR_SUFFIX = f"_{DEFAULT_FOLDER_NAME}"
+
+
+def _is_image_dir_name(name: str) -> bool:
+    return name.endswith(IMAGE_DIR_SUFFIX) and len(name) > len(IMAGE_DIR_SUFFIX)
+
+
+def find_image_dirs(paths: Iterable[Path]) -> List[Tuple[Optional[Path], Path]]:
+    """Returns ``(notebook, image_dir)`` pairs below ``paths``.
+
+    ``paths`` may be directories (walked recursively, skipping hidden ones)
+    or notebook files. ``notebook`` is None for orphaned image folders.
+    """
+    pairs = {}
+    for path in paths:
+        path = Path(path)
+        if path.is_file():
+            if path.suffix == ".ipynb":
+                image_dir = path.with_name(path.stem + IMAGE_DIR_SUFFIX)
+                if image_dir.is_dir():
+                    pairs[image_dir] = path
+            continue
+        for root, dirnames, filenames in os.walk(path):
+            root_path = Path(root)
+            notebooks = {name[: -len(".ipynb")] for name in filenames if name.endswith(".ipynb")}
+            kept_dirs = []
+            for name in dirnames:
+                if _is_image_dir_name(name):
+                    stem = name[: -len(IMAGE_DIR_SUFFIX)]
+                    notebook = root_path / f"{stem}.ipynb" if stem in notebooks else None
+                    pairs[root_path / name] = notebook
+                elif not name.startswith("."):
+                    kept_dirs.append(name)
+            dirnames[:] = kept_dirs
+    return sorted(((notebook, image_dir) for image_dir, notebook in pairs.items()), key=lambda p: str(p[1]))
+
+
+def _is_managed(name: str) -> bool:
+    return _manifest.parse_image_name(name) is not None or _manifest.is_content_name(name)
+
+
+def clean_image_dir(notebook: Optional[Path], image_dir: Path, dry_run: bool = False,
+                    remove_orphans: bool = False) -> dict:
+    """Cleans one image folder against its notebook and returns a report."""
+    report = {
+        "notebook": str(notebook) if notebook else None,
+        "image_dir": str(image_dir),
+        "orphan": notebook is None,
+        "deleted": [],
+        "failed": [],
+        "kept": 0,
+        "bytes": 0,
+        "removed_dir": False,
+        "error": None,
+    }
+    try:
+        with os.scandir(image_dir) as it:
+            entries = [entry for entry in it if entry.is_file()]
+    except OSError as exc:
+        report["error"] = repr(exc)
+        return report
+
+    if notebook is None:
+        referenced = set()
+        if not remove_orphans:
+            report["kept"] = len(entries)
+            return report
+    else:
+        try:
+            referenced = _nbscan.referenced_image_names(notebook)
+        except (OSError, ValueError) as exc:
+            report["error"] = repr(exc)
+            return report
+
+    for entry in sorted(entries, key=lambda e: e.name):
+        name = entry.name
+        if name.startswith(_manifest.MANIFEST_FILENAME):
+            continue
+        if not _is_managed(name) or not name.endswith(_manifest.OUTPUT_SUFFIXES) or name in referenced:
+            report["kept"] += 1
+            continue
+        try:
+            size = entry.stat().st_size
+            if not dry_run:
+                os.unlink(entry.path)
+        except OSError:
+            report["failed"].append(entry.path)
+            continue
+        report["deleted"].append(entry.path)
+        report["bytes"] += size
+
+    if notebook is None and report["kept"] == 0 and not report["failed"]:
+        # Only dietnb's own files were in it
+        if not dry_run:
+            try:
+                shutil.rmtree(image_dir)
+            except OSError as exc:
+                report["error"] = repr(exc)
+                return report
+        report["removed_dir"] = True
+    return report
+
+
+def _clean_pair(args) -> dict:
+    return clean_image_dir(*args)
+
+
+def clean_tree(paths: Iterable[Path], dry_run: bool = False, jobs: Optional[int] = None,
+               remove_orphans: bool = False) -> dict:
+    """Cleans every image folder below ``paths`` and returns a summary."""
+    pairs = find_image_dirs(paths)
+    tasks = [(notebook, image_dir, dry_run, remove_orphans) for notebook, image_dir in pairs]
+    jobs = jobs or os.cpu_count() or 1
+
+    if jobs == 1 or len(tasks) <= 1:
+        reports = [_clean_pair(task) for task in tasks]
+    else:
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+            reports = list(executor.map(_clean_pair, tasks, chunksize=chunksize))
+
+    return {
+        "dry_run": dry_run,
+        "image_dirs": len(reports),
+        "notebooks": sum(1 for r in reports if not r["orphan"]),
+        "orphans": [r["image_dir"] for r in reports if r["orphan"]],
+        "deleted": sum(len(r["deleted"]) for r in reports),
+        "failed": sum(len(r["failed"]) for r in reports),
+        "bytes": sum(r["bytes"] for r in reports),
+        "errors": [{"image_dir": r["image_dir"], "error": r["error"]} for r in reports if r["error"]],
+        "dirs": reports,
+    }
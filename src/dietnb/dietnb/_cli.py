@@ -1,4 +1,5 @@
 import argparse
+import json
 import shutil
 import sys
 from pathlib import Path
@@ -97,22 +98,169 @@ def uninstall_startup_script():
         print(f"Error uninstalling dietnb startup script: {e}", file=sys.stderr)
         return False
 
-def main():
+def clean_command(args) -> bool:
+    """Removes images that saved notebooks no longer reference."""
+    from ._clean import clean_tree
+
+    summary = clean_tree(
+        [Path(p) for p in args.paths],
+        dry_run=args.dry_run,
+        jobs=args.jobs,
+        remove_orphans=args.remove_orphans,
+    )
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        verb = "Would delete" if args.dry_run else "Deleted"
+        for report in summary["dirs"]:
+            if report["error"]:
+                print(f"{report['image_dir']}: error: {report['error']}", file=sys.stderr)
+            elif report["orphan"] and not args.remove_orphans:
+                print(f"{report['image_dir']}: orphaned (no matching notebook; use --remove-orphans)")
+            elif report["deleted"] or report["failed"]:
+                removed = ", folder removed" if report["removed_dir"] else ""
+                print(f"{report['image_dir']}: {verb.lower()} {len(report['deleted'])} file(s){removed}")
+        print(
+            f"{verb} {summary['deleted']} file(s), {summary['bytes'] / (1024 * 1024):.1f} MiB "
+            f"in {summary['image_dirs']} image folder(s); {len(summary['orphans'])} orphaned."
+        )
+    return not summary["failed"] and not summary["errors"]
+
+def convert_command(args) -> bool:
+    """Moves images embedded in notebooks into their image folders."""
+    from ._convert import convert_tree
+
+    summary = convert_tree(
+        [Path(p) for p in args.paths],
+        dry_run=args.dry_run,
+        jobs=args.jobs,
+        min_bytes=args.min_bytes,
+        compact=args.compact,
+    )
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        verb = "Would move" if args.dry_run else "Moved"
+        for report in summary["reports"]:
+            if report["error"]:
+                print(f"{report['notebook']}: error: {report['error']}", file=sys.stderr)
+            elif report["images"]:
+                print(
+                    f"{report['notebook']}: {verb.lower()} {report['images']} image(s), "
+                    f"{report['bytes_before'] / (1024 * 1024):.1f} -> {report['bytes_after'] / (1024 * 1024):.1f} MiB"
+                )
+        print(
+            f"{verb} {summary['images']} image(s) out of {summary['converted']} of "
+            f"{summary['notebooks']} notebook(s); {summary['bytes_reclaimed'] / (1024 * 1024):.1f} MiB reclaimed."
+        )
+    return not summary["errors"]
+
+def _export_target(notebook: Path, output: Optional[str], suffix: str) -> Path:
+    if output:
+        return Path(output)
+    return notebook.with_name(notebook.stem + suffix)
+
+def inline_command(args) -> bool:
+    """Writes self-contained copies of notebooks, with images inlined."""
+    from ._export import inline_notebook, inline_notebook_html
+
+    return _export_command(
+        args,
+        ".inline.ipynb" if args.to == "ipynb" else ".html",
+        lambda notebook, output: (inline_notebook if args.to == "ipynb" else inline_notebook_html)(
+            notebook, output, jobs=args.jobs
+        ),
+    )
+
+def bundle_command(args) -> bool:
+    """Packs notebooks with the images they reference into zip archives."""
+    from ._export import bundle_notebook
+
+    return _export_command(args, ".zip", bundle_notebook)
+
+def _export_command(args, suffix, export) -> bool:
+    if args.output and len(args.notebooks) > 1:
+        print("Error: --output needs exactly one notebook.", file=sys.stderr)
+        return False
+    reports = []
+    success = True
+    for name in args.notebooks:
+        notebook = Path(name)
+        try:
+            report = export(notebook, _export_target(notebook, args.output, suffix))
+        except ImportError as e:
+            print(f"Error: {e.name or e} is required for this export (pip install dietnb[nbconvert]).", file=sys.stderr)
+            return False
+        except (OSError, ValueError) as e:
+            print(f"{notebook}: error: {e}", file=sys.stderr)
+            success = False
+            continue
+        reports.append(report)
+        if not args.json:
+            print(f"{notebook} -> {report['output']} ({report['files']} file(s), "
+                  f"{report['bytes'] / (1024 * 1024):.1f} MiB)")
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    return success
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description="dietnb command line utility.")
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
 
     # Install command
     parser_install = subparsers.add_parser('install', help='Install the IPython startup script for automatic activation.')
-    parser_install.set_defaults(func=install_startup_script)
+    parser_install.set_defaults(func=lambda _args: install_startup_script())
 
     # Uninstall command
     parser_uninstall = subparsers.add_parser('uninstall', help='Uninstall the IPython startup script.')
-    parser_uninstall.set_defaults(func=uninstall_startup_script)
+    parser_uninstall.set_defaults(func=lambda _args: uninstall_startup_script())
+
+    # Clean command
+    parser_clean = subparsers.add_parser('clean', help='Delete images no saved notebook references.')
+    parser_clean.add_argument('paths', nargs='+', metavar='PATH', help='Directories to walk or notebook files.')
+    parser_clean.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting.')
+    parser_clean.add_argument('--jobs', '-j', type=int, default=None, help='Worker processes (default: CPU count).')
+    parser_clean.add_argument('--json', action='store_true', help='Print a machine-readable JSON summary.')
+    parser_clean.add_argument('--remove-orphans', action='store_true',
+                              help='Also empty and remove image folders whose notebook no longer exists.')
+    parser_clean.set_defaults(func=clean_command)
+
+    # Convert command
+    parser_convert = subparsers.add_parser('convert', help='Move images embedded in notebooks into image folders.')
+    parser_convert.add_argument('paths', nargs='+', metavar='PATH', help='Directories to walk or notebook files.')
+    parser_convert.add_argument('--dry-run', action='store_true', help='Report what would be moved without writing.')
+    parser_convert.add_argument('--jobs', '-j', type=int, default=None, help='Worker processes (default: CPU count).')
+    parser_convert.add_argument('--json', action='store_true', help='Print a machine-readable JSON summary.')
+    parser_convert.add_argument('--min-bytes', type=int, default=4096,
+                                help='Leave smaller images embedded (default: 4096).')
+    parser_convert.add_argument('--compact', action='store_true',
+                                help='Write the compact HTML of output="compact".')
+    parser_convert.set_defaults(func=convert_command)
+
+    # Inline command
+    parser_inline = subparsers.add_parser('inline', help='Write self-contained notebooks with images inlined.')
+    parser_inline.add_argument('notebooks', nargs='+', metavar='NOTEBOOK', help='Notebooks to export.')
+    parser_inline.add_argument('--output', '-o', default=None,
+                               help='Output file (default: X.inline.ipynb or X.html next to the notebook).')
+    parser_inline.add_argument('--to', choices=['ipynb', 'html'], default='ipynb',
+                               help='Output format; html requires nbconvert (default: ipynb).')
+    parser_inline.add_argument('--jobs', '-j', type=int, default=None, help='Threads reading images.')
+    parser_inline.add_argument('--json', action='store_true', help='Print a machine-readable JSON summary.')
+    parser_inline.set_defaults(func=inline_command)
+
+    # Bundle command
+    parser_bundle = subparsers.add_parser('bundle', help='Zip notebooks with the images they reference.')
+    parser_bundle.add_argument('notebooks', nargs='+', metavar='NOTEBOOK', help='Notebooks to export.')
+    parser_bundle.add_argument('--output', '-o', default=None, help='Output archive (default: X.zip next to the notebook).')
+    parser_bundle.add_argument('--json', action='store_true', help='Print a machine-readable JSON summary.')
+    parser_bundle.set_defaults(func=bundle_command)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if hasattr(args, 'func'):
-        success = args.func()
+        success = args.func(args)
         sys.exit(0 if success else 1)
     else:
         parser.print_help()
@@ -0,0 +1,170 @@
+"""
+Runtime options for dietnb, set through ``dietnb.activate(**options)``.
+"""
+
+import os
+import re
+import secrets
+from dataclasses import dataclass, fields
+from typing import Optional
+
+STORAGE_MODES = ("cell", "content")
+ENCODERS = ("default", "fast")
+FORMATS = ("png", "svg", "jpeg", "webp")
+OUTPUT_MODES = ("full", "compact")
+
+# Environment variable read when ``namespace`` is not given, so batch runners
+# (papermill, ``nbconvert --execute``) can set it per run without code changes
+NAMESPACE_ENV = "DIETNB_NAMESPACE"
+# What ``namespace="kernel"`` stands for: an id unique to this process
+KERNEL_NAMESPACE = f"k{secrets.token_hex(4)}"
+_NAMESPACE_RE = re.compile(r"^[A-Za-z0-9-]{1,32}$")
+
+
+@dataclass
+class _Options:
+    """Options controlling how figures are externalized."""
+
+    # Encode and write figures on a background pool instead of inside
+    # ``_repr_html_`` (drawing still happens there).
+    async_writes: bool = False
+    # Number of background writer threads.
+    max_workers: int = 2
+    # Maximum queued writes before ``_repr_html_`` blocks (backpressure).
+    max_pending: int = 16
+    # "cell": one file per figure named after the cell execution.
+    # "content": files named by a hash of the rendered bytes and shared.
+    storage: str = "cell"
+    # Reuse the previous rendering of a cell's figure when its fingerprint
+    # (artists, data, rcParams, dpi, format) is unchanged.
+    render_cache: bool = False
+    # Bounds of the render cache: number of figures and total bytes kept.
+    render_cache_size: int = 256
+    render_cache_bytes: int = 64 * 1024 * 1024
+    # Forget the least recently executed cells beyond this many (None: no cap).
+    max_tracked_cells: Optional[int] = None
+    # Image format: one of FORMATS, or "auto" to pick SVG for sparse figures
+    # and ``auto_raster_format`` for dense ones.
+    format: str = "png"
+    dpi: int = 150
+    # "auto": figures with more primitives (points, paths, mesh cells) than
+    # this are rasterized.
+    auto_max_vector_elements: int = 5000
+    auto_raster_format: str = "png"
+    # "fast": encode PNGs straight from the Agg RGBA buffer with a low
+    # deflate level (bigger files, lower latency); combine with ``optimize``
+    # to recompress them in the background.
+    encoder: str = "default"
+    fast_compress_level: int = 1
+    # Per-figure budgets: lower dpi (down to ``min_dpi``) to stay within the
+    # pixel count, and lower dpi or switch to WebP/JPEG to stay within the
+    # encoded size. None disables a budget.
+    max_image_bytes: Optional[int] = None
+    max_image_pixels: Optional[int] = None
+    min_dpi: int = 50
+    # Recompress written PNGs on a background thread (palette PNG when the
+    # image has at most 256 colors, maximum deflate otherwise).
+    optimize: bool = False
+    # Mean per-channel error (0-255) allowed when quantizing images with more
+    # than 256 colors; 0 keeps optimization lossless.
+    optimize_tolerance: float = 0.0
+    # "full": every figure carries its own styles and copy-button script.
+    # "compact": those are emitted once and figures get a minimal wrapper.
+    output: str = "full"
+    # Write image/png and image/jpeg display data of other objects (PIL,
+    # IPython.display.Image, ...) to the image directory when at least this
+    # many bytes (e.g. 4096); None leaves them embedded.
+    externalize_min_bytes: Optional[int] = None
+    # Move HTML, JSON and text outputs of at least this many bytes into
+    # sidecar files next to the images, leaving a preview of
+    # ``sidecar_preview_chars`` characters and a link; None disables.
+    sidecar_min_bytes: Optional[int] = None
+    sidecar_preview_chars: int = 2000
+    # Show raster images wider than this many CSS pixels through lazily loaded
+    # thumbnails (1x and 2x this width, written in the background) with
+    # explicit width/height; the full image stays the copy/download target.
+    thumbnail_width: Optional[int] = None
+    # Rasterize the figures of every cell on this many worker processes (see
+    # ``dietnb.batch()``); 0 renders them in the kernel.
+    render_workers: int = 0
+    # Close each figure from pyplot and free its Agg renderer buffer as soon
+    # as it has been written, instead of when the cell ends.
+    release_figures: bool = False
+    # Record the RSS at the start, peak and end of each cell and the number
+    # of figures pyplot holds (``dietnb.memory_report()``).
+    memory_report: bool = False
+    # Append one JSON line per saved figure (with per-stage timings), failure
+    # and cleanup to this file.
+    stats_log: Optional[str] = None
+    # Keep the image manifest in a SQLite file inside the image directory so
+    # it survives kernel restarts and is shared by concurrent kernels.
+    persistent_manifest: bool = False
+    # Inserted into cell file names (``{exec}_{index}_{namespace}_{key}``) so
+    # parallel runs of the same notebook sharing an image directory never
+    # write the same file. "kernel" picks an id unique to this kernel; None
+    # uses the DIETNB_NAMESPACE environment variable, if set.
+    namespace: Optional[str] = None
+
+    def __post_init__(self):
+        if self.max_workers < 1:
+            raise ValueError("max_workers must be at least 1.")
+        if self.max_pending < 1:
+            raise ValueError("max_pending must be at least 1.")
+        if self.render_cache_size < 1 or self.render_cache_bytes < 1:
+            raise ValueError("render_cache_size and render_cache_bytes must be positive.")
+        if self.max_tracked_cells is not None and self.max_tracked_cells < 1:
+            raise ValueError("max_tracked_cells must be at least 1.")
+        if self.format not in FORMATS + ("auto",):
+            raise ValueError(f"format must be one of {', '.join(FORMATS)} or auto.")
+        if self.auto_raster_format not in FORMATS or self.auto_raster_format == "svg":
+            raise ValueError("auto_raster_format must be a raster format (png, jpeg or webp).")
+        if self.dpi <= 0:
+            raise ValueError("dpi must be positive.")
+        if self.auto_max_vector_elements < 0:
+            raise ValueError("auto_max_vector_elements must not be negative.")
+        if self.encoder not in ENCODERS:
+            raise ValueError(f"encoder must be one of {', '.join(ENCODERS)}.")
+        if not 0 <= self.fast_compress_level <= 9:
+            raise ValueError("fast_compress_level must be between 0 and 9.")
+        if self.max_image_bytes is not None and self.max_image_bytes < 1:
+            raise ValueError("max_image_bytes must be positive.")
+        if self.max_image_pixels is not None and self.max_image_pixels < 1:
+            raise ValueError("max_image_pixels must be positive.")
+        if self.min_dpi < 1:
+            raise ValueError("min_dpi must be at least 1.")
+        if self.optimize_tolerance < 0:
+            raise ValueError("optimize_tolerance must not be negative.")
+        if self.externalize_min_bytes is not None and self.externalize_min_bytes < 0:
+            raise ValueError("externalize_min_bytes must not be negative.")
+        if self.sidecar_min_bytes is not None and self.sidecar_min_bytes < 1:
+            raise ValueError("sidecar_min_bytes must be positive.")
+        if self.sidecar_preview_chars < 0:
+            raise ValueError("sidecar_preview_chars must not be negative.")
+        if self.thumbnail_width is not None and self.thumbnail_width < 1:
+            raise ValueError("thumbnail_width must be positive.")
+        if self.render_workers < 0:
+            raise ValueError("render_workers must not be negative.")
+        if self.output not in OUTPUT_MODES:
+            raise ValueError(f"output must be one of {', '.join(OUTPUT_MODES)}.")
+        if self.storage not in STORAGE_MODES:
+            raise ValueError(f"storage must be one of {', '.join(STORAGE_MODES)}.")
+        if self.namespace is None:
+            self.namespace = os.environ.get(NAMESPACE_ENV) or None
+        if self.namespace == "kernel":
+            self.namespace = KERNEL_NAMESPACE
+        if self.namespace is not None and not _NAMESPACE_RE.match(self.namespace):
+            raise ValueError("namespace must be 1-32 letters, digits or hyphens.")
+
+
+options = _Options()
+
+
+def configure(**kwargs) -> _Options:
+    """Replaces the active options with the defaults updated by ``kwargs``."""
+    global options
+    known = {f.name for f in fields(_Options)}
+    unknown = sorted(set(kwargs) - known)
+    if unknown:
+        raise TypeError(f"Unknown dietnb option(s): {', '.join(unknown)}")
+    options = _Options(**kwargs)
+    return options
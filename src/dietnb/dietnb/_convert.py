@@ -0,0 +1,576 @@
+"""
+Offline conversion of notebooks with embedded images, used by ``dietnb convert``.
+
+Base64 ``image/png``, ``image/jpeg`` and ``image/webp`` outputs (and
+``image/svg+xml``) are decoded into the notebook's ``X_dietnb_imgs`` folder
+and replaced by the HTML dietnb emits for live figures. Files are named like
+live ones, ``{execution_count}_{index}_{cell_key}{ext}``, so rerunning the
+cell in a kernel with dietnb replaces them and cleanup treats them as usual.
+Existing files are never overwritten: indices already taken in the folder
+(by a live session or an earlier conversion) are skipped.
+
+Notebooks are rewritten in two streaming passes over fixed-size chunks: the
+first collects cell ids, execution counts and which outputs to convert, the
+second copies the JSON text unchanged except for those outputs, decoding
+base64 straight into the image files. Memory use therefore does not depend on
+the notebook or image sizes. The notebook is replaced atomically at the end.
+"""
+
+import binascii
+import io
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from . import _formats, _paths, _templates
+from ._nbscan import CHUNK_SIZE, _SCALAR_RE, _STRING_BODY_RE, _STRING_RE, _WS_RE, _chunks
+
+# Converted mimetypes in order of preference, with their image format
+MIMETYPES = {
+    "image/png": "png",
+    "image/jpeg": "jpeg",
+    "image/webp": "webp",
+    "image/svg+xml": "svg",
+}
+_BINARY = {"image/png", "image/jpeg", "image/webp"}
+DEFAULT_MIN_BYTES = 4096
+
+_STRING_ITEMS_RE = re.compile(rf"(?:{_STRING_RE.pattern}\s*,\s*)*", re.S)
+_PARTIAL_ESCAPE_RE = re.compile(
+    r"(?:\\u[dD][89abAB][0-9A-Fa-f]{2})?\\u[0-9A-Fa-f]{0,3}$|\\u[dD][89abAB][0-9A-Fa-f]{2}$"
+)
+_B64_JUNK_RE = re.compile(r"[^A-Za-z0-9+/=]")
+
+
+def _unescape(raw: str) -> str:
+    return json.loads(f'"{raw}"')
+
+
+class _Unescaper:
+    """Turns raw (escaped) string fragments into text for ``sink``."""
+
+    def __init__(self, sink: Callable[[str], None]):
+        self.sink = sink
+        self.pending = ""  # an incomplete \u escape
+
+    def __call__(self, raw: str) -> None:
+        raw = self.pending + raw
+        # Fragments end before a lone backslash, so only a \uXXXX escape (or a
+        # surrogate pair) can be cut off at a chunk boundary; keep it back.
+        split = _PARTIAL_ESCAPE_RE.search(raw)
+        cut = split.start() if split else len(raw)
+        self.pending = raw[cut:]
+        if cut:
+            self.sink(_unescape(raw[:cut]))
+
+
+class _Base64Sink:
+    """Decodes base64 text, fed in pieces, into a file."""
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.carry = ""  # base64 characters not yet forming a 4-character group
+        self.size = 0
+
+    def feed(self, text: str) -> None:
+        text = self.carry + _B64_JUNK_RE.sub("", text)
+        usable = len(text) - len(text) % 4
+        self.carry = text[usable:]
+        if usable:
+            self.write(binascii.a2b_base64(text[:usable]))
+
+    def write(self, data: bytes) -> None:
+        self.handle.write(data)
+        self.size += len(data)
+
+    def close(self) -> None:
+        if self.carry:
+            self.write(binascii.a2b_base64(self.carry + "=" * (-len(self.carry) % 4)))
+
+
+class _TextSink(_Base64Sink):
+    """Writes text (SVG) as UTF-8."""
+
+    def feed(self, text: str) -> None:
+        self.write(text.encode("utf-8"))
+
+    def close(self) -> None:
+        pass
+
+
+class _Reader:
+    """Walks a JSON document in chunks, optionally echoing it to ``out``."""
+
+    def __init__(self, path: Path, chunk_size: int, out=None):
+        # Strict decoding: a notebook that is not valid UTF-8 is left alone
+        self._chunks = _chunks(path, chunk_size, errors="strict")
+        self.buf = ""
+        self.pos = 0
+        self.out = out
+
+    def _fill(self) -> bool:
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _emit(self, text: str) -> None:
+        if self.out is not None and text:
+            self.out.write(text)
+
+    def peek(self) -> str:
+        """Skips (and echoes) whitespace; returns the next character or ""."""
+        while True:
+            end = _WS_RE.match(self.buf, self.pos).end()
+            self._emit(self.buf[self.pos:end])
+            self.pos = end
+            if end < len(self.buf):
+                return self.buf[end]
+            if not self._fill():
+                return ""
+
+    def take(self, echo: bool = True) -> str:
+        if self.pos >= len(self.buf) and not self._fill():
+            raise ValueError("Unexpected end of notebook.")
+        char = self.buf[self.pos]
+        self.pos += 1
+        if echo:
+            self._emit(char)
+        return char
+
+    def scalar(self) -> str:
+        parts = []
+        while True:
+            match = _SCALAR_RE.match(self.buf, self.pos)
+            end = match.end() if match else self.pos
+            parts.append(self.buf[self.pos:end])
+            self.pos = end
+            if end < len(self.buf) or not self._fill():
+                break
+        text = "".join(parts)
+        self._emit(text)
+        return text
+
+    def string(self, sink: Optional[Callable[[str], None]] = None, echo: bool = True) -> None:
+        """Consumes a string, passing raw (still escaped) fragments to ``sink``."""
+        self.take(echo)  # opening quote
+        while True:
+            match = _STRING_BODY_RE.match(self.buf, self.pos)
+            fragment = match.group()
+            self.pos = match.end()
+            if fragment:
+                if echo:
+                    self._emit(fragment)
+                if sink is not None:
+                    sink(fragment)
+            if self.pos < len(self.buf) and self.buf[self.pos] == '"':
+                self.take(echo)
+                return
+            if not self._fill():
+                raise ValueError("Unterminated string in notebook.")
+
+    def raw_string(self, echo: bool = True) -> str:
+        parts: List[str] = []
+        self.string(parts.append, echo)
+        return "".join(parts)
+
+
+class _Walker:
+    """Recursive traversal with a hook for every object member."""
+
+    def __init__(self, reader: _Reader):
+        self.r = reader
+
+    def member(self, path: tuple, key: str) -> bool:
+        """Called before a member's value; returns True if it consumed it."""
+        return False
+
+    def document(self) -> None:
+        self.value(())
+        if self.r.peek():
+            raise ValueError("Unexpected data after the notebook JSON.")
+
+    def value(self, path: tuple) -> None:
+        char = self.r.peek()
+        if char == "{":
+            self.obj(path)
+        elif char == "[":
+            self.array(path)
+        elif char == '"':
+            self.r.string()
+        elif char:
+            self.r.scalar()
+        else:
+            raise ValueError("Unexpected end of notebook.")
+
+    def obj(self, path: tuple) -> None:
+        r = self.r
+        r.take()
+        if r.peek() == "}":
+            r.take()
+            return
+        while True:
+            if r.peek() != '"':
+                raise ValueError("Expected a member name in notebook JSON.")
+            raw_key = r.raw_string(echo=False)
+            if r.peek() != ":":
+                raise ValueError("Expected ':' in notebook JSON.")
+            r.take(echo=False)
+            key = _unescape(raw_key)
+            if not self.member(path, key):
+                r._emit(f'"{raw_key}":')
+                self.value(path + (key,))
+            separator = r.peek()
+            r.take()
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError("Expected ',' or '}' in notebook JSON.")
+
+    def array(self, path: tuple) -> None:
+        r = self.r
+        r.take()
+        if r.peek() == "]":
+            r.take()
+            return
+        index = 0
+        while True:
+            if r.peek() == '"':
+                # Runs of complete string items (source lines, HTML lines) are
+                # copied in one piece
+                match = _STRING_ITEMS_RE.match(r.buf, r.pos)
+                if match.end() > r.pos:
+                    run = match.group()
+                    r._emit(run)
+                    r.pos = match.end()
+                    index += len(_STRING_RE.findall(run))
+                    continue
+            self.value(path + (index,))
+            index += 1
+            separator = r.peek()
+            r.take()
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError("Expected ',' or ']' in notebook JSON.")
+
+    def capture_value(self, path: tuple) -> str:
+        """Reads a (small) value and returns its JSON text without echoing it."""
+        out, self.r.out = self.r.out, io.StringIO()
+        try:
+            self.value(path)
+            return self.r.out.getvalue()
+        finally:
+            self.r.out = out
+
+    def parse_value(self, path: tuple):
+        """Reads a (small) value as a Python object."""
+        return json.loads(self.capture_value(path))
+
+    def strings(self, sink: Callable[[str], None]) -> None:
+        """Feeds the text of a string, or of each string in an array, to ``sink``."""
+        r = self.r
+        if r.peek() == '"':
+            unescaper = _Unescaper(sink)
+            r.string(unescaper, echo=False)
+            if unescaper.pending:
+                raise ValueError("Truncated escape sequence in image data.")
+            return
+        if r.take(echo=False) != "[":
+            raise ValueError("Expected image data to be a string or list of strings.")
+        if r.peek() == "]":
+            r.take(echo=False)
+            return
+        while True:
+            if r.peek() != '"':
+                raise ValueError("Expected a string in image data.")
+            # Jupyter splits base64 into one string per line: decode every
+            # complete item in the buffer at once instead of one by one.
+            match = _STRING_ITEMS_RE.match(r.buf, r.pos)
+            if match.end() > r.pos:
+                items = match.group().rstrip()
+                sink("".join(json.loads(f"[{items[:-1]}]")))
+                r.pos = match.end()
+                continue
+            self.strings(sink)
+            separator = r.peek()
+            r.take(echo=False)
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError("Expected ',' or ']' in image data.")
+
+
+def _is_output_path(path: tuple, leaf: str) -> bool:
+    # ("cells", i, "outputs", j, leaf)
+    return (len(path) == 5 and path[0] == "cells" and path[2] == "outputs" and path[4] == leaf
+            and isinstance(path[1], int) and isinstance(path[3], int))
+
+
+class _Survey(_Walker):
+    """First pass: cells, execution counts and the image outputs to convert."""
+
+    def __init__(self, reader: _Reader):
+        super().__init__(reader)
+        self.cells: Dict[int, dict] = {}
+        # (cell, output) -> {"keys": [...], "sizes": {mime: chars}, "meta": {mime: {...}}}
+        self.outputs: Dict[Tuple[int, int], dict] = {}
+
+    def _output(self, path: tuple) -> dict:
+        return self.outputs.setdefault((path[1], path[3]), {"keys": [], "sizes": {}, "meta": {}})
+
+    def member(self, path: tuple, key: str) -> bool:
+        if len(path) == 2 and path[0] == "cells" and key in ("id", "execution_count"):
+            self.cells.setdefault(path[1], {})[key] = self.parse_value(path + (key,))
+            return True
+        if _is_output_path(path, "data"):
+            output = self._output(path)
+            output["keys"].append(key)
+            if key in MIMETYPES:
+                size = [0]
+
+                def count(text):
+                    size[0] += len(text)
+
+                self.strings(count)
+                output["sizes"][key] = size[0]
+                return True
+            return False
+        if _is_output_path(path, "metadata") and key in MIMETYPES:
+            value = self.parse_value(path + (key,))
+            if isinstance(value, dict):
+                self._output(path)["meta"][key] = value
+            return True
+        return False
+
+
+class _Rewrite(_Walker):
+    """Second pass: copies the notebook, replacing planned image outputs."""
+
+    def __init__(self, reader: _Reader, plan: Dict[Tuple[int, int], dict]):
+        super().__init__(reader)
+        self.plan = plan
+        self.written: List[Tuple[Path, Path, int]] = []  # (temp, final, size)
+
+    def member(self, path: tuple, key: str) -> bool:
+        if not _is_output_path(path, "data"):
+            return False
+        item = self.plan.get((path[1], path[3]))
+        if item is None or key != item["mimetype"]:
+            return False
+        final = item["filepath"]
+        temp = final.with_name(f".{final.name}.{os.getpid()}.tmp")
+        out, self.r.out = self.r.out, None
+        with open(temp, "wb") as handle:
+            sink = (_Base64Sink if key in _BINARY else _TextSink)(handle)
+            try:
+                self.strings(sink.feed)
+                sink.close()
+            except BaseException:
+                handle.close()
+                temp.unlink()
+                raise
+            finally:
+                self.r.out = out
+        self.written.append((temp, final, sink.size))
+        self.r._emit(f'"text/html": {json.dumps(item["html"], ensure_ascii=False)}')
+        return True
+
+
+def _image_attrs(meta: dict) -> str:
+    attrs = ""
+    for dimension in ("width", "height"):
+        value = meta.get(dimension)
+        if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+            attrs += f' {dimension}="{int(value)}"'
+    return attrs
+
+
+def _plan(notebook: Path, survey: _Survey, min_bytes: int, compact: bool) -> Tuple[dict, int]:
+    """Decides which outputs to convert and their file names and HTML."""
+    image_dir = notebook.with_name(f"{notebook.stem}_{_paths.DEFAULT_FOLDER_NAME}")
+    plan = {}
+    skipped = 0
+    indices: Dict[int, int] = {}
+    try:
+        taken: Set[str] = {entry.name for entry in os.scandir(image_dir)}
+    except FileNotFoundError:
+        taken = set()
+    assets = compact
+    for (cell, index), output in sorted(survey.outputs.items()):
+        images = [key for key in MIMETYPES if key in output["sizes"]]
+        if not images:
+            continue
+        mimetype = images[0]
+        chars = output["sizes"][mimetype]
+        size = chars * 3 // 4 if mimetype in _BINARY else chars
+        if len(images) > 1 or "text/html" in output["keys"] or size < min_bytes:
+            # Alternative representations or rich HTML: leave the output as is
+            skipped += 1
+            continue
+        info = survey.cells.get(cell, {})
+        cell_id = info.get("id")
+        key = _paths.cell_key_from_id(cell_id if isinstance(cell_id, str) else f"{notebook.name}:{cell}")
+        exec_count = info.get("execution_count")
+        exec_count = exec_count if isinstance(exec_count, int) and exec_count >= 0 else 0
+        ext = _formats.EXTENSIONS[MIMETYPES[mimetype]]
+        while True:
+            indices[cell] = indices.get(cell, 0) + 1
+            filename = f"{exec_count}_{indices[cell]}_{key}{ext}"
+            if filename not in taken:
+                break
+        taken.add(filename)
+        filepath = image_dir / filename
+        img_src = _paths.img_src_relative_path(filepath, notebook)
+        img_attrs = _image_attrs(output["meta"].get(mimetype, {}))
+        if compact:
+            html = _templates.COMPACT_HTML.format(img_src=img_src, filename=filename, img_attrs=img_attrs)
+            if assets:
+                html = _templates.COMPACT_ASSETS + html
+                assets = False
+        else:
+            html = _templates.COPY_BUTTON_HTML.format(
+                img_src=img_src, filename=filename, img_attrs=img_attrs,
+            ) + _templates.COPY_BUTTON_SCRIPT
+        plan[(cell, index)] = {
+            "mimetype": mimetype, "filepath": filepath, "html": html, "chars": chars, "bytes": size,
+        }
+    return plan, skipped
+
+
+def _place(temp: Path, final: Path) -> None:
+    """Moves a written image to its final name without replacing a file that
+    appeared there since the plan was made."""
+    try:
+        os.link(temp, final)
+    except FileExistsError:
+        raise FileExistsError(f"{final} appeared while the notebook was being converted.") from None
+    except OSError:
+        # No hard links on this filesystem; the check is not atomic here
+        if final.exists():
+            raise FileExistsError(f"{final} appeared while the notebook was being converted.") from None
+        os.replace(temp, final)
+        return
+    temp.unlink()
+
+
+def convert_notebook(notebook: Path, dry_run: bool = False, min_bytes: int = DEFAULT_MIN_BYTES,
+                     compact: bool = False, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Moves the embedded images of one notebook into its image folder."""
+    notebook = Path(notebook)
+    report = {
+        "notebook": str(notebook),
+        "images": 0,
+        "image_bytes": 0,
+        "skipped": 0,
+        "bytes_before": 0,
+        "bytes_after": 0,
+        "bytes_reclaimed": 0,
+        "error": None,
+    }
+    try:
+        stat = notebook.stat()
+        report["bytes_before"] = report["bytes_after"] = stat.st_size
+        survey = _Survey(_Reader(notebook, chunk_size))
+        survey.document()
+        plan, report["skipped"] = _plan(notebook, survey, min_bytes, compact)
+    except (OSError, ValueError) as exc:
+        report["error"] = repr(exc)
+        return report
+    if not plan:
+        return report
+
+    report["images"] = len(plan)
+    report["image_bytes"] = sum(item["bytes"] for item in plan.values())
+    if dry_run:
+        # Estimate: the base64 payloads go, the HTML comes in
+        report["bytes_reclaimed"] = sum(
+            item["chars"] - len(json.dumps(item["html"], ensure_ascii=False)) for item in plan.values()
+        )
+        report["bytes_after"] = report["bytes_before"] - report["bytes_reclaimed"]
+        return report
+
+    temp = notebook.with_name(f".{notebook.name}.{os.getpid()}.dietnb.tmp")
+    rewrite = None
+    placed: List[Path] = []
+    try:
+        _paths.image_dir_for_notebook(notebook)
+        with open(temp, "w", encoding="utf-8", newline="") as out:
+            rewrite = _Rewrite(_Reader(notebook, chunk_size, out), plan)
+            rewrite.document()
+        if notebook.stat().st_mtime_ns != stat.st_mtime_ns:
+            raise OSError(f"{notebook} changed while it was being converted.")
+        # Images first: if anything fails before the notebook is replaced,
+        # the notebook still holds its embedded images.
+        for image_temp, final, _ in rewrite.written:
+            _place(image_temp, final)
+            placed.append(final)
+        os.chmod(temp, stat.st_mode & 0o7777)
+        os.replace(temp, notebook)
+    except (OSError, ValueError) as exc:
+        report["error"] = repr(exc)
+        report["images"] = report["image_bytes"] = 0
+        temps = [image_temp for image_temp, _, _ in (rewrite.written if rewrite else [])]
+        for path in [temp, *temps, *placed]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        return report
+
+    report["image_bytes"] = sum(size for _, _, size in rewrite.written)
+    report["bytes_after"] = notebook.stat().st_size
+    report["bytes_reclaimed"] = report["bytes_before"] - report["bytes_after"]
+    return report
+
+
+def find_notebooks(paths: Iterable[Path]) -> List[Path]:
+    """Returns the notebooks below ``paths`` (skipping hidden directories and
+    checkpoints) or the notebook files given directly."""
+    notebooks = set()
+    for path in paths:
+        path = Path(path)
+        if path.is_file():
+            if path.suffix == ".ipynb":
+                notebooks.add(path)
+            continue
+        for root, dirnames, filenames in os.walk(path):
+            dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+            notebooks.update(Path(root) / name for name in filenames if name.endswith(".ipynb"))
+    return sorted(notebooks)
+
+
+def _convert_one(args) -> dict:
+    return convert_notebook(*args)
+
+
+def convert_tree(paths: Iterable[Path], dry_run: bool = False, jobs: Optional[int] = None,
+                 min_bytes: int = DEFAULT_MIN_BYTES, compact: bool = False) -> dict:
+    """Converts every notebook below ``paths`` and returns a summary."""
+    tasks = [(notebook, dry_run, min_bytes, compact) for notebook in find_notebooks(paths)]
+    jobs = jobs or os.cpu_count() or 1
+
+    if jobs == 1 or len(tasks) <= 1:
+        reports = [_convert_one(task) for task in tasks]
+    else:
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+            reports = list(executor.map(_convert_one, tasks, chunksize=chunksize))
+
+    return {
+        "dry_run": dry_run,
+        "notebooks": len(reports),
+        "converted": sum(1 for r in reports if r["images"]),
+        "images": sum(r["images"] for r in reports),
+        "image_bytes": sum(r["image_bytes"] for r in reports),
+        "bytes_before": sum(r["bytes_before"] for r in reports),
+        "bytes_after": sum(r["bytes_after"] for r in reports),
+        "bytes_reclaimed": sum(r["bytes_reclaimed"] for r in reports),
+        "errors": [{"notebook": r["notebook"], "error": r["error"]} for r in reports if r["error"]],
+        "reports": reports,
+    }
@@ -1,9 +1,21 @@
+import base64
+import binascii
 import hashlib
+import html as html_lib
+import io
+import json
+import math
 import os
+import posixpath
+import sys
+import threading
 import time
+import warnings
+from concurrent.futures import Future, wait
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Optional, Set, Tuple
+from typing import Callable, Dict, Optional, Set, Tuple
 
 # Removed imports for notebook and requests
 # import matplotlib.pyplot as plt # This should be kept
@@ -14,11 +26,42 @@ import matplotlib.pyplot as plt
 from IPython import get_ipython
 from matplotlib.figure import Figure
 
-from . import _templates
+from . import (
+    _batch, _cache, _config, _display, _formats, _manifest, _memory, _nbscan, _optimize, _paths, _sidecar,
+    _stats, _templates, _thumbnails,
+)
+from ._paths import DEFAULT_FOLDER_NAME
+from ._writer import _BackgroundWriter
 
 # Global state
 _patch_applied = False
-DEFAULT_FOLDER_NAME = "dietnb_imgs"
+_writer: Optional[_BackgroundWriter] = None
+_optimizer: Optional[_BackgroundWriter] = None
+# Thumbnail jobs queued since the last cell ended
+_thumbnail_jobs: Set[Future] = set()
+_thumbnail_lock = threading.Lock()
+_render_cache: Optional[_cache._RenderCache] = None
+CONTENT_DIGEST_LENGTH = _manifest.CONTENT_DIGEST_LENGTH
+
+# Retries loading an image that the background writer has not finished yet.
+_ASYNC_RETRY_JS = (
+    "var n=+(this.dataset.retry||0);"
+    "if(n<40){this.dataset.retry=n+1;var s=this;"
+    "setTimeout(function(){s.src=s.src.split('?')[0]+'?retry='+(n+1);},250);}"
+)
+_ASYNC_IMG_ATTRS = f' onerror="{_ASYNC_RETRY_JS}"'
+# Falls back to the full image while its thumbnails are still being written,
+# then retries like an async image.
+_THUMBNAIL_IMG_ATTRS = (
+    " onerror=\"if(this.hasAttribute('srcset')){this.removeAttribute('srcset');return;}"
+    f'{_ASYNC_RETRY_JS}"'
+)
+# Compact output: attribute picked up by the retry handler in COMPACT_ASSETS
+_COMPACT_ASYNC_IMG_ATTRS = " data-dietnb-async"
+
+# Compact output: per image directory, the (cell key, execution count) whose
+# output carries the injected assets
+_asset_owners: Dict[str, Tuple[str, int]] = {}
 
 
 def _directory_key(directory: Path) -> str:
@@ -37,33 +80,6 @@ def _relative_to_cwd(path: Path) -> str:
         return str(path)
 
 
-def _safe_relpath(path: Path, base: Path) -> Optional[str]:
-    """Returns a POSIX-style relative path if possible."""
-    try:
-        rel = path.relative_to(base)
-    except ValueError:
-        try:
-            rel = Path(os.path.relpath(path, base))
-        except ValueError:
-            return None
-    return rel.as_posix()
-
-
-def _img_src_relative_path(filepath: Path, notebook_path: Optional[Path]) -> str:
-    """Computes an image src suitable for HTML, preferring notebook-relative paths."""
-    if notebook_path:
-        base = notebook_path.parent
-        rel = _safe_relpath(filepath, base)
-        if rel:
-            return rel
-
-    rel_cwd = _safe_relpath(filepath, Path.cwd())
-    if rel_cwd:
-        return rel_cwd
-
-    return filepath.name
-
-
 def _normalize_notebook_path(candidate: Optional[str]) -> Optional[Path]:
     """Normalizes notebook paths from various front-ends."""
     if not isinstance(candidate, str):
@@ -113,46 +129,95 @@ def _resolve_notebook_path(ip_instance) -> Optional[Path]:
     return None
 
 
+class _CellEntry:
+    """State of the latest execution of one cell in one image directory."""
+
+    __slots__ = ("exec_count", "last_index", "tick")
+
+    def __init__(self, exec_count: int):
+        self.exec_count = exec_count
+        self.last_index = 0
+        # Registry-wide counter value of the latest execution, for LRU eviction.
+        self.tick = 0
+
+
 @dataclass
 class _FigureRegistry:
-    """Tracks execution counts and per-cell figure indices."""
-
-    _last_exec_per_cell: Dict[Tuple[str, str], int] = field(default_factory=dict)
-    _indices: Dict[Tuple[str, str, int], int] = field(default_factory=dict)
-
-    def register(self, directory: Path, cell_key: str, exec_count: int) -> Tuple[int, bool]:
-        """Returns new index and whether this is a fresh execution for the cell."""
-        dir_key = _directory_key(directory)
-        state_key = (dir_key, cell_key)
-        counter_key = (dir_key, cell_key, exec_count)
-
-        last_exec = self._last_exec_per_cell.get(state_key)
-        if last_exec != exec_count:
-            self._last_exec_per_cell[state_key] = exec_count
-            self._indices[counter_key] = 1
-            self._drop_old_indices(dir_key, cell_key, exec_count)
+    """Tracks execution counts and per-cell figure indices.
+
+    Cells are indexed per directory, so registering a figure and listing the
+    cells of a directory cost O(1) per cell regardless of how many cells the
+    kernel has seen. With ``max_cells`` set, the least recently executed cells
+    beyond the cap are forgotten. The files written by each cell are tracked
+    by the directory manifest (see ``_manifest``).
+    """
+
+    max_cells: Optional[int] = None
+    # dir_key -> cell_key -> entry, each inner dict ordered from least to most
+    # recently executed
+    _cells: Dict[str, Dict[str, _CellEntry]] = field(default_factory=dict)
+    _count: int = 0
+    _tick: int = 0
+
+    def register(self, dir_key: str, cell_key: str, exec_count: int) -> Tuple[int, bool]:
+        """Returns new index and whether this is a fresh execution for the cell.
+
+        ``dir_key`` is the image directory as returned by ``_directory_key``.
+        """
+        cells = self._cells.get(dir_key)
+        if cells is None:
+            cells = self._cells[dir_key] = {}
+        entry = cells.get(cell_key)
+
+        if entry is None or entry.exec_count != exec_count:
+            if entry is None:
+                entry = _CellEntry(exec_count)
+                self._count += 1
+            else:
+                entry.exec_count = exec_count
+                del cells[cell_key]
+            # (Re)inserting moves the cell to the most recent end
+            cells[cell_key] = entry
+            self._tick += 1
+            entry.tick = self._tick
+            self._evict()
+            entry.last_index = 1
             return 1, True
 
-        next_idx = self._indices.get(counter_key, 1) + 1
-        self._indices[counter_key] = next_idx
-        return next_idx, False
+        entry.last_index += 1
+        return entry.last_index, False
 
-    def active_cell_keys(self, directory: Path) -> Set[str]:
+    def active_cell_keys(self, dir_key: str) -> Set[str]:
         """Returns all cell keys known for the provided directory."""
-        dir_key = _directory_key(directory)
-        return {
-            cell_key
-            for (stored_dir, cell_key), _ in self._last_exec_per_cell.items()
-            if stored_dir == dir_key
-        }
-
-    def _drop_old_indices(self, dir_key: str, cell_key: str, exec_count: int) -> None:
-        stale_keys = [
-            key for key in self._indices
-            if key[0] == dir_key and key[1] == cell_key and key[2] != exec_count
-        ]
-        for key in stale_keys:
-            del self._indices[key]
+        return set(self._cells.get(dir_key, ()))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def set_max_cells(self, max_cells: Optional[int]) -> None:
+        """Changes the LRU cap, evicting cells beyond it right away."""
+        self.max_cells = max_cells
+        self._evict()
+
+    def clear(self) -> None:
+        """Forgets all tracked cells."""
+        self._cells.clear()
+        self._count = 0
+        self._tick = 0
+
+    def _evict(self) -> None:
+        if self.max_cells is None:
+            return
+        while self._count > self.max_cells:
+            # The oldest cell is first in one of the per-directory dicts
+            old_dir, cells = min(
+                self._cells.items(), key=lambda item: next(iter(item[1].values())).tick
+            )
+            del cells[next(iter(cells))]
+            if not cells:
+                del self._cells[old_dir]
+            self._count -= 1
+            _stats.incr("registry_evictions")
 
 
 _registry = _FigureRegistry()
@@ -163,23 +228,55 @@ def _get_notebook_image_dir(ip_instance, base_folder_name=DEFAULT_FOLDER_NAME) -
     1. Auto-detected notebook name.
     2. Default directory.
     """
+    return _paths.image_dir_for_notebook(_resolve_notebook_path(ip_instance), base_folder_name)
 
-    # if set img directory as hidden, jupyter notebook can't read img
-    fallback_dir = Path.cwd() / f"{base_folder_name}"
-    notebook_path = _resolve_notebook_path(ip_instance)
 
-    if notebook_path:
-        notebook_dir_name_part = f"{notebook_path.stem}_{base_folder_name}" if notebook_path.stem else f".{base_folder_name}"
-        target_dir = notebook_path.parent / notebook_dir_name_part
-    else:
-        target_dir = fallback_dir
+@dataclass(frozen=True)
+class _ResolutionContext:
+    """Notebook path and image directory resolved once per cell execution."""
 
-    try:
-        target_dir.mkdir(parents=True, exist_ok=True)
-        return target_dir
-    except OSError:
-        fallback_dir.mkdir(parents=True, exist_ok=True)
-        return fallback_dir
+    notebook_path: Optional[Path]
+    image_dir: Path
+    dir_key: str
+
+
+_context_cache: Optional[Tuple[tuple, _ResolutionContext]] = None
+
+
+def _context_inputs(ip) -> tuple:
+    """Collects every input that can change the resolved notebook/image paths."""
+    kernel = getattr(ip, "kernel", None)
+    session_path = getattr(getattr(kernel, "session", None), "path", None)
+    user_ns = getattr(ip, "user_global_ns", None)
+    vsc_path = user_ns.get("__vsc_ipynb_file__") if isinstance(user_ns, dict) else None
+    return (
+        getattr(ip, "execution_count", None),
+        session_path if isinstance(session_path, str) else None,
+        vsc_path if isinstance(vsc_path, str) else None,
+        os.environ.get("JPY_SESSION_NAME"),
+        os.getcwd(),
+    )
+
+
+def _get_resolution_context(ip) -> _ResolutionContext:
+    """Returns the resolution context, reusing it while its inputs are unchanged.
+
+    All figures of one cell execution share the same notebook path and image
+    directory, so resolving them (and creating the directory) once per
+    execution avoids repeated stat/mkdir calls on slow filesystems.
+    """
+    global _context_cache
+    inputs = _context_inputs(ip)
+    if _context_cache is not None and _context_cache[0] == inputs:
+        _stats.incr("context_cache_hits")
+        return _context_cache[1]
+
+    notebook_path = _resolve_notebook_path(ip)
+    image_dir = _paths.image_dir_for_notebook(notebook_path)
+    context = _ResolutionContext(notebook_path, image_dir, _directory_key(image_dir))
+    _context_cache = (inputs, context)
+    _stats.incr("context_cache_misses")
+    return context
 
 def _get_cell_key(ip) -> str:
     """Generates a unique key for the current cell execution."""
@@ -195,7 +292,7 @@ def _get_cell_key(ip) -> str:
     cell_id = meta.get("cellId") or meta.get("cell_id")
 
     if cell_id:
-        return hashlib.sha1(cell_id.encode()).hexdigest()[:12]
+        return _paths.cell_key_from_id(cell_id)
 
     # Fallback to hashing the raw cell content (less reliable)
     try:
@@ -211,36 +308,440 @@ def _get_cell_key(ip) -> str:
         fallback_key = hashlib.sha1(str(id(fig)).encode()).hexdigest()[:12]
         return fallback_key
 
-def _save_figure_and_get_html(fig: Figure, ip, fmt="png", dpi=150) -> Optional[str]:
-    """Saves the figure to a file and returns an HTML img tag."""
-    if not ip:
+def _get_writer() -> _BackgroundWriter:
+    """Returns the background writer, recreating it if its options changed."""
+    global _writer
+    opts = _config.options
+    if _writer is not None and (_writer.max_workers, _writer.max_pending) != (opts.max_workers, opts.max_pending):
+        _report_write_failures(_writer.shutdown())
+        _writer = None
+    if _writer is None:
+        _writer = _BackgroundWriter(opts.max_workers, opts.max_pending)
+    return _writer
+
+
+def _get_optimizer() -> _BackgroundWriter:
+    """Returns the single-threaded pool for work done after an image is written
+    (optimization, thumbnails)."""
+    global _optimizer
+    if _optimizer is None:
+        _optimizer = _BackgroundWriter(1, _config.options.max_pending, name="optimize")
+    return _optimizer
+
+
+def _shutdown_optimizer() -> None:
+    """Waits for queued optimizations and stops the optimizer thread."""
+    global _optimizer
+    if _optimizer is not None:
+        _optimizer.shutdown()
+        _optimizer = None
+
+
+def _optimize_image(manifest: _manifest._DirectoryManifest, filepath: Path, tolerance: float) -> None:
+    """Background job: recompresses one written PNG and records the savings."""
+    try:
+        with _stats.timer("optimize"):
+            saved = _optimize.optimize_file(filepath, tolerance)
+    except FileNotFoundError:
+        return  # Deleted by a rerun in the meantime
+    except Exception:
+        _stats.incr("optimize_failures")
+        return
+    if saved:
+        try:
+            size = filepath.stat().st_size
+        except FileNotFoundError:
+            return  # Deleted by a rerun right after it was rewritten
+        except OSError:
+            _stats.incr("optimize_failures")
+            return
+        manifest.record_optimization(filepath.name, size, saved)
+        _stats.incr("optimize_bytes_saved", saved)
+        _stats.incr("images_optimized")
+
+
+def _schedule_optimization(manifest: _manifest._DirectoryManifest, filepath: Path) -> None:
+    """Queues ``filepath`` for optimization without ever blocking the cell."""
+    tolerance = _config.options.optimize_tolerance
+    job = lambda: _optimize_image(manifest, filepath, tolerance)
+    if _get_optimizer().try_submit(filepath.name, job) is None:
+        _stats.incr("optimize_skipped")
+
+
+def _drop_renderer(fig: Figure) -> None:
+    """Frees the Agg buffer the canvas keeps for redrawing; the next draw rebuilds it."""
+    canvas = fig.canvas
+    if canvas.__dict__.pop("renderer", None) is not None:
+        canvas._lastKey = None
+        _stats.incr("renderers_released")
+
+
+def _release_figure(fig: Figure) -> None:
+    """Stops pyplot from keeping a saved figure alive until the end of the cell."""
+    if fig.canvas.manager is not None:
+        plt.close(fig)
+        _stats.incr("figures_released")
+    _drop_renderer(fig)
+
+
+def _estimated_size(fig: Figure, dpi: int) -> Tuple[int, int]:
+    """Pixel size of a figure before rendering; bbox_inches="tight" only trims the margins."""
+    width, height = fig.get_size_inches()
+    return round(width * dpi), round(height * dpi)
+
+
+def _thumbnail_plan(name: str, fmt: str, data: Optional[bytes] = None,
+                    size: Optional[Tuple[int, int]] = None) -> Optional[_thumbnails._Plan]:
+    """Plans thumbnails for an image, from its bytes or its (estimated) pixel size."""
+    width = _config.options.thumbnail_width
+    if width is None or fmt not in _thumbnails.RASTER_FORMATS:
         return None
+    if size is None and data is not None:
+        size = _thumbnails.image_size(data)
+    return _thumbnails.plan(name, size, width) if size else None
+
+
+def _write_thumbnails(slot: "_ImageSlot", filepath: Path, data: bytes, fmt: str,
+                      plan: _thumbnails._Plan) -> None:
+    """Background job: writes the thumbnails of one image and records them with its cell."""
+    try:
+        with _stats.timer("thumbnail"):
+            sizes = {}
+            missing = []
+            for name, width in plan.thumbnails:
+                target = filepath.with_name(name)
+                if _manifest.is_content_name(name) and target.exists():
+                    sizes[name] = target.stat().st_size  # Shared with an identical image
+                else:
+                    missing.append((name, width))
+            encoded = _thumbnails.make_thumbnails(data, fmt, [width for _, width in missing])
+            for (name, _), thumbnail in zip(missing, encoded):
+                _write_image(filepath.with_name(name), thumbnail)
+                sizes[name] = len(thumbnail)
+                _stats.incr("thumbnails_written")
+            for name, size in sizes.items():
+                slot.manifest.add(name, slot.key, slot.exec_count, slot.idx, size, None)
+    except Exception:
+        _stats.incr("thumbnail_failures")
+
+
+def _schedule_thumbnails(slot: "_ImageSlot", filepath: Path, data: bytes, fmt: str,
+                         plan: Optional[_thumbnails._Plan]) -> None:
+    """Queues the thumbnails of an image; the cell only waits when the queue is full."""
+    if plan is None or not plan.thumbnails:
+        return
+    job = _get_optimizer().submit(filepath.name, lambda: _write_thumbnails(slot, filepath, data, fmt, plan))
+    with _thumbnail_lock:
+        _thumbnail_jobs.add(job)
+
+
+def _flush_thumbnails() -> None:
+    """Waits for the thumbnail jobs of the finished cell, so none of them
+    records files for an execution that a rerun has already released."""
+    with _thumbnail_lock:
+        jobs = set(_thumbnail_jobs)
+        _thumbnail_jobs.clear()
+    if jobs:
+        with _stats.timer("thumbnail_wait"):
+            wait(jobs)
+
+
+def _thumbnail_img_attrs(img_src: str, plan: _thumbnails._Plan) -> str:
+    attrs = f' loading="lazy" width="{plan.width}" height="{plan.height}"'
+    if plan.srcset:
+        base = posixpath.dirname(img_src)
+        candidates = ", ".join(
+            # Spaces and commas separate srcset candidates
+            posixpath.join(base, name).replace(" ", "%20").replace(",", "%2C") + f" {density}"
+            for name, density in plan.srcset
+        )
+        attrs += f' srcset="{candidates}"'
+    return attrs
+
+
+def _get_render_cache() -> _cache._RenderCache:
+    """Returns the render cache, recreating it if its bounds changed."""
+    global _render_cache
+    opts = _config.options
+    if _render_cache is None or (_render_cache.max_entries, _render_cache.max_bytes) != (
+        opts.render_cache_size, opts.render_cache_bytes
+    ):
+        _render_cache = _cache._RenderCache(opts.render_cache_size, opts.render_cache_bytes)
+    return _render_cache
+
+
+def _report_write_failures(failures) -> None:
+    """Surfaces background write failures as a single warning."""
+    if not failures:
+        return
+    _stats.incr("write_failures", len(failures))
+    for label, error in failures:
+        _stats.log_event("write_failed", file=label, error=repr(error))
+    details = "; ".join(f"{label}: {error!r}" for label, error in failures[:5])
+    more = f" (and {len(failures) - 5} more)" if len(failures) > 5 else ""
+    warnings.warn(f"dietnb failed to write {len(failures)} figure(s): {details}{more}", RuntimeWarning)
+
+
+def _flush_batch() -> None:
+    """Waits for figures rendered on worker processes and reports failures."""
+    _report_write_failures(_batch.flush())
+
+
+def _flush_background_writes() -> None:
+    """Waits for outstanding background writes and reports failures."""
+    if _writer is None:
+        return
+    with _stats.timer("flush_wait"):
+        failures = _writer.flush()
+    _report_write_failures(failures)
+
+
+def _render_figure(fig: Figure, fmt: str, dpi: int) -> bytes:
+    """Renders the figure into memory and returns the encoded bytes."""
+    opts = _config.options
+    if opts.encoder == "fast" and fmt == "png":
+        started = time.perf_counter()
+        data, encode_seconds = _formats.render_png_fast(fig, dpi, opts.fast_compress_level)
+        _stats.observe("render", time.perf_counter() - started)
+        _stats.observe("encode", encode_seconds)
+        return data
+    buffer = io.BytesIO()
+    with _stats.timer("render"):
+        _formats.save_figure(fig, buffer, fmt, dpi)
+    return buffer.getvalue()
+
+
+@dataclass(frozen=True)
+class _Rendering:
+    """Encoded figure and the format/dpi it was finally rendered with."""
+
+    data: bytes
+    fmt: str
+    dpi: int
+    # Which budget changed the rendering ("pixels" or "bytes"), if any
+    budget: Optional[str] = None
+
+
+def _budget_key() -> str:
+    opts = _config.options
+    return f"{opts.max_image_bytes}|{opts.max_image_pixels}|{opts.min_dpi}"
+
+
+def _dpi_within_pixel_budget(fig: Figure, dpi: int) -> int:
+    """Lowers ``dpi`` so the figure stays within ``max_image_pixels``."""
+    opts = _config.options
+    if opts.max_image_pixels is None:
+        return dpi
+    width, height = fig.get_size_inches()
+    area = width * height
+    if area <= 0 or area * dpi * dpi <= opts.max_image_pixels:
+        return dpi
+    return max(opts.min_dpi, min(dpi, int(math.sqrt(opts.max_image_pixels / area))))
+
+
+def _render_within_budget(fig: Figure, fmt: str, dpi: int, budget: Optional[str]) -> _Rendering:
+    """Renders the figure, lowering dpi and then switching format until it
+    fits ``max_image_bytes``. Returns the smallest attempt if nothing fits."""
+    opts = _config.options
+    limit = opts.max_image_bytes
+    best = _Rendering(_render_figure(fig, fmt, dpi), fmt, dpi, budget)
+    if limit is None or len(best.data) <= limit:
+        return best
+
+    def attempt(fmt: str, dpi: int) -> Optional[_Rendering]:
+        nonlocal best
+        try:
+            rendering = _Rendering(_render_figure(fig, fmt, dpi), fmt, dpi, "bytes")
+        except Exception:  # e.g. no WebP support in Pillow
+            return None
+        if len(rendering.data) < len(best.data):
+            best = rendering
+        return rendering if len(rendering.data) <= limit else None
+
+    if fmt == "svg":
+        # A vector file does not shrink with dpi; rasterize instead
+        fmt = opts.auto_raster_format
+        fitted = attempt(fmt, dpi)
+        if fitted is not None:
+            return fitted
+    size = len(best.data)
+    for _ in range(4):
+        if dpi <= opts.min_dpi:
+            break
+        # Raster size grows roughly with the pixel count, i.e. dpi squared
+        dpi = max(opts.min_dpi, min(dpi - 1, int(dpi * math.sqrt(limit / size) * 0.9)))
+        fitted = attempt(fmt, dpi)
+        if fitted is not None:
+            _stats.incr("budget_dpi_reduced")
+            return fitted
+        size = len(best.data) if best.dpi == dpi else size * 0.8
+    for fallback in ("webp", "jpeg"):
+        if fallback != fmt:
+            fitted = attempt(fallback, dpi)
+            if fitted is not None:
+                _stats.incr("budget_format_changed")
+                return fitted
+    _stats.incr("budget_exceeded")
+    if best.budget is None:
+        best = _Rendering(best.data, best.fmt, best.dpi, "bytes")
+    return best
+
+
+def _write_atomically(filepath: Path, data: bytes) -> None:
+    # Hidden names are ignored by the manifest and by cleanup
+    temp = filepath.with_name(f".{filepath.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        temp.write_bytes(data)
+        os.replace(temp, filepath)
+    except BaseException:
+        try:
+            temp.unlink()
+        except OSError:
+            pass
+        raise
+
+
+def _write_image(filepath: Path, data: bytes) -> None:
+    """Writes image bytes, recreating the directory if it vanished mid-execution.
+
+    The bytes go to a temporary file that is renamed into place, so readers
+    and other kernels writing the same name never see a partial file.
+    """
+    with _stats.timer("write"):
+        try:
+            _write_atomically(filepath, data)
+        except FileNotFoundError:
+            # The directory is only created once per execution; it may have
+            # been removed since then.
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            _write_atomically(filepath, data)
+    _stats.incr("bytes_written", len(data))
+
+
+def _figure_failed(stage: str, error: BaseException, filename: Optional[str] = None) -> None:
+    """Counts (and logs) a figure that fell back to the default display."""
+    _stats.incr("figure_failures")
+    _stats.incr(f"failures_{stage}")
+    _stats.log_event("figure_failed", stage=stage, file=filename, error=repr(error))
+
+
+def _figure_format(fig: Figure) -> str:
+    """Returns the configured image format, resolving "auto" for this figure."""
+    opts = _config.options
+    if opts.format != "auto":
+        return opts.format
+    return _formats.choose_format(fig, opts.auto_max_vector_elements, opts.auto_raster_format)
+
 
-    # Determine target directory dynamically (no folder_prefix)
-    image_dir = _get_notebook_image_dir(ip)
+def _claim_assets(dir_key: str, key: str, exec_count: int) -> bool:
+    """Returns True if this figure's output should carry the compact assets.
+
+    They are emitted with the first figure of the session and again when the
+    cell whose output holds them runs anew, since that output is replaced.
+    """
+    owner = _asset_owners.get(dir_key)
+    if owner is not None and (owner[0] != key or owner[1] == exec_count):
+        return False
+    _asset_owners[dir_key] = (key, exec_count)
+    return True
+
+
+def _reset_assets() -> None:
+    """Makes the next compact figure carry the assets again."""
+    _asset_owners.clear()
+
+
+class _Stages:
+    """Per-stage durations of one saved image, recorded as "stage_<name>" timers."""
+
+    __slots__ = ("started", "mark", "samples")
+
+    def __init__(self):
+        self.started = self.mark = time.perf_counter()
+        self.samples: Dict[str, float] = {}
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.samples[f"stage_{stage}"] = now - self.mark
+        self.mark = now
+
+    def finish(self, total: str) -> Dict[str, float]:
+        self.samples[total] = self.mark - self.started
+        _stats.observe_many(self.samples)
+        return self.samples
+
+
+@dataclass(frozen=True)
+class _ImageSlot:
+    """Where the next image of the current cell execution goes."""
+
+    context: _ResolutionContext
+    key: str
+    exec_count: int
+    idx: int
+    manifest: _manifest._DirectoryManifest
+
+    def cell_filename(self, ext: str) -> str:
+        # Filename format: {exec_count}_{fig_index}_{cell_key}{ext}, or
+        # {exec_count}_{fig_index}_{namespace}_{cell_key}{ext} with a namespace
+        namespace = _config.options.namespace
+        if namespace:
+            return f"{self.exec_count}_{self.idx}_{namespace}_{self.key}{ext}"
+        return f"{self.exec_count}_{self.idx}_{self.key}{ext}"
+
+
+def _claim_image_slot(ip, stages: _Stages) -> _ImageSlot:
+    """Registers one more image for the running cell, releasing the images of
+    its previous execution on the first one."""
+    # Determine target directory dynamically (no folder_prefix); resolved
+    # once per cell execution and shared by all of its figures.
+    context = _get_resolution_context(ip)
+    dir_key = context.dir_key
 
     key = _get_cell_key(ip)
     # Use execution_count if available, otherwise fallback (timestamp for uniqueness)
     exec_count = getattr(ip, "execution_count", None)
     if exec_count is None:
         exec_count = int(time.time() * 1000)
+    stages.lap("resolve")
 
-    idx, is_new_exec = _registry.register(image_dir, key, exec_count)
+    idx, is_new_exec = _registry.register(dir_key, key, exec_count)
+    manifest = _manifest.get_manifest(dir_key, _config.options.persistent_manifest)
+    stages.lap("registry")
     if is_new_exec:
-        _delete_previous_cell_images(image_dir, key)
-
-
-    # Filename format: {exec_count}_{fig_index}_{cell_key}.png
-    filename = f"{exec_count}_{idx}_{key}.png"
-    filepath = image_dir / filename
-    notebook_path = _resolve_notebook_path(ip)
-
-    try:
-        fig.savefig(filepath, dpi=dpi, bbox_inches="tight", format=fmt)
-    except Exception:
-        return None # Indicate failure
-
-    img_src = _img_src_relative_path(filepath, notebook_path)
+        manifest.release_cell(key, only=_in_namespace)
+        if _config.options.storage == "cell":
+            _delete_orphaned_images(manifest)
+        # Content-addressed files may be written again by this execution, so
+        # their deletion waits until the cell has finished.
+        stages.lap("cleanup")
+    return _ImageSlot(context, key, exec_count, idx, manifest)
+
+
+def _store_image(slot: _ImageSlot, filepath: Path, data: bytes, fmt: str,
+                 digest: Optional[str] = None) -> None:
+    """Writes an image and records it in the directory manifest."""
+    _write_image(filepath, data)
+    slot.manifest.add(filepath.name, slot.key, slot.exec_count, slot.idx, len(data),
+                      digest or hashlib.sha256(data).hexdigest())
+    if _config.options.optimize and fmt == "png":
+        _schedule_optimization(slot.manifest, filepath)
+
+
+def _async_img_attrs() -> str:
+    return _COMPACT_ASYNC_IMG_ATTRS if _config.options.output == "compact" else _ASYNC_IMG_ATTRS
+
+
+def _image_html(ip, slot: _ImageSlot, filepath: Path, img_attrs: str,
+                thumbnails: Optional[_thumbnails._Plan] = None) -> str:
+    """Returns the output HTML referencing a saved image."""
+    img_src = _paths.img_src_relative_path(filepath, slot.context.notebook_path)
+    filename = filepath.name
+    if thumbnails is not None:
+        img_attrs = _thumbnail_img_attrs(img_src, thumbnails) + img_attrs
+        if thumbnails.srcset and _config.options.output != "compact":
+            # COMPACT_ASSETS handles the fallback in compact output
+            img_attrs = img_attrs.replace(_ASYNC_IMG_ATTRS, "") + _THUMBNAIL_IMG_ATTRS
 
     # Check if running in VS Code to add cache-busting query string specifically for it
     # ip is the IPython instance passed to _save_figure_and_get_html
@@ -250,28 +751,412 @@ def _save_figure_and_get_html(fig: Figure, ip, fmt="png", dpi=150) -> Optional[s
             # Placeholder: VS Code specific adjustments could be applied here if needed.
             img_src = f"{img_src}"
 
+    if _config.options.output == "compact":
+        html = _templates.COMPACT_HTML.format(
+            img_src=img_src,
+            filename=filename,
+            img_attrs=img_attrs,
+        )
+        if _claim_assets(slot.context.dir_key, slot.key, slot.exec_count):
+            html = _templates.COMPACT_ASSETS + html
+        return html
     # Generate HTML with copy button using template
-    html_body = _templates.COPY_BUTTON_HTML.format(
+    return _templates.COPY_BUTTON_HTML.format(
         img_src=img_src,
-        filename=filename
+        filename=filename,
+        img_attrs=img_attrs,
+    ) + _templates.COPY_BUTTON_SCRIPT
+
+
+def _save_figure_and_get_html(fig: Figure, ip, fmt=None, dpi=None) -> Optional[str]:
+    """Saves the figure to a file and returns an HTML img tag.
+
+    ``fmt`` and ``dpi`` default to the ``format`` and ``dpi`` options.
+    """
+    if not ip:
+        return None
+
+    stages = _Stages()
+    slot = _claim_image_slot(ip, stages)
+    image_dir = slot.context.image_dir
+
+    if fmt is None:
+        fmt = _figure_format(fig)
+    if dpi is None:
+        dpi = _config.options.dpi
+    requested_dpi = dpi
+    dpi = _dpi_within_pixel_budget(fig, dpi)
+    budget = "pixels" if dpi != requested_dpi else None
+    async_writes = _config.options.async_writes
+    size: Optional[int] = None
+    img_attrs = ""
+    thumbnails: Optional[_thumbnails._Plan] = None
+    release = _config.options.release_figures
+
+    cache = _get_render_cache() if _config.options.render_cache else None
+    fingerprint = (
+        _cache.figure_fingerprint(fig, fmt, dpi, _budget_key()) if cache is not None else None
+    )
+    cache_slot = (slot.context.dir_key, slot.key, slot.idx)
+    # Looked up once, so each figure counts as one render cache hit or miss
+    cached = cache.lookup(cache_slot, fingerprint) if cache is not None else None
+
+    def produce() -> _Rendering:
+        # Reuse the bytes of the previous execution when the figure is unchanged
+        if cached is not None:
+            return cached[1]
+        rendering = _render_within_budget(fig, fmt, dpi, budget)
+        if cache is not None:
+            cache.put(cache_slot, fingerprint, rendering.data, rendering)
+        return rendering
+
+    def draw() -> Callable[[], _Rendering]:
+        """Draws the figure now and returns a function that finishes encoding it."""
+        if cached is not None:
+            return lambda: cached[1]
+        if fmt not in _formats.RASTER_FORMATS:
+            rendering = produce()
+            return lambda: rendering
+        opts = _config.options
+        with _stats.timer("render"):
+            frame = _formats.draw_frame(fig, dpi)
+
+        def encode() -> _Rendering:
+            with _stats.timer("encode"):
+                data = _formats.encode_frame(frame, fmt, opts.encoder, opts.fast_compress_level)
+            rendering = _Rendering(data, fmt, dpi, budget)
+            if cache is not None:
+                cache.put(cache_slot, fingerprint, data, rendering)
+            return rendering
+
+        return encode
+
+    if _config.options.storage == "content" or _config.options.max_image_bytes is not None:
+        # The name depends on the rendered bytes (content storage) or on the
+        # format the byte budget settles on, so render here and only hand the
+        # disk write to the background pool.
+        try:
+            rendering = produce()
+        except Exception as error:
+            _figure_failed("render", error)
+            return None
+        fmt, dpi, budget = rendering.fmt, rendering.dpi, rendering.budget
+        size = len(rendering.data)
+        saved = _save_image_bytes(slot, rendering.data, fmt)
+        if saved is None:
+            return None
+        filepath, pending = saved
+        if pending:
+            img_attrs = _async_img_attrs()
+        thumbnails = _thumbnail_plan(filepath.name, fmt, rendering.data)
+        _schedule_thumbnails(slot, filepath, rendering.data, fmt, thumbnails)
+    else:
+        filepath = image_dir / slot.cell_filename(_formats.EXTENSIONS[fmt])
+        batched = False
+        if _batch.workers() and cached is None:
+            # Rasterize on a worker process; as with async writes the final
+            # filename is already known, so the output is returned right away.
+            thumbnails = _thumbnail_plan(filepath.name, fmt, size=_estimated_size(fig, dpi))
+
+            def store_rendered(data: bytes) -> None:
+                if cache is not None:
+                    cache.put(cache_slot, fingerprint, data, _Rendering(data, fmt, dpi, budget))
+                _store_image(slot, filepath, data, fmt)
+                _schedule_thumbnails(slot, filepath, data, fmt, thumbnails)
+
+            batched = _batch.submit(fig, fmt, dpi, filepath.name, store_rendered)
+        if batched:
+            img_attrs = _async_img_attrs()
+        elif async_writes:
+            # The final filename is already known, so the HTML can be returned
+            # immediately while the pool encodes and writes the file. The figure
+            # is drawn here, since the cell may change it afterwards and Agg
+            # must not draw on several threads.
+            try:
+                encode = draw()
+            except Exception as error:
+                _figure_failed("render", error, filepath.name)
+                return None
+            thumbnails = _thumbnail_plan(filepath.name, fmt, size=_estimated_size(fig, dpi))
+
+            def encode_and_store():
+                rendering = encode()
+                _store_image(slot, filepath, rendering.data, rendering.fmt)
+                _schedule_thumbnails(slot, filepath, rendering.data, rendering.fmt, thumbnails)
+
+            _get_writer().submit(filepath.name, encode_and_store)
+            img_attrs = _async_img_attrs()
+        else:
+            try:
+                rendering = produce()
+                size = len(rendering.data)
+                _store_image(slot, filepath, rendering.data, rendering.fmt)
+            except Exception as error:
+                _figure_failed("save", error, filepath.name)
+                return None # Indicate failure
+            thumbnails = _thumbnail_plan(filepath.name, rendering.fmt, rendering.data)
+            _schedule_thumbnails(slot, filepath, rendering.data, rendering.fmt, thumbnails)
+    stages.lap("save")
+    if budget is not None:
+        img_attrs += (
+            f' data-dietnb-budget="{budget}" data-dietnb-dpi="{dpi}" data-dietnb-format="{fmt}"'
+        )
+
+    html = _image_html(ip, slot, filepath, img_attrs, thumbnails)
+    stages.lap("template")
+    if _config.options.memory_report:
+        _memory.sample()
+    if release:
+        _release_figure(fig)
+    _stats.incr("figures_saved")
+    _stats.incr(f"format_{fmt}")
+    if budget is not None:
+        _stats.incr(f"budget_{budget}")
+    samples = stages.finish("figure_latency")
+    if _stats.logging_enabled():
+        _stats.log_event(
+            "figure", file=filepath.name, cell=slot.key, exec_count=slot.exec_count, format=fmt,
+            dpi=dpi, bytes=size, background=size is None, budget=budget,
+            ms={name: round(seconds * 1000.0, 3) for name, seconds in samples.items()},
+        )
+    return html
+
+
+def _save_image_bytes(slot: _ImageSlot, data: bytes, fmt: str,
+                      ext: Optional[str] = None) -> Optional[Tuple[Path, bool]]:
+    """Stores already encoded image (or sidecar) bytes for ``slot``.
+
+    The write goes to the background pool with ``async_writes``; with content
+    storage an existing identical file is reused. Returns the path and whether
+    the write is still pending, or None on failure.
+    """
+    ext = ext or _formats.EXTENSIONS[fmt]
+    digest = None
+    if _config.options.storage == "content":
+        digest = hashlib.sha256(data).hexdigest()
+        filename = f"{digest[:CONTENT_DIGEST_LENGTH]}{ext}"
+    else:
+        filename = slot.cell_filename(ext)
+    filepath = slot.context.image_dir / filename
+    if digest is not None and filepath.exists():
+        _stats.incr("dedupe_hits")
+        slot.manifest.add(filename, slot.key, slot.exec_count, slot.idx, len(data), digest)
+    elif _config.options.async_writes:
+        _get_writer().submit(filename, lambda: _store_image(slot, filepath, data, fmt, digest))
+        return filepath, True
+    else:
+        try:
+            _store_image(slot, filepath, data, fmt, digest)
+        except OSError as error:
+            _figure_failed("write", error, filename)
+            return None
+    return filepath, False
+
+
+def _save_image_data_and_get_html(ip, data: bytes, fmt: str, image_metadata=None) -> Optional[str]:
+    """Saves encoded image bytes from a display mimebundle like a figure and
+    returns the same HTML."""
+    stages = _Stages()
+    slot = _claim_image_slot(ip, stages)
+    saved = _save_image_bytes(slot, data, fmt)
+    if saved is None:
+        return None
+    filepath, pending = saved
+    stages.lap("save")
+
+    img_attrs = _async_img_attrs() if pending else ""
+    thumbnails = None
+    if isinstance(image_metadata, dict) and ("width" in image_metadata or "height" in image_metadata):
+        # e.g. IPython.display.Image(width=...)
+        for dimension in ("width", "height"):
+            value = image_metadata.get(dimension)
+            if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+                img_attrs += f' {dimension}="{int(value)}"'
+    else:
+        thumbnails = _thumbnail_plan(filepath.name, fmt, data)
+        _schedule_thumbnails(slot, filepath, data, fmt, thumbnails)
+
+    html = _image_html(ip, slot, filepath, img_attrs, thumbnails)
+    stages.lap("template")
+    _stats.incr("images_externalized")
+    _stats.incr("image_bytes_externalized", len(data))
+    samples = stages.finish("image_latency")
+    if _stats.logging_enabled():
+        _stats.log_event(
+            "image", file=filepath.name, cell=slot.key, exec_count=slot.exec_count, format=fmt,
+            bytes=len(data), background=pending,
+            ms={name: round(seconds * 1000.0, 3) for name, seconds in samples.items()},
+        )
+    return html
+
+
+def _format_size(size: int) -> str:
+    for unit in ("bytes", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size:.0f} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _save_sidecar_and_get_html(ip, kind: str, value, plain: Optional[str] = None) -> Optional[str]:
+    """Writes a large output to a sidecar file and returns a preview linking to it."""
+    stages = _Stages()
+    slot = _claim_image_slot(ip, stages)
+    ext, _ = _sidecar.KINDS[kind]
+    data = _sidecar.encode(kind, value)
+    saved = _save_image_bytes(slot, data, kind, ext)
+    if saved is None:
+        return None
+    filepath, pending = saved
+    stages.lap("save")
+
+    text, truncated = _sidecar.preview(kind, value, plain, _config.options.sidecar_preview_chars)
+    html = _templates.SIDECAR_HTML.format(
+        preview=html_lib.escape(text),
+        note="Output truncated by dietnb." if truncated else "Output moved by dietnb.",
+        src=_paths.img_src_relative_path(filepath, slot.context.notebook_path),
+        filename=filepath.name,
+        size=_format_size(len(data)),
     )
-    
-    return html_body + _templates.COPY_BUTTON_SCRIPT
+    stages.lap("template")
+    _stats.incr("sidecars_written")
+    _stats.incr("sidecar_bytes", len(data))
+    samples = stages.finish("sidecar_latency")
+    if _stats.logging_enabled():
+        _stats.log_event(
+            "sidecar", file=filepath.name, cell=slot.key, exec_count=slot.exec_count, kind=kind,
+            bytes=len(data), background=pending,
+            ms={name: round(seconds * 1000.0, 3) for name, seconds in samples.items()},
+        )
+    return html
+
+
+def _utf8_size_at_least(text: str, limit: int) -> bool:
+    # A character takes at most 4 bytes in UTF-8; only encode when it matters
+    if len(text) >= limit:
+        return True
+    return len(text) * 4 >= limit and len(text.encode("utf-8")) >= limit
+
+
+def _move_to_sidecar(ip, data: dict, metadata: dict) -> Tuple[dict, dict]:
+    """Replaces a large HTML, JSON or text output with a preview and a link."""
+    limit = _config.options.sidecar_min_bytes
+    plain = data.get("text/plain")
+    plain = plain if isinstance(plain, str) else None
+    markup = data.get("text/html")
+    if isinstance(markup, str) and "dietnb-" not in markup and _utf8_size_at_least(markup, limit):
+        kind, value = "html", markup
+    elif "application/json" in data and "text/html" not in data:
+        value = data["application/json"]
+        if not _utf8_size_at_least(value if isinstance(value, str) else json.dumps(value), limit):
+            return data, metadata
+        kind = "json"
+    elif plain is not None and set(data) == {"text/plain"} and _utf8_size_at_least(plain, limit):
+        kind, value = "text", plain
+    else:
+        return data, metadata
+
+    try:
+        html = _save_sidecar_and_get_html(ip, kind, value, plain)
+    except Exception as error:
+        _figure_failed("sidecar", error)
+        return data, metadata
+    if html is None:
+        return data, metadata
+    _, mimetype = _sidecar.KINDS[kind]
+    data = {k: v for k, v in data.items() if k != mimetype}
+    if plain is not None:
+        data["text/plain"] = _sidecar.truncate(plain, _config.options.sidecar_preview_chars)[0]
+    data["text/html"] = html
+    metadata = {k: v for k, v in metadata.items() if k != mimetype}
+    return data, metadata
+
+
+@contextmanager
+def _sidecar_output(min_bytes: Optional[int] = None):
+    """Captures stdout/stderr of the block and shows it as a sidecar preview
+    when it reaches ``min_bytes``; smaller output is printed unchanged."""
+    from IPython.display import display
+    from IPython.utils.capture import capture_output
+
+    ip = get_ipython()
+    if min_bytes is None:
+        min_bytes = _config.options.sidecar_min_bytes or 0
+    captured = capture_output(stdout=True, stderr=True, display=False)
+    output = captured.__enter__()
+    try:
+        yield
+    finally:
+        captured.__exit__(None, None, None)
+        text = output.stdout + output.stderr
+        html = None
+        if ip and text and _utf8_size_at_least(text, min_bytes):
+            html = _save_sidecar_and_get_html(ip, "text", text)
+        if html is None:
+            sys.stdout.write(output.stdout)
+            sys.stderr.write(output.stderr)
+        else:
+            preview = _sidecar.truncate(text, _config.options.sidecar_preview_chars)[0]
+            display({"text/html": html, "text/plain": preview}, raw=True)
+
+
+def _externalize_mimebundle(ip, data: dict, metadata: dict) -> Tuple[dict, dict]:
+    """Replaces a large PNG/JPEG in a formatted mimebundle with dietnb's HTML."""
+    if "text/html" in data:
+        # The object renders itself as HTML, which frontends prefer anyway
+        return data, metadata
+    for mimetype, fmt in _display.EXTERNAL_MIMETYPES.items():
+        payload = data.get(mimetype)
+        if payload is None:
+            continue
+        if isinstance(payload, str):
+            try:
+                payload = base64.b64decode(payload, validate=False)
+            except (binascii.Error, ValueError):
+                return data, metadata
+        if not isinstance(payload, bytes) or len(payload) < _config.options.externalize_min_bytes:
+            return data, metadata
+        try:
+            html = _save_image_data_and_get_html(ip, payload, fmt, metadata.get(mimetype))
+        except Exception as error:
+            _figure_failed("externalize", error)
+            return data, metadata
+        if html is None:
+            return data, metadata
+        data = {k: v for k, v in data.items() if k not in _display.EXTERNAL_MIMETYPES}
+        data["text/html"] = html
+        metadata = {k: v for k, v in metadata.items() if k not in _display.EXTERNAL_MIMETYPES}
+        return data, metadata
+    return data, metadata
+
 
 def _no_op_repr_png(fig: Figure):
     """Prevents the default PNG representation."""
     return None
 
 
-def _delete_previous_cell_images(image_dir: Path, cell_key: str) -> None:
-    """Removes images generated by prior executions of the same cell."""
-    pattern = f"*_*_{cell_key}.png"
-    for old_file in image_dir.glob(pattern):
+def _in_namespace(name: str) -> bool:
+    """Whether ``name`` belongs to the ``namespace`` of this kernel.
+
+    Cell files of another namespace (or of none, for a namespaced kernel) are
+    left to ``clean_unused``; content-addressed files are shared by all.
+    """
+    if _manifest.parse_image_name(name) is None:
+        return True
+    return _manifest.parse_namespace(name) == _config.options.namespace
+
+
+def _delete_orphaned_images(manifest: _manifest._DirectoryManifest) -> None:
+    """Removes files released by their cells that no cell references anymore."""
+    for name in manifest.pop_orphans():
         try:
-            old_file.unlink()
+            (manifest.directory / name).unlink()
+        except FileNotFoundError:
+            pass
         except OSError:
             # Best effort cleanup; ignore permission issues.
-            pass
+            continue
+        manifest.discard(name)
+        _stats.incr("files_deleted")
 
 def _patch_figure_reprs(ip):
     """Applies the monkey-patches to the Figure class."""
@@ -279,12 +1164,16 @@ def _patch_figure_reprs(ip):
     if not ip:
         return
 
-    # Disable default PNG embedding
+    # Disable default PNG embedding. With the format hook, Figures are kept
+    # out of the PNG formatter by the hook instead, and other objects' PNGs
+    # are written to files.
+    externalize = _config.options.externalize_min_bytes is not None
     try:
         if hasattr(ip.display_formatter.formatters['image/png'], 'enabled'):
-             ip.display_formatter.formatters['image/png'].enabled = False
-    except KeyError:
+             ip.display_formatter.formatters['image/png'].enabled = externalize
+    except (AttributeError, KeyError):
         pass
+    _display.update(ip)
 
     # Patch Figure methods
     Figure._repr_png_ = _no_op_repr_png
@@ -307,6 +1196,7 @@ def _restore_figure_reprs(ip):
              ip.display_formatter.formatters['image/png'].enabled = True
     except KeyError:
         pass # Ignore if formatter doesn't exist
+    _display.remove(ip)
 
     _patch_applied = False
 
@@ -316,6 +1206,15 @@ def _post_cell_cleanup_and_repatch(ip):
     if not ip:
         return
 
+    # Make sure every figure displayed by the cell is on disk before moving on
+    _flush_batch()
+    _flush_background_writes()
+    _flush_thumbnails()
+    for manifest in _manifest.all_manifests():
+        _delete_orphaned_images(manifest)
+    _manifest.settle_all()
+    cell_key = _get_cell_key(ip) if _config.options.memory_report else None
+
     # Close all figures to prevent memory leaks and duplicate output
     # plt.close should be safe regardless of saving directory
     try:
@@ -326,11 +1225,28 @@ def _post_cell_cleanup_and_repatch(ip):
     except Exception:
         pass
 
+    if cell_key is not None:
+        entry = _memory.finish_cell(cell_key, getattr(ip, "execution_count", None))
+        if entry is not None:
+            _stats.log_event("cell_memory", **entry)
+
     # Re-apply patches in case the backend was changed or reset
     _patch_figure_reprs(ip)
 
-def _clean_unused_images_logic() -> dict:
-    """Deletes image files whose keys are not in the current state *for the current context*."""
+CLEAN_MODES = ("session", "notebook")
+
+
+def _clean_unused_images_logic(mode: str = "session", dry_run: bool = False) -> dict:
+    """Deletes image files whose keys are not in the current state *for the current context*.
+
+    ``mode="session"`` decides from the cells known to this kernel (and the
+    latest run of other cells); ``mode="notebook"`` keeps exactly the images
+    referenced by the saved notebook plus those of cells run in this session.
+    With ``dry_run`` nothing is deleted and ``deleted`` lists what would be.
+    """
+    if mode not in CLEAN_MODES:
+        raise ValueError(f"mode must be one of {', '.join(CLEAN_MODES)}.")
+
     deleted_files = []
     failed_deletions = []
     kept_files = []
@@ -340,44 +1256,88 @@ def _clean_unused_images_logic() -> dict:
         return {"deleted": [], "failed": [], "kept": [], "message": "Cleanup skipped: Not in IPython."}
 
     # Determine the directory for the *current* context (no folder_prefix)
-    image_dir = _get_notebook_image_dir(ip)
+    notebook_path = _resolve_notebook_path(ip)
+    image_dir = _paths.image_dir_for_notebook(notebook_path)
 
     if not image_dir.exists():
         return {"deleted": [], "failed": [], "kept": [], "message": f"Image directory '{image_dir.name}' not found."}
 
-    # Get keys relevant *only* to the current directory from the state
-    current_keys_in_state = _registry.active_cell_keys(image_dir)
+    referenced_names: Optional[Set[str]] = None
+    if mode == "notebook":
+        if notebook_path is None or not notebook_path.is_file():
+            return {"deleted": [], "failed": [], "kept": [], "message": "Cleanup skipped: Saved notebook not found."}
+        with _stats.timer("notebook_scan"):
+            referenced_names = _nbscan.referenced_image_names(notebook_path)
+
+    dir_key = _directory_key(image_dir)
+    current_keys_in_state = _registry.active_cell_keys(dir_key)
 
     cleaned_count = 0
     failed_count = 0
     kept_count = 0
 
-    for img_file in image_dir.glob("*.png"):
+    manifest = _manifest.get_manifest(dir_key, _config.options.persistent_manifest)
+    # Other kernels may share the directory; start from what is on disk now
+    manifest.reload()
+    records = manifest.records()
+
+    # Cells not executed in this session (e.g. before a kernel restart) keep
+    # the files of their most recent execution. Files of cells executed in
+    # this session are current only in this kernel's namespace.
+    latest: Dict[str, Tuple[float, int]] = {}
+    for record in records.values():
+        for cell_key, (exec_count, _) in record.refs.items():
+            if cell_key in current_keys_in_state:
+                continue
+            written = (record.written_at or 0.0, exec_count)
+            if cell_key not in latest or written > latest[cell_key]:
+                latest[cell_key] = written
+
+    for name, record in sorted(records.items()):
+        img_file = image_dir / name
+        if not record.managed:
+            # Filename doesn't match a dietnb format, keep it
+            unused = False
+        elif referenced_names is not None:
+            # Unsaved outputs of this session are not in the notebook file yet
+            unused = name not in referenced_names and not (
+                _in_namespace(name) and any(cell_key in current_keys_in_state for cell_key in record.refs)
+            )
+        else:
+            unused = not any(
+                _in_namespace(name) if cell_key in current_keys_in_state
+                else latest[cell_key][1] == exec_count
+                for cell_key, (exec_count, _) in record.refs.items()
+            )
+
+        if not unused:
+            kept_files.append(_relative_to_cwd(img_file))
+            kept_count += 1
+            continue
+        if dry_run:
+            deleted_files.append(_relative_to_cwd(img_file))
+            cleaned_count += 1
+            continue
         try:
-            # Extract key from filename like 'exec_count_idx_key.png'
-            parts = img_file.stem.split('_')
-            if len(parts) >= 3:
-                key_part = parts[-1] # Key is the last part
-                if key_part not in current_keys_in_state:
-                    try:
-                        img_file.unlink()
-                        deleted_files.append(_relative_to_cwd(img_file))
-                        cleaned_count += 1
-                    except OSError:
-                        failed_deletions.append(_relative_to_cwd(img_file))
-                        failed_count += 1
-                else:
-                    kept_files.append(_relative_to_cwd(img_file))
-                    kept_count += 1
-            else:
-                # Filename doesn't match expected format, keep it
-                kept_files.append(_relative_to_cwd(img_file))
-                kept_count += 1
-
-        except Exception:
-            # Catch any other parsing errors and keep the file
+            img_file.unlink()
+        except OSError:
             failed_deletions.append(_relative_to_cwd(img_file))
             failed_count += 1
+            continue
+        manifest.discard(name)
+        deleted_files.append(_relative_to_cwd(img_file))
+        cleaned_count += 1
+    manifest.settle()
+    if not dry_run:
+        _stats.incr("files_deleted", cleaned_count)
+        _stats.incr("delete_failures", failed_count)
+    _stats.log_event(
+        "clean_unused", directory=image_dir.name, mode=mode, dry_run=dry_run,
+        deleted=cleaned_count, failed=failed_count, kept=kept_count,
+    )
 
-    message = f"Cleaned directory '{image_dir.name}'. Deleted: {cleaned_count}, Failed: {failed_count}, Kept: {kept_count}."
-    return {"deleted": deleted_files, "failed": failed_deletions, "kept": kept_files, "message": message}
+    if dry_run:
+        message = f"Dry run for directory '{image_dir.name}'. Would delete: {cleaned_count}, Kept: {kept_count}."
+    else:
+        message = f"Cleaned directory '{image_dir.name}'. Deleted: {cleaned_count}, Failed: {failed_count}, Kept: {kept_count}."
+    return {"deleted": deleted_files, "failed": failed_deletions, "kept": kept_files, "message": message, "dry_run": dry_run}
@@ -0,0 +1,103 @@
+"""
+Display-formatter hook that moves outputs of any object out of the notebook.
+
+Images of at least ``externalize_min_bytes`` and HTML/JSON/text outputs of at
+least ``sidecar_min_bytes`` are saved to the image directory. The hook does
+not need matplotlib, so ``activate(lazy=True)`` installs it right away; this
+module must not import matplotlib or ``dietnb._core``, which is only loaded
+once an output is large enough to be moved.
+"""
+
+import importlib
+import sys
+
+from . import _config, _lazy
+
+# Binary image types taken out of display mimebundles, and their formats
+EXTERNAL_MIMETYPES = {"image/png": "png", "image/jpeg": "jpeg"}
+# Figures are displayed through the patched _repr_html_; keep other
+# renderers (e.g. the inline backend's) from embedding them as well.
+FIGURE_EXCLUDED_MIMETYPES = frozenset(("image/png", "image/jpeg", "image/svg+xml", "application/pdf"))
+# Mimetypes a sidecar file can take over
+_SIDECAR_MIMETYPES = ("text/html", "application/json", "text/plain")
+
+
+def hook_wanted() -> bool:
+    opts = _config.options
+    return opts.externalize_min_bytes is not None or opts.sidecar_min_bytes is not None
+
+
+def _is_figure(obj) -> bool:
+    # Nothing can be a Figure before matplotlib has been imported
+    figure = sys.modules.get("matplotlib.figure")
+    return figure is not None and isinstance(obj, figure.Figure)
+
+
+def _may_move(data: dict) -> bool:
+    """Cheap size check done before ``_core`` is loaded: False only when no
+    output can reach its threshold."""
+    opts = _config.options
+    if opts.externalize_min_bytes is not None and "text/html" not in data:
+        # Base64 text is never shorter than the bytes it encodes
+        if any(len(data.get(mimetype) or "") >= opts.externalize_min_bytes for mimetype in EXTERNAL_MIMETYPES):
+            return True
+    if opts.sidecar_min_bytes is not None:
+        for mimetype in _SIDECAR_MIMETYPES:
+            value = data.get(mimetype)
+            if value is None:
+                continue
+            # A character takes at most 4 bytes in UTF-8
+            if not isinstance(value, str) or len(value) * 4 >= opts.sidecar_min_bytes:
+                return True
+    return False
+
+
+def _load_core():
+    """Imports ``_core``. While activation waits for matplotlib, pyplot is
+    imported first, so the deferred patching sees a fully loaded ``_core``."""
+    if _lazy.pending():
+        importlib.import_module("matplotlib.pyplot")
+    from . import _core
+
+    return _core
+
+
+def install(ip) -> None:
+    """Wraps ``ip.display_formatter.format`` so image outputs of any object,
+    and large HTML/JSON/text outputs, are saved to the image directory
+    instead of embedded in the notebook."""
+    formatter = getattr(ip, "display_formatter", None)
+    original = getattr(formatter, "format", None)
+    if original is None or hasattr(original, "__dietnb_original__"):
+        return
+
+    def format_externalizing_outputs(obj, include=None, exclude=None):
+        is_figure = _is_figure(obj)
+        if is_figure:
+            exclude = FIGURE_EXCLUDED_MIMETYPES.union(exclude or ())
+        data, metadata = original(obj, include=include, exclude=exclude)
+        if is_figure or not _may_move(data):
+            return data, metadata
+        core = _load_core()
+        if _config.options.externalize_min_bytes is not None:
+            data, metadata = core._externalize_mimebundle(ip, data, metadata)
+        if _config.options.sidecar_min_bytes is not None:
+            data, metadata = core._move_to_sidecar(ip, data, metadata)
+        return data, metadata
+
+    format_externalizing_outputs.__dietnb_original__ = original
+    formatter.format = format_externalizing_outputs
+
+
+def remove(ip) -> None:
+    formatter = getattr(ip, "display_formatter", None)
+    if formatter is not None and hasattr(getattr(formatter, "format", None), "__dietnb_original__"):
+        del formatter.format
+
+
+def update(ip) -> None:
+    """Installs or removes the hook as the current options require."""
+    if hook_wanted():
+        install(ip)
+    else:
+        remove(ip)
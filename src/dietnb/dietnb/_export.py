@@ -0,0 +1,283 @@
+"""
+Self-contained exports of dietnb notebooks, used by ``dietnb inline``,
+``dietnb bundle`` and :mod:`dietnb.nbconvert`.
+
+The ``<img src>`` and sidecar links dietnb writes are relative to the
+notebook, so they break once the notebook leaves its folder. Exports either
+put the files back into the outputs (images as ``data:`` URIs, sidecar
+contents as HTML) or pack the notebook with exactly the files it references
+into one zip archive.
+
+Notebooks are streamed in fixed-size chunks as in :mod:`dietnb._convert`;
+the referenced files are read and base64-encoded on a thread pool a bounded
+number of outputs ahead of the writer.
+"""
+
+import base64
+import html as html_lib
+import json
+import os
+import posixpath
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import unquote
+
+from . import _nbscan, _sidecar
+from ._convert import _is_output_path, _Reader, _Walker
+from ._nbscan import CHUNK_SIZE
+
+# Extension -> mimetype of the files dietnb writes
+IMAGE_MIMETYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".svg": "image/svg+xml",
+}
+_SIDECAR_EXTENSIONS = {ext: kind for kind, (ext, _) in _sidecar.KINDS.items()}
+# Already compressed; deflating them again only costs time
+_STORED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+
+_SIZE_ATTR_RE = re.compile(r'\b(width|height)\s*=\s*"(\d+)"', re.I)
+_SRC_RE = re.compile(r'\bsrc\s*=\s*"([^"]*)"', re.I)
+_ALT_RE = re.compile(r'\balt\s*=\s*"([^"]*)"', re.I)
+
+
+def resolve_url(url: str, base_dir: Path) -> Optional[Path]:
+    """Maps a relative ``src``/``href`` written by dietnb to a file path."""
+    if not url or url.startswith(("data:", "#")) or re.match(r"^[a-z][a-z0-9+.-]*://", url, re.I):
+        return None
+    path = Path(unquote(url.split("?", 1)[0].split("#", 1)[0]))
+    return path if path.is_absolute() else base_dir / path
+
+
+def referenced_urls(html: str, thumbnails: bool = False) -> List[str]:
+    """Returns the image and sidecar URLs of one dietnb output, in order.
+
+    Thumbnails in ``srcset`` are only included with ``thumbnails=True``.
+    """
+    if "dietnb-" not in html:
+        return []
+    urls: List[str] = []
+    if "dietnb-img" in html and thumbnails:
+        urls.extend(_nbscan.image_sources(html))
+    elif "dietnb-img" in html:
+        for tag in _nbscan._IMG_TAG_RE.findall(html):
+            match = _SRC_RE.search(tag) if "dietnb-img" in tag else None
+            if match:
+                urls.append(match.group(1))
+    if "dietnb-sidecar" in html:
+        urls.extend(_nbscan.sidecar_links(html))
+    return urls
+
+
+def load_file(path: Path) -> str:
+    """Returns a referenced file as the markup that replaces its link."""
+    ext = path.suffix.lower()
+    if ext in IMAGE_MIMETYPES:
+        return "data:{};base64,{}".format(IMAGE_MIMETYPES[ext], base64.b64encode(path.read_bytes()).decode("ascii"))
+    kind = _SIDECAR_EXTENSIONS.get(ext)
+    text = path.read_text(encoding="utf-8", errors="replace")
+    if kind == "html":
+        return text
+    return f"<pre>{html_lib.escape(text)}</pre>"
+
+
+def inline_html(html: str, base_dir: Path, load: Callable[[Path], str] = load_file) -> Optional[str]:
+    """Returns ``html`` with dietnb images and sidecar links inlined, or None
+    if it has nothing to inline.
+
+    Image outputs are reduced to bare ``<img>`` tags with ``data:`` URIs (the
+    copy/download buttons need the files); sidecar outputs are replaced by
+    the full output. Missing files leave the output unchanged.
+    """
+    urls = referenced_urls(html)
+    if not urls:
+        return None
+    try:
+        if "dietnb-sidecar" in html:
+            (url,) = urls
+            path = resolve_url(url, base_dir)
+            return load(path) if path else None
+        tags = []
+        for tag in _nbscan._IMG_TAG_RE.findall(html):
+            if "dietnb-img" not in tag:
+                continue
+            path = resolve_url(_SRC_RE.search(tag).group(1), base_dir)
+            if path is None:
+                return None
+            alt = _ALT_RE.search(tag)
+            attrs = "".join(f' {name.lower()}="{value}"' for name, value in _SIZE_ATTR_RE.findall(tag))
+            tags.append(
+                f'<img src="{load(path)}" alt="{alt.group(1) if alt else path.name}" class="dietnb-img"{attrs}>'
+            )
+        return "".join(tags)
+    except (OSError, ValueError):
+        return None
+
+
+class _Prefetcher:
+    """Loads files on a thread pool at most ``window`` files ahead of use."""
+
+    def __init__(self, paths: Iterable[Path], jobs: Optional[int], window: Optional[int] = None):
+        jobs = jobs or min(32, (os.cpu_count() or 1) + 4)
+        self._paths = iter(paths)
+        self._window = window or jobs * 4
+        self._pending = deque()
+        self._executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="dietnb-export")
+
+    def _top_up(self) -> None:
+        while len(self._pending) < self._window:
+            path = next(self._paths, None)
+            if path is None:
+                return
+            self._pending.append((path, self._executor.submit(load_file, path)))
+
+    def __call__(self, path: Path) -> str:
+        self._top_up()
+        while self._pending:
+            queued, future = self._pending.popleft()
+            if queued == path:
+                self._top_up()
+                return future.result()
+        return load_file(path)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def _referenced_paths(notebook: Path, chunk_size: int, thumbnails: bool = False) -> List[Path]:
+    paths = []
+    for html in _nbscan.iter_html_outputs(notebook, chunk_size):
+        for url in referenced_urls(html, thumbnails):
+            path = resolve_url(url, notebook.parent)
+            if path is not None:
+                paths.append(path)
+    return paths
+
+
+class _Inline(_Walker):
+    def __init__(self, reader: _Reader, base_dir: Path, load: Callable[[Path], str]):
+        super().__init__(reader)
+        self.base_dir = base_dir
+        self.load = load
+        self.outputs = 0
+
+    def member(self, path: tuple, key: str) -> bool:
+        if key != _nbscan.HTML_MIME or not _is_output_path(path, "data"):
+            return False
+        raw = self.capture_value(path + (key,))
+        value = json.loads(raw)
+        inlined = inline_html("".join(value) if isinstance(value, list) else value, self.base_dir, self.load)
+        if inlined is not None:
+            self.outputs += 1
+            space = raw[:len(raw) - len(raw.lstrip())]
+            raw = space + json.dumps(inlined, ensure_ascii=False)
+        self.r._emit(f'"{key}":{raw}')
+        return True
+
+
+def _replace_atomically(temp: Path, target: Path) -> None:
+    try:
+        os.replace(temp, target)
+    except BaseException:
+        temp.unlink()
+        raise
+
+
+def inline_notebook(notebook: Path, output: Path, jobs: Optional[int] = None,
+                    chunk_size: int = CHUNK_SIZE) -> dict:
+    """Writes a copy of ``notebook`` with its images and sidecars inlined."""
+    notebook, output = Path(notebook), Path(output)
+    paths = _referenced_paths(notebook, chunk_size)
+    prefetch = _Prefetcher(paths, jobs)
+    temp = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+    try:
+        with open(temp, "w", encoding="utf-8", newline="") as out:
+            walker = _Inline(_Reader(notebook, chunk_size, out), notebook.parent, prefetch)
+            walker.document()
+    except BaseException:
+        temp.unlink()
+        raise
+    finally:
+        prefetch.close()
+    _replace_atomically(temp, output)
+    return {
+        "notebook": str(notebook),
+        "output": str(output),
+        "outputs": walker.outputs,
+        "files": len(paths),
+        "bytes": output.stat().st_size,
+    }
+
+
+def inline_notebook_html(notebook: Path, output: Path, jobs: Optional[int] = None) -> dict:
+    """Renders ``notebook`` to a standalone HTML page with nbconvert."""
+    from nbconvert import HTMLExporter
+
+    from .nbconvert import InlineFilesPreprocessor
+
+    exporter = HTMLExporter()
+    preprocessor = InlineFilesPreprocessor(jobs=jobs or 0)
+    exporter.register_preprocessor(preprocessor, enabled=True)
+    temp = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+    try:
+        body, _ = exporter.from_filename(str(notebook), resources={"metadata": {"path": str(notebook.parent)}})
+        with open(temp, "w", encoding="utf-8") as out:
+            out.write(body)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+    _replace_atomically(temp, output)
+    return {
+        "notebook": str(notebook),
+        "output": str(output),
+        "outputs": preprocessor.inlined,
+        "files": preprocessor.files,
+        "bytes": output.stat().st_size,
+    }
+
+
+def bundle_notebook(notebook: Path, output: Path, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Packs ``notebook`` and the files it references into one zip archive.
+
+    Files keep their path relative to the notebook, so the links work again
+    once the archive is extracted. Unreferenced images are left out.
+    """
+    notebook, output = Path(notebook), Path(output)
+    base = notebook.parent.resolve()
+    entries: Dict[str, Path] = {}
+    missing = []
+    for path in _referenced_paths(notebook, chunk_size, thumbnails=True):
+        try:
+            arcname = path.resolve().relative_to(base).as_posix()
+        except ValueError:
+            missing.append(str(path))  # Outside the notebook folder
+            continue
+        if path.is_file():
+            entries.setdefault(arcname, path)
+        else:
+            missing.append(str(path))
+
+    temp = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+    try:
+        with zipfile.ZipFile(temp, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.write(notebook, notebook.name)
+            for arcname, path in sorted(entries.items()):
+                stored = posixpath.splitext(arcname)[1].lower() in _STORED_EXTENSIONS
+                archive.write(path, arcname, compress_type=zipfile.ZIP_STORED if stored else None)
+    except BaseException:
+        temp.unlink()
+        raise
+    _replace_atomically(temp, output)
+    return {
+        "notebook": str(notebook),
+        "output": str(output),
+        "files": len(entries),
+        "missing": missing,
+        "bytes": output.stat().st_size,
+    }
@@ -0,0 +1,202 @@
+"""
+Image formats dietnb can write, the ``format="auto"`` heuristic, the "fast"
+PNG encoder and the split of raster output into drawing and encoding.
+"""
+
+import io
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+
+EXTENSIONS = {
+    "png": ".png",
+    "svg": ".svg",
+    "jpeg": ".jpg",
+    "webp": ".webp",
+}
+# Formats Agg draws into an RGBA frame that Pillow (or the fast encoder) encodes
+RASTER_FORMATS = ("png", "jpeg", "webp")
+
+
+def figure_elements(fig) -> int:
+    """Estimates how many primitives a vector rendering of ``fig`` would contain.
+
+    Returns -1 when the figure holds raster content (images, meshes), which
+    would be embedded as bitmaps in a vector file anyway.
+    """
+    # Imported here: ``dietnb convert`` uses this module without matplotlib
+    from matplotlib.collections import Collection, QuadMesh
+    from matplotlib.image import AxesImage, FigureImage
+    from matplotlib.lines import Line2D
+
+    elements = 0
+    for artist in fig.findobj():
+        if not artist.get_visible():
+            continue
+        if isinstance(artist, (AxesImage, FigureImage)):
+            return -1
+        if isinstance(artist, QuadMesh):
+            array = artist.get_array()
+            elements += array.size if array is not None else 1
+        elif isinstance(artist, Line2D):
+            elements += len(artist.get_xydata())
+        elif isinstance(artist, Collection):
+            elements += max(len(artist.get_offsets()), len(artist.get_paths()))
+        else:
+            elements += 1
+    return elements
+
+
+def choose_format(fig, max_vector_elements: int, raster_format: str = "png") -> str:
+    """Picks SVG for sparse figures and ``raster_format`` for dense or image-based ones."""
+    elements = figure_elements(fig)
+    if 0 <= elements <= max_vector_elements:
+        return "svg"
+    return raster_format
+
+
+def save_figure(fig, target, fmt: str, dpi) -> None:
+    """``savefig`` whose output depends only on the figure.
+
+    SVG files otherwise carry the current date and random clip-path and glyph
+    ids, which defeats content storage and the render cache.
+    """
+    if fmt != "svg":
+        fig.savefig(target, dpi=dpi, bbox_inches="tight", format=fmt)
+        return
+    import matplotlib
+
+    with matplotlib.rc_context({"svg.hashsalt": "dietnb"}):
+        fig.savefig(target, dpi=dpi, bbox_inches="tight", format=fmt, metadata={"Date": None})
+
+
+def _png_chunk(tag: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", len(payload)) + tag + payload + struct.pack(">I", zlib.crc32(tag + payload))
+
+
+def encode_png_rgba(view: memoryview, compress_level: int = 1) -> bytes:
+    """Encodes an (height, width, 4) uint8 RGBA buffer as PNG.
+
+    Rows are fed to zlib straight from ``view`` with PNG filter type 0, which
+    avoids both a pixel copy and the per-row adaptive filtering that makes
+    general-purpose encoders slow on large frames.
+    """
+    height, width = view.shape[:2]
+    stride = width * 4
+    flat = view.cast("B") if view.ndim > 1 else view
+    compressor = zlib.compressobj(compress_level)
+    parts = []
+    for row in range(height):
+        parts.append(compressor.compress(b"\x00"))
+        parts.append(compressor.compress(flat[row * stride:(row + 1) * stride]))
+    parts.append(compressor.flush())
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", header),
+        _png_chunk(b"IDAT", b"".join(parts)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+
+class _RGBASink:
+    """File-like target for ``savefig(format="raw")`` that encodes the frame.
+
+    Agg's raw writer passes the renderer's own RGBA memoryview to ``write``,
+    so the pixels are encoded without being copied.
+    """
+
+    def __init__(self, compress_level: int):
+        self.compress_level = compress_level
+        self.data = b""
+        self.encode_seconds = 0.0
+
+    def seek(self, *args):  # Marks this object as a file handle for matplotlib
+        return 0
+
+    def write(self, buffer) -> int:
+        view = memoryview(buffer)
+        started = time.perf_counter()
+        self.data = encode_png_rgba(view, self.compress_level)
+        self.encode_seconds = time.perf_counter() - started
+        return view.nbytes
+
+
+def render_png_fast(fig, dpi, compress_level: int = 1):
+    """Renders ``fig`` once on Agg and encodes it with a low deflate level.
+
+    Returns the PNG bytes and the seconds spent encoding.
+    """
+    sink = _RGBASink(compress_level)
+    fig.savefig(sink, format="raw", dpi=dpi, bbox_inches="tight")
+    if not sink.data:
+        raise RuntimeError("Agg did not produce an RGBA frame.")
+    return sink.data, sink.encode_seconds
+
+
+@dataclass(frozen=True)
+class _Frame:
+    """A copy of the RGBA pixels Agg drew for a figure."""
+
+    data: bytes
+    width: int
+    height: int
+    dpi: int
+
+
+class _FrameSink:
+    """File-like target for ``savefig(format="raw")`` that copies the frame."""
+
+    def __init__(self):
+        self.data = b""
+        self.shape = (0, 0)
+
+    def seek(self, *args):
+        return 0
+
+    def write(self, buffer) -> int:
+        view = memoryview(buffer)
+        self.shape = view.shape[:2]
+        # The renderer reuses its buffer, so keep a copy
+        self.data = view.tobytes()
+        return view.nbytes
+
+
+def draw_frame(fig, dpi) -> _Frame:
+    """Draws ``fig`` on Agg as ``savefig`` would and returns the pixels.
+
+    Only the drawing touches the figure; ``encode_frame`` can run later, on
+    another thread, and produces the same bytes as ``savefig``.
+    """
+    sink = _FrameSink()
+    fig.savefig(sink, format="raw", dpi=dpi, bbox_inches="tight")
+    if not sink.data:
+        raise RuntimeError("Agg did not produce an RGBA frame.")
+    height, width = sink.shape
+    return _Frame(sink.data, width, height, dpi)
+
+
+def encode_frame(frame: _Frame, fmt: str, encoder: str = "default", compress_level: int = 1) -> bytes:
+    """Encodes a frame from ``draw_frame`` as ``fmt``, like Agg's ``print_<fmt>``."""
+    if fmt == "png" and encoder == "fast":
+        view = memoryview(frame.data).cast("B", (frame.height, frame.width, 4))
+        return encode_png_rgba(view, compress_level)
+    import matplotlib
+    from PIL import Image, PngImagePlugin
+
+    size = (frame.width, frame.height)
+    image = Image.frombuffer("RGBA", size, frame.data, "raw", "RGBA", 0, 1)
+    options = {}
+    if fmt == "png":
+        info = PngImagePlugin.PngInfo()
+        info.add_text("Software", f"Matplotlib version{matplotlib.__version__}, https://matplotlib.org/")
+        options["pnginfo"] = info
+    elif fmt == "jpeg":
+        # Agg blends semi-transparent figures against white for JPEG
+        background = Image.new("RGB", size, (255, 255, 255))
+        background.paste(image, image)
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, dpi=(frame.dpi, frame.dpi), **options)
+    return buffer.getvalue()
@@ -0,0 +1,109 @@
+"""
+Deferred activation: ``activate(lazy=True)`` leaves matplotlib unimported and
+patches ``Figure`` once the user's code imports it.
+
+A finder on ``sys.meta_path`` wraps the loaders of ``matplotlib.pyplot`` and
+``matplotlib.figure`` and calls back after the module has executed. When
+``matplotlib.figure`` is imported as part of ``matplotlib.pyplot``, the
+callback waits for pyplot to finish, since activation imports pyplot itself.
+This module must not import matplotlib or ``dietnb._core``.
+"""
+
+import sys
+import threading
+import warnings
+from importlib.abc import MetaPathFinder
+from typing import Callable, Optional
+
+WATCHED = ("matplotlib.pyplot", "matplotlib.figure")
+
+
+def matplotlib_loaded() -> bool:
+    return "matplotlib.figure" in sys.modules
+
+
+class _NotifyingLoader:
+    """Delegates to the real loader and reports when the module has run."""
+
+    def __init__(self, loader, name: str, hook: "_ImportHook"):
+        self._loader = loader
+        self._name = name
+        self._hook = hook
+
+    def __getattr__(self, attr):  # get_source, get_filename, ... for tracebacks
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module) -> None:
+        self._hook.loading.add(self._name)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._hook.loading.discard(self._name)
+        self._hook.loaded(self._name)
+
+
+class _ImportHook(MetaPathFinder):
+    def __init__(self, callback: Callable[[], None]):
+        self.callback = callback
+        self.loading = set()
+        self._finding = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in WATCHED or getattr(self._finding, "active", False):
+            return None
+        self._finding.active = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding.active = False
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _NotifyingLoader(spec.loader, fullname, self)
+        return spec
+
+    def loaded(self, name: str) -> None:
+        if name == "matplotlib.figure" and "matplotlib.pyplot" in self.loading:
+            return  # Wait for pyplot, which is still importing
+        if uninstall() is not self:
+            return
+        try:
+            self.callback()
+        except Exception as e:
+            warnings.warn(f"dietnb could not activate after matplotlib was imported: {e}", RuntimeWarning)
+
+
+_hook: Optional[_ImportHook] = None
+_lock = threading.Lock()
+
+
+def install(callback: Callable[[], None]) -> None:
+    """Calls ``callback`` once matplotlib has been imported."""
+    global _hook
+    uninstall()
+    with _lock:
+        _hook = _ImportHook(callback)
+        sys.meta_path.insert(0, _hook)
+
+
+def uninstall() -> Optional[_ImportHook]:
+    """Removes the pending hook, if any, and returns it."""
+    global _hook
+    with _lock:
+        hook, _hook = _hook, None
+        if hook is not None and hook in sys.meta_path:
+            sys.meta_path.remove(hook)
+    return hook
+
+
+def pending() -> bool:
+    """True while activation waits for matplotlib to be imported."""
+    return _hook is not None
@@ -0,0 +1,508 @@
+"""
+Manifest of the image files in each dietnb image directory.
+
+The manifest maps every file to the cells that reference it, with execution
+count, figure index, byte size, content hash and write time. It is built
+lazily with a single directory scan and then kept up to date as dietnb writes
+and deletes files, so stale-file deletion and cleanup do not have to list the
+directory again. Changes made outside the kernel are detected cheaply through
+the directory's modification time.
+
+With ``persistent_manifest`` enabled, records are also kept in a small SQLite
+database inside the directory (``.dietnb-manifest.sqlite``). They then survive
+kernel restarts and are shared by every kernel writing to the directory.
+
+Several kernels may write to the same directory at once (parallel papermill
+runs, two open copies of a notebook). A file released by a cell is therefore
+only deleted when no other live kernel may still display it: when this kernel
+wrote it, when its writer has exited, or when its writer is unknown and the
+file predates this kernel.
+"""
+
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from . import _stats
+
+IMAGE_SUFFIXES = (".png", ".svg", ".jpg", ".webp")
+# Large non-image outputs moved out of the notebook (see ``sidecar_min_bytes``)
+SIDECAR_SUFFIXES = (".html", ".txt", ".json")
+OUTPUT_SUFFIXES = IMAGE_SUFFIXES + SIDECAR_SUFFIXES
+MANIFEST_FILENAME = ".dietnb-manifest.sqlite"
+CONTENT_DIGEST_LENGTH = 20
+_CONTENT_STEM_RE = re.compile(rf"^[0-9a-f]{{{CONTENT_DIGEST_LENGTH}}}$")
+
+# Identifies the writing kernel in persistent records
+HOSTNAME = socket.gethostname()
+WRITER_ID = f"{HOSTNAME}:{os.getpid()}"
+PROCESS_START = time.time()
+
+
+def parse_image_name(name: str) -> Optional[Tuple[int, int, str]]:
+    """Parses ``{exec_count}_{index}_{cell_key}.ext`` into its three parts.
+
+    Thumbnails (``{exec_count}_{index}_{cell_key}.w480.ext``) parse like their image.
+    """
+    stem, dot, _ = name.partition(".")
+    if not dot:
+        return None
+    parts = stem.split("_")
+    if len(parts) >= 3 and parts[0].isdigit() and parts[1].isdigit():
+        return int(parts[0]), int(parts[1]), parts[-1]
+    return None
+
+
+def parse_cell_key(name: str) -> Optional[str]:
+    """Returns the cell key of a ``{exec_count}_{index}_{cell_key}`` file name."""
+    parsed = parse_image_name(name)
+    return parsed[2] if parsed else None
+
+
+def parse_namespace(name: str) -> Optional[str]:
+    """Returns the namespace of a ``{exec_count}_{index}_{namespace}_{cell_key}``
+    file name, or None for cell files written without one."""
+    if parse_image_name(name) is None:
+        return None
+    parts = name.partition(".")[0].split("_")
+    return parts[2] if len(parts) == 4 else None
+
+
+def is_content_name(name: str) -> bool:
+    """Whether ``name`` is a content-addressed file written by dietnb."""
+    return bool(_CONTENT_STEM_RE.match(name.partition(".")[0]))
+
+
+def _is_output_name(name: str) -> bool:
+    return name.endswith(OUTPUT_SUFFIXES) and not name.startswith(".")
+
+
+def _writer_alive(writer: str) -> bool:
+    """Whether the kernel ``writer`` (``host:pid``) may still be running."""
+    host, _, pid = writer.rpartition(":")
+    if host != HOSTNAME or not pid.isdigit() or os.name == "nt":
+        return True  # Cannot tell; assume it is
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists, owned by another user
+    return True
+
+
+class _FileRecord:
+    """What the manifest knows about one file."""
+
+    __slots__ = ("size", "content_hash", "written_at", "writer", "refs", "managed")
+
+    def __init__(self, size=None, content_hash=None, written_at=None, managed=True, writer=None):
+        self.size: Optional[int] = size
+        self.content_hash: Optional[str] = content_hash
+        self.written_at: Optional[float] = written_at
+        # ``WRITER_ID`` of the kernel that wrote the file, None if unknown
+        self.writer: Optional[str] = writer
+        # cell key -> (exec_count, figure index) of every referencing cell
+        self.refs: Dict[str, Tuple[int, int]] = {}
+        # False for files dietnb did not write (kept by cleanup)
+        self.managed = managed
+
+
+class _ManifestStore:
+    """SQLite copy of a directory manifest, safe for concurrent kernels.
+
+    Changes are buffered and committed in one ``BEGIN IMMEDIATE`` transaction
+    per cell, and other kernels' commits are detected via ``data_version``.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            name TEXT NOT NULL,
+            cell_key TEXT NOT NULL DEFAULT '',
+            exec_count INTEGER,
+            fig_index INTEGER,
+            size INTEGER,
+            content_hash TEXT,
+            written_at REAL,
+            writer TEXT,
+            PRIMARY KEY (name, cell_key)
+        );
+        CREATE INDEX IF NOT EXISTS files_by_cell ON files (cell_key);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._conn = sqlite3.connect(
+            str(path), timeout=30.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.executescript(self._SCHEMA)
+        self._pending: List[Tuple[str, tuple]] = []
+        self._data_version = self._read_data_version()
+
+    def _read_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def load(self) -> List[tuple]:
+        """Returns all rows as (name, cell_key, exec, index, size, hash, written_at, writer)."""
+        self.flush()
+        rows = self._conn.execute(
+            "SELECT name, cell_key, exec_count, fig_index, size, content_hash, written_at, writer FROM files"
+        ).fetchall()
+        self._data_version = self._read_data_version()
+        return rows
+
+    def record(self, name, cell_key, exec_count, fig_index, size, content_hash, written_at) -> None:
+        self._pending.append((
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, cell_key, exec_count, fig_index, size, content_hash, written_at, WRITER_ID),
+        ))
+
+    def update_size(self, name: str, size: int) -> None:
+        self._pending.append(("UPDATE files SET size = ? WHERE name = ?", (size, name)))
+
+    def add_bytes_saved(self, amount: int) -> None:
+        self._pending.append(("INSERT OR IGNORE INTO meta VALUES ('bytes_saved', 0)", ()))
+        self._pending.append(("UPDATE meta SET value = value + ? WHERE key = 'bytes_saved'", (amount,)))
+
+    def bytes_saved(self) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'bytes_saved'").fetchone()
+        return row[0] if row else 0
+
+    def forget_reference(self, name: str, cell_key: str) -> None:
+        self._pending.append(("DELETE FROM files WHERE name = ? AND cell_key = ?", (name, cell_key)))
+
+    def forget_file(self, name: str) -> None:
+        self._pending.append(("DELETE FROM files WHERE name = ?", (name,)))
+
+    def changed_by_others(self) -> bool:
+        """Whether another connection committed since we last loaded."""
+        return self._read_data_version() != self._data_version
+
+    def flush(self) -> None:
+        """Commits buffered changes in a single transaction."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for statement, params in pending:
+                self._conn.execute(statement, params)
+            self._conn.execute("COMMIT")
+        except sqlite3.Error:
+            try:
+                self._conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            _stats.incr("manifest_errors")
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
+
+
+class _DirectoryManifest:
+    """Tracks image files of one directory and the cells referencing them."""
+
+    def __init__(self, directory: Path, persistent: bool = False):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._files: Optional[Dict[str, _FileRecord]] = None
+        self._by_cell: Dict[str, Set[str]] = {}
+        # Files released by their cells, deleted once still unreferenced
+        self._orphans: Set[str] = set()
+        self._mtime_ns: Optional[int] = None
+        # Set when dietnb itself changed the directory since the last check
+        self._own_changes = False
+        # Bytes removed by background optimization (cumulative when persistent)
+        self.bytes_saved = 0
+        self.store: Optional[_ManifestStore] = None
+        if persistent:
+            try:
+                self.store = _ManifestStore(directory / MANIFEST_FILENAME)
+            except (OSError, sqlite3.Error):
+                _stats.incr("manifest_errors")
+
+    @property
+    def persistent(self) -> bool:
+        return self.store is not None
+
+    def _dir_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self) -> None:
+        """Rebuilds the manifest from the directory and the persistent store."""
+        with self._lock:
+            self._mtime_ns = self._dir_mtime()
+            on_disk = set()
+            try:
+                with os.scandir(self.directory) as entries:
+                    for entry in entries:
+                        if _is_output_name(entry.name) and entry.is_file():
+                            on_disk.add(entry.name)
+            except OSError:
+                pass
+
+            files: Dict[str, _FileRecord] = {}
+            if self.store is not None:
+                try:
+                    rows = self.store.load()
+                except sqlite3.Error:
+                    rows = []
+                    _stats.incr("manifest_errors")
+                for name, cell_key, exec_count, fig_index, size, content_hash, written_at, writer in rows:
+                    if name not in on_disk:
+                        # Deleted outside of dietnb
+                        self.store.forget_file(name)
+                        continue
+                    record = files.get(name)
+                    if record is None:
+                        record = files[name] = _FileRecord(size, content_hash, written_at, writer=writer)
+                    if cell_key:
+                        record.refs[cell_key] = (exec_count, fig_index)
+                try:
+                    self.bytes_saved = max(self.bytes_saved, self.store.bytes_saved())
+                except sqlite3.Error:
+                    pass
+
+            # Without a store, the refs this kernel recorded (e.g. of
+            # content-addressed files, whose names carry no cell) live only here
+            known = self._files if self.store is None and self._files is not None else {}
+            for name in on_disk - files.keys():
+                if name in known:
+                    files[name] = known[name]
+                    continue
+                parsed = parse_image_name(name)
+                record = files[name] = _FileRecord(managed=parsed is not None or is_content_name(name))
+                if parsed:
+                    record.refs[parsed[2]] = (parsed[0], parsed[1])
+
+            self._files = files
+            self._by_cell = {}
+            for name, record in files.items():
+                for cell_key in record.refs:
+                    self._by_cell.setdefault(cell_key, set()).add(name)
+            self._orphans &= files.keys()
+            self._own_changes = False
+
+    def _ensure_fresh(self) -> None:
+        if self._files is None:
+            self.reload()
+            return
+        if self.store is not None and self.store.changed_by_others():
+            self.reload()
+            return
+        mtime = self._dir_mtime()
+        if mtime != self._mtime_ns:
+            if self._own_changes:
+                # Our own writes/deletes moved the mtime; only trust it from now on
+                self._mtime_ns = mtime
+                self._own_changes = False
+            else:
+                self.reload()
+
+    def files_for_cell(self, cell_key: str) -> Set[str]:
+        """Returns the file names referenced by ``cell_key``."""
+        with self._lock:
+            self._ensure_fresh()
+            return set(self._by_cell.get(cell_key, ()))
+
+    def records(self) -> Dict[str, _FileRecord]:
+        """Returns every file record, filling in size and time from disk where unknown."""
+        with self._lock:
+            self._ensure_fresh()
+            for name, record in self._files.items():
+                if record.size is None or record.written_at is None:
+                    try:
+                        st = os.stat(self.directory / name)
+                    except OSError:
+                        continue
+                    record.size, record.written_at = st.st_size, st.st_mtime
+            return dict(self._files)
+
+    def add(self, name: str, cell_key: str, exec_count: int, fig_index: int,
+            size: int, content_hash: Optional[str]) -> None:
+        """Records that ``cell_key`` wrote (or reused) ``name``."""
+        written_at = time.time()
+        with self._lock:
+            if self._files is None:
+                self.reload()  # Picks up the new file itself
+            record = self._files.get(name)
+            if record is None:
+                record = self._files[name] = _FileRecord(size, content_hash, written_at, writer=WRITER_ID)
+            else:
+                record.size, record.content_hash = size, content_hash
+                record.written_at, record.writer = written_at, WRITER_ID
+            record.refs[cell_key] = (exec_count, fig_index)
+            self._by_cell.setdefault(cell_key, set()).add(name)
+            self._orphans.discard(name)
+            self._own_changes = True
+            if self.store is not None:
+                self.store.record(name, cell_key, exec_count, fig_index, size, content_hash, written_at)
+
+    def release_cell(self, cell_key: str,
+                     only: Optional[Callable[[str], bool]] = None) -> Set[str]:
+        """Drops every reference of ``cell_key`` and returns the files left unreferenced.
+
+        With ``only``, references to files it rejects are kept. The returned
+        files are also remembered as orphans, so they can be deleted later
+        with ``pop_orphans`` unless a cell references them again.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            names = self._by_cell.pop(cell_key, set())
+            if only is not None:
+                kept = {name for name in names if not only(name)}
+                if kept:
+                    self._by_cell[cell_key] = kept
+                names -= kept
+            unreferenced = set()
+            for name in names:
+                record = self._files.get(name)
+                if record is None:
+                    continue
+                record.refs.pop(cell_key, None)
+                if self.store is not None:
+                    self.store.forget_reference(name, cell_key)
+                if not record.refs:
+                    unreferenced.add(name)
+            self._orphans |= unreferenced
+            return unreferenced
+
+    def _owned(self, name: str, record: _FileRecord) -> bool:
+        """Whether no other live kernel may still be displaying ``name``."""
+        if record.writer == WRITER_ID:
+            return True
+        if record.writer is not None:
+            return not _writer_alive(record.writer)
+        try:
+            return os.stat(self.directory / name).st_mtime < PROCESS_START
+        except OSError:
+            return True
+
+    def pop_orphans(self) -> Set[str]:
+        """Returns released files that are still unreferenced and safe to delete.
+
+        Files another live kernel may have written are left for explicit
+        cleanup (``clean_unused`` / ``dietnb clean``).
+        """
+        with self._lock:
+            orphans, self._orphans = self._orphans, set()
+            if self._files is None:
+                return set()
+            deletable = set()
+            for name in orphans:
+                record = self._files.get(name)
+                if record is None or record.refs:
+                    continue
+                if self._owned(name, record):
+                    deletable.add(name)
+                else:
+                    _stats.incr("delete_skipped_foreign")
+            return deletable
+
+    def discard(self, name: str) -> None:
+        """Records a file dietnb has just deleted."""
+        with self._lock:
+            if self._files is None:
+                return
+            record = self._files.pop(name, None)
+            if record is not None:
+                for cell_key in record.refs:
+                    names = self._by_cell.get(cell_key)
+                    if names is not None:
+                        names.discard(name)
+                        if not names:
+                            del self._by_cell[cell_key]
+            self._orphans.discard(name)
+            self._own_changes = True
+            if self.store is not None:
+                self.store.forget_file(name)
+
+    def record_optimization(self, name: str, size: int, saved: int) -> None:
+        """Records that ``name`` was rewritten in place ``saved`` bytes smaller."""
+        with self._lock:
+            self.bytes_saved += saved
+            self._own_changes = True
+            record = self._files.get(name) if self._files is not None else None
+            if record is not None:
+                record.size = size
+            if self.store is not None:
+                self.store.update_size(name, size)
+                self.store.add_bytes_saved(saved)
+
+    def usage(self) -> dict:
+        """Summarizes files and bytes, split into referenced and unreferenced."""
+        records = self.records()
+        referenced = [r for r in records.values() if r.refs]
+        unreferenced = [r for r in records.values() if not r.refs]
+        return {
+            "directory": str(self.directory),
+            "files": len(records),
+            "bytes": sum(r.size or 0 for r in records.values()),
+            "cells": len(self._by_cell),
+            "referenced_files": len(referenced),
+            "unreferenced_files": len(unreferenced),
+            "unreferenced_bytes": sum(r.size or 0 for r in unreferenced),
+            "optimized_bytes_saved": self.bytes_saved,
+            "persistent": self.persistent,
+        }
+
+    def settle(self) -> None:
+        """Commits pending records and adopts the mtime after dietnb's own changes."""
+        with self._lock:
+            if self.store is not None:
+                self.store.flush()
+            if self._own_changes:
+                self._mtime_ns = self._dir_mtime()
+                self._own_changes = False
+
+    def close(self) -> None:
+        with self._lock:
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+
+
+_manifests: Dict[str, _DirectoryManifest] = {}
+_manifests_lock = threading.Lock()
+
+
+def get_manifest(dir_key: str, persistent: bool = False) -> _DirectoryManifest:
+    """Returns the manifest for the directory identified by ``dir_key``."""
+    with _manifests_lock:
+        manifest = _manifests.get(dir_key)
+        if manifest is not None and manifest.persistent != persistent:
+            manifest.close()
+            manifest = None
+        if manifest is None:
+            manifest = _manifests[dir_key] = _DirectoryManifest(Path(dir_key), persistent)
+        return manifest
+
+
+def all_manifests() -> List[_DirectoryManifest]:
+    with _manifests_lock:
+        return list(_manifests.values())
+
+
+def settle_all() -> None:
+    """Commits and settles every manifest dietnb touched."""
+    for manifest in all_manifests():
+        manifest.settle()
+
+
+def clear() -> None:
+    """Closes and forgets all manifests."""
+    with _manifests_lock:
+        manifests = list(_manifests.values())
+        _manifests.clear()
+    for manifest in manifests:
+        manifest.close()
@@ -0,0 +1,103 @@
+"""
+Per-cell memory report (``memory_report``).
+
+Figures displayed in a loop stay alive until the cell ends unless
+``release_figures`` is on, and most of their memory is Agg renderer buffers
+allocated in C++, which ``tracemalloc`` does not see. The report therefore
+samples the resident set size (RSS) of the kernel after every saved figure
+and at the end of each cell, along with the number of figures pyplot still
+holds.
+"""
+
+import os
+import sys
+import threading
+from collections import deque
+from typing import Deque, List, Optional
+
+# Cells kept in the report
+MAX_CELLS = 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+_lock = threading.Lock()
+_cells: Deque[dict] = deque(maxlen=MAX_CELLS)
+# Samples of the running cell: start, peak and figures seen
+_current: Optional[dict] = None
+_last_rss: Optional[int] = None
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of the process, or None if unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil  # Not a dependency; used where /proc is missing
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def _open_figures() -> int:
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    return len(pyplot.get_fignums()) if pyplot is not None else 0
+
+
+def sample(figure: bool = True) -> None:
+    """Records the current RSS for the running cell."""
+    global _current
+    rss = rss_bytes()
+    if rss is None:
+        return
+    open_figures = _open_figures()
+    with _lock:
+        if _current is None:
+            start = _last_rss if _last_rss is not None else rss
+            _current = {"rss_start": start, "rss_peak": max(start, rss), "figures": 0, "open_figures_peak": 0}
+        _current["rss_peak"] = max(_current["rss_peak"], rss)
+        _current["open_figures_peak"] = max(_current["open_figures_peak"], open_figures)
+        if figure:
+            _current["figures"] += 1
+
+
+def finish_cell(cell_key: str, exec_count) -> Optional[dict]:
+    """Closes the running cell's samples and returns its report entry."""
+    global _current, _last_rss
+    sample(figure=False)
+    rss = rss_bytes()
+    with _lock:
+        current, _current = _current, None
+        if current is None:
+            return None
+        _last_rss = rss
+        mib = 1024.0 * 1024.0
+        entry = {
+            "cell": cell_key,
+            "exec_count": exec_count,
+            "figures": current["figures"],
+            "open_figures_peak": current["open_figures_peak"],
+            "rss_start_mib": round(current["rss_start"] / mib, 1),
+            "rss_peak_mib": round(current["rss_peak"] / mib, 1),
+            "rss_end_mib": round(rss / mib, 1) if rss is not None else None,
+            "rss_growth_mib": round((current["rss_peak"] - current["rss_start"]) / mib, 1),
+        }
+        _cells.append(entry)
+        return entry
+
+
+def report() -> List[dict]:
+    """Returns the entries of the most recent cells, oldest first."""
+    with _lock:
+        return list(_cells)
+
+
+def reset() -> None:
+    """Clears the report and takes the current RSS as the next cell's start."""
+    global _current, _last_rss
+    rss = rss_bytes()
+    with _lock:
+        _cells.clear()
+        _current = None
+        _last_rss = rss
@@ -0,0 +1,174 @@
+"""
+Streaming scan of saved notebooks for the images and sidecar files dietnb
+outputs reference.
+
+Notebooks can be hundreds of megabytes, mostly base64 payloads, so the file
+is tokenized in fixed-size chunks and only ``text/html`` output strings are
+decoded. Everything else is skipped without being held in memory.
+"""
+
+import codecs
+import json
+import posixpath
+import re
+from pathlib import Path
+from typing import Iterator, List, Optional, Set
+from urllib.parse import unquote
+
+CHUNK_SIZE = 1 << 20
+
+_WS_RE = re.compile(r"\s*")
+_STRING_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+# Matches as much of a string body as possible; stops at the closing quote
+# or at a trailing backslash whose escaped character is in the next chunk.
+_STRING_BODY_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+_SCALAR_RE = re.compile(r'[^\s{}\[\]:,"]+')
+_IMG_TAG_RE = re.compile(r"<img\b[^>]*>", re.I)
+_ATTR_RE = re.compile(r'\b(src|srcset)\s*=\s*"([^"]*)"', re.I)
+_LINK_TAG_RE = re.compile(r"<a\b[^>]*>", re.I)
+_HREF_RE = re.compile(r'\bhref\s*=\s*"([^"]*)"', re.I)
+
+HTML_MIME = "text/html"
+
+
+def _chunks(path: Path, chunk_size: int, errors: str = "replace") -> Iterator[str]:
+    """Yields the notebook text in pieces of about ``chunk_size`` bytes."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors=errors)
+    with open(path, "rb") as handle:
+        while True:
+            raw = handle.read(chunk_size)
+            if not raw:
+                tail = decoder.decode(b"", final=True)
+                if tail:
+                    yield tail
+                return
+            yield decoder.decode(raw)
+
+
+def iter_html_outputs(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Yields every ``text/html`` value of a notebook, one string per output.
+
+    Memory use is bounded by ``chunk_size`` plus the largest HTML output;
+    other strings (e.g. base64 images) are skipped as they stream by.
+    """
+    # One frame per open container: [is_map, current_key, expecting_key, html_parts]
+    stack: List[list] = []
+    buffer = ""
+    skipping = False  # inside a string whose content is irrelevant
+    chunks = _chunks(path, chunk_size)
+
+    def in_html() -> bool:
+        if not stack:
+            return False
+        top = stack[-1]
+        if top[0]:
+            return not top[2] and top[1] == HTML_MIME
+        return top[3] is not None
+
+    for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        end = len(buffer)
+        if skipping:
+            match = _STRING_BODY_RE.match(buffer)
+            if match.end() >= end or buffer[match.end()] != '"':
+                buffer = buffer[match.end():]
+                continue
+            pos = match.end() + 1
+            skipping = False
+
+        while True:
+            pos = _WS_RE.match(buffer, pos).end()
+            if pos >= end:
+                break
+            char = buffer[pos]
+            if char == '"':
+                match = _STRING_RE.match(buffer, pos)
+                if match is None:
+                    # Incomplete string: keep it only if its content matters
+                    top = stack[-1] if stack else None
+                    is_key = top is not None and top[0] and top[2]
+                    if is_key or in_html():
+                        break
+                    body = _STRING_BODY_RE.match(buffer, pos + 1)
+                    pos = body.end()
+                    skipping = True
+                    break
+                pos = match.end()
+                top = stack[-1] if stack else None
+                if top is not None and top[0] and top[2]:
+                    top[1] = json.loads(match.group())
+                elif in_html():
+                    text = json.loads(match.group())
+                    if top[0]:
+                        yield text
+                    else:
+                        top[3].append(text)
+            elif char in "{[":
+                html_array = char == "[" and in_html()
+                stack.append([char == "{", None, True, [] if html_array else None])
+                pos += 1
+            elif char in "}]":
+                frame = stack.pop() if stack else None
+                if frame is not None and frame[3] is not None:
+                    yield "".join(frame[3])
+                pos += 1
+            elif char == ":":
+                if stack and stack[-1][0]:
+                    stack[-1][2] = False
+                pos += 1
+            elif char == ",":
+                if stack and stack[-1][0]:
+                    stack[-1][2] = True
+                pos += 1
+            else:
+                match = _SCALAR_RE.match(buffer, pos)
+                if match.end() >= end:
+                    break  # May continue in the next chunk
+                pos = match.end()
+        buffer = buffer[pos:]
+
+
+def image_sources(html: str) -> Iterator[str]:
+    """Yields the ``src``/``srcset`` URLs of dietnb ``<img>`` tags in ``html``."""
+    for tag in _IMG_TAG_RE.findall(html):
+        if "dietnb-img" not in tag:
+            continue
+        for attr, value in _ATTR_RE.findall(tag):
+            if attr.lower() == "srcset":
+                for candidate in value.split(","):
+                    url = candidate.strip().split(" ")[0]
+                    if url:
+                        yield url
+            else:
+                yield value
+
+
+def sidecar_links(html: str) -> Iterator[str]:
+    """Yields the ``href`` URLs of dietnb sidecar links in ``html``."""
+    for tag in _LINK_TAG_RE.findall(html):
+        if "dietnb-sidecar" in tag:
+            yield from _HREF_RE.findall(tag)
+
+
+def referenced_image_names(notebook_path: Path, chunk_size: int = CHUNK_SIZE) -> Set[str]:
+    """Returns the file names of every image and sidecar file the saved
+    notebook's dietnb outputs reference."""
+    names = set()
+    for html in iter_html_outputs(notebook_path, chunk_size):
+        if "dietnb-" not in html:
+            continue
+        urls = image_sources(html) if "dietnb-img" in html else ()
+        if "dietnb-sidecar" in html:
+            urls = [*urls, *sidecar_links(html)]
+        for url in urls:
+            name = _url_basename(url)
+            if name:
+                names.add(name)
+    return names
+
+
+def _url_basename(url: str) -> Optional[str]:
+    path = url.split("?", 1)[0].split("#", 1)[0]
+    name = posixpath.basename(unquote(path))
+    return name or None
@@ -0,0 +1,103 @@
+"""
+Post-write PNG optimization, run on a background worker after a figure is on disk.
+
+Flat-colored plots usually use far fewer than 256 colors, so they can be
+stored losslessly as palette PNGs; everything is also re-deflated at the
+highest level. With a tolerance, images with more colors may be quantized to
+a 256-color palette when the mean per-channel error stays within it.
+"""
+
+import io
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+def _encode(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _exact_palette_png(image, rgba: np.ndarray) -> Optional[bytes]:
+    """Encodes ``rgba`` as a palette PNG when it has at most 256 colors."""
+    from PIL import Image
+
+    if image.convert("RGBA").getcolors(256) is None:
+        return None
+    height, width, _ = rgba.shape
+    packed = np.ascontiguousarray(rgba).view(np.uint32).reshape(-1)
+    colors, indices = np.unique(packed, return_inverse=True)
+    palette = colors.view(np.uint8).reshape(-1, 4)
+
+    indexed = Image.fromarray(indices.astype(np.uint8).reshape(height, width), "P")
+    indexed.putpalette(palette[:, :3].tobytes())
+    buffer = io.BytesIO()
+    alpha = palette[:, 3]
+    if (alpha < 255).any():
+        indexed.save(buffer, format="PNG", optimize=True, transparency=alpha.tobytes())
+    else:
+        indexed.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _quantized_png(image, rgba: np.ndarray, tolerance: float) -> Optional[bytes]:
+    """Quantizes to 256 colors if the mean absolute error is within ``tolerance``."""
+    from PIL import Image
+
+    method = getattr(Image, "Quantize", Image).FASTOCTREE
+    quantized = image.convert("RGBA").quantize(256, method=method)
+    restored = np.asarray(quantized.convert("RGBA"), dtype=np.int16)
+    if np.abs(restored - rgba.astype(np.int16)).mean() > tolerance:
+        return None
+    return _encode(quantized)
+
+
+def optimize_png(data: bytes, tolerance: float = 0.0) -> Optional[bytes]:
+    """Returns a smaller PNG encoding of ``data``, or None if none was found."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        rgba = np.asarray(image.convert("RGBA"))
+        candidates = [_encode(image)]
+        palette = _exact_palette_png(image, rgba)
+        if palette is not None:
+            candidates.append(palette)
+        elif tolerance > 0:
+            quantized = _quantized_png(image, rgba, tolerance)
+            if quantized is not None:
+                candidates.append(quantized)
+
+    best = min(candidates, key=len)
+    return best if len(best) < len(data) else None
+
+
+def optimize_file(filepath: Path, tolerance: float = 0.0) -> int:
+    """Optimizes a PNG file in place and returns the number of bytes saved.
+
+    The smaller image is written next to the original and swapped in with
+    ``os.replace``, so readers never see a partial file. Nothing is replaced
+    if the original changed or vanished while it was being optimized.
+    """
+    before = os.stat(filepath)
+    data = filepath.read_bytes()
+    smaller = optimize_png(data, tolerance)
+    if smaller is None:
+        return 0
+
+    temp = filepath.with_name(f".{filepath.name}.{os.getpid()}.tmp")
+    try:
+        temp.write_bytes(smaller)
+        current = os.stat(filepath)
+        if (current.st_size, current.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+            return 0
+        os.replace(temp, filepath)
+    finally:
+        try:
+            temp.unlink()
+        except FileNotFoundError:
+            pass
+    return len(data) - len(smaller)
@@ -0,0 +1,65 @@
+"""
+Image directory names, cell keys and ``<img>`` paths.
+
+Shared by the kernel side and by the ``dietnb clean`` / ``dietnb convert``
+commands and their worker processes, so this module must not import
+matplotlib or IPython.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_FOLDER_NAME = "dietnb_imgs"
+
+
+def safe_relpath(path: Path, base: Path) -> Optional[str]:
+    """Returns a POSIX-style relative path if possible."""
+    try:
+        rel = path.relative_to(base)
+    except ValueError:
+        try:
+            rel = Path(os.path.relpath(path, base))
+        except ValueError:
+            return None
+    return rel.as_posix()
+
+
+def img_src_relative_path(filepath: Path, notebook_path: Optional[Path]) -> str:
+    """Computes an image src suitable for HTML, preferring notebook-relative paths."""
+    if notebook_path:
+        base = notebook_path.parent
+        rel = safe_relpath(filepath, base)
+        if rel:
+            return rel
+
+    rel_cwd = safe_relpath(filepath, Path.cwd())
+    if rel_cwd:
+        return rel_cwd
+
+    return filepath.name
+
+
+def image_dir_for_notebook(notebook_path: Optional[Path], base_folder_name=DEFAULT_FOLDER_NAME) -> Path:
+    """Creates (if needed) and returns the image directory for a notebook path."""
+    # if set img directory as hidden, jupyter notebook can't read img
+    fallback_dir = Path.cwd() / f"{base_folder_name}"
+
+    if notebook_path:
+        notebook_dir_name_part = f"{notebook_path.stem}_{base_folder_name}" if notebook_path.stem else f".{base_folder_name}"
+        target_dir = notebook_path.parent / notebook_dir_name_part
+    else:
+        target_dir = fallback_dir
+
+    try:
+        target_dir.mkdir(parents=True, exist_ok=True)
+        return target_dir
+    except OSError:
+        fallback_dir.mkdir(parents=True, exist_ok=True)
+        return fallback_dir
+
+
+def cell_key_from_id(cell_id: str) -> str:
+    """Key used in image file names for a cell with the given id."""
+    return hashlib.sha1(cell_id.encode()).hexdigest()[:12]
@@ -0,0 +1,60 @@
+"""
+Previews for large non-image outputs that dietnb moves into sidecar files.
+
+The notebook keeps a short plain-text preview and a link; the full output is
+written next to the images (``.html``, ``.json`` or ``.txt``) and follows the
+same naming and cleanup rules.
+"""
+
+import html
+import json
+import re
+from typing import Optional, Tuple
+
+_TAG_RE = re.compile(r"<(script|style)\b.*?</\1\s*>|<[^>]+>", re.I | re.S)
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+
+# Output kind -> (file extension, mimetype of the moved data)
+KINDS = {
+    "html": (".html", "text/html"),
+    "json": (".json", "application/json"),
+    "text": (".txt", "text/plain"),
+}
+
+
+def html_to_text(markup: str) -> str:
+    """Crude tag stripping, good enough for a preview of an HTML output."""
+    text = html.unescape(_TAG_RE.sub(" ", markup))
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return _BLANK_LINES_RE.sub("\n", "\n".join(lines)).strip()
+
+
+def truncate(text: str, limit: int) -> Tuple[str, bool]:
+    """Cuts ``text`` to at most ``limit`` characters, at a line break if possible."""
+    if len(text) <= limit:
+        return text, False
+    cut = text.rfind("\n", 0, limit)
+    return text[: cut if cut > limit // 2 else limit], True
+
+
+def encode(kind: str, value) -> bytes:
+    """Returns the sidecar file contents for an output value."""
+    if kind == "json" and not isinstance(value, str):
+        return json.dumps(value, indent=1, ensure_ascii=False).encode("utf-8")
+    if kind == "html":
+        return f'<!DOCTYPE html>\n<meta charset="utf-8">\n{value}'.encode("utf-8")
+    return value.encode("utf-8") if isinstance(value, str) else bytes(value)
+
+
+def preview(kind: str, value, plain: Optional[str], limit: int) -> Tuple[str, bool]:
+    """Builds the preview text shown in the notebook and whether it is truncated."""
+    if plain and kind != "text":
+        # e.g. pandas' own (already abbreviated) text repr of a DataFrame
+        text = plain
+    elif kind == "html":
+        text = html_to_text(value)
+    elif kind == "json" and not isinstance(value, str):
+        text = json.dumps(value, indent=1, ensure_ascii=False)
+    else:
+        text = value
+    return truncate(text, limit)
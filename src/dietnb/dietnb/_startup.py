@@ -5,7 +5,9 @@ logger = logging.getLogger("dietnb_startup")
 
 # Attempt to activate dietnb
 try:
-    dietnb.activate() # Call activate without folder_prefix for auto-detection
+    # Patches matplotlib once the kernel imports it, so kernels that never plot
+    # do not pay for the import
+    dietnb.activate(lazy=True)
     logger.info("dietnb auto-activated via startup script.")
 except Exception as e:
     logger.error(f"Error auto-activating dietnb via startup script: {e}", exc_info=True)
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+Lightweight counters and timers exposed through ``dietnb.stats()``, and the
+optional JSON-lines event log (``activate(stats_log=...)``).
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, TextIO
+
+_lock = threading.Lock()
+_counters: Dict[str, int] = {}
+_timings: Dict[str, List[float]] = {}  # name -> [count, total, max]
+_gauges: Dict[str, List[int]] = {}  # name -> [current, peak]
+
+_log_lock = threading.Lock()
+_log_file: Optional[TextIO] = None
+
+
+def incr(name: str, amount: int = 1) -> None:
+    """Adds ``amount`` to the named counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name: str, seconds: float) -> None:
+    """Records one duration sample for the named timer."""
+    with _lock:
+        entry = _timings.get(name)
+        if entry is None:
+            _timings[name] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+
+def observe_many(samples: Dict[str, float]) -> None:
+    """Records one duration sample for each named timer under a single lock."""
+    with _lock:
+        for name, seconds in samples.items():
+            entry = _timings.get(name)
+            if entry is None:
+                _timings[name] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+
+
+@contextmanager
+def timer(name: str):
+    """Times the enclosed block under ``name``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def set_gauge(name: str, value: int) -> None:
+    """Sets the current value of a gauge, tracking its peak."""
+    with _lock:
+        entry = _gauges.get(name)
+        if entry is None:
+            _gauges[name] = [value, value]
+        else:
+            entry[0] = value
+            if value > entry[1]:
+                entry[1] = value
+
+
+def snapshot() -> dict:
+    """Returns a copy of all metrics. Durations are reported in milliseconds."""
+    with _lock:
+        timings = {
+            name: {
+                "count": int(count),
+                "total_ms": total * 1000.0,
+                "mean_ms": (total / count) * 1000.0 if count else 0.0,
+                "max_ms": peak * 1000.0,
+            }
+            for name, (count, total, peak) in _timings.items()
+        }
+        gauges = {name: {"current": cur, "peak": peak} for name, (cur, peak) in _gauges.items()}
+        return {"counters": dict(_counters), "timings": timings, "gauges": gauges}
+
+
+def reset() -> None:
+    """Clears all metrics."""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+        _gauges.clear()
+
+
+def open_log(path: Optional[str]) -> None:
+    """Appends one JSON object per event to ``path``; None stops logging."""
+    global _log_file
+    with _log_lock:
+        if _log_file is not None:
+            _log_file.close()
+            _log_file = None
+        if path is not None:
+            _log_file = open(os.path.expanduser(path), "a", encoding="utf-8", buffering=1)
+
+
+def logging_enabled() -> bool:
+    return _log_file is not None
+
+
+def log_event(event: str, **fields) -> None:
+    """Writes an event line if a log is open. Lines from several kernels may
+    share one file, so each carries the process id."""
+    if _log_file is None:
+        return
+    record = {"ts": round(time.time(), 6), "pid": os.getpid(), "event": event, **fields}
+    line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+    with _log_lock:
+        if _log_file is not None:
+            _log_file.write(line)
@@ -10,7 +10,8 @@ COPY_BUTTON_SCRIPT = """
             e.stopPropagation();
             const container = btn.closest('.dietnb-container');
             const img = container.querySelector('.dietnb-img');
-            const src = img.currentSrc || img.src;
+            // src is the full image; a srcset only holds thumbnails
+            const src = img.src;
             
             const originalHTML = btn.innerHTML;
             btn.innerHTML = '⏳';
@@ -19,8 +20,22 @@ COPY_BUTTON_SCRIPT = """
             try {
                 const response = await fetch(src);
                 if (!response.ok) throw new Error('Failed to fetch image');
-                const blob = await response.blob();
-                
+                let blob = await response.blob();
+                if (blob.type !== 'image/png') {
+                    // Clipboards only take PNG; redraw SVG/JPEG/WebP on a canvas
+                    let full = img;
+                    if (img.currentSrc && img.currentSrc !== img.src) {
+                        full = new Image();
+                        full.src = src;
+                        await full.decode();
+                    }
+                    const canvas = document.createElement('canvas');
+                    canvas.width = full.naturalWidth;
+                    canvas.height = full.naturalHeight;
+                    canvas.getContext('2d').drawImage(full, 0, 0);
+                    blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/png'));
+                }
+
                 await navigator.clipboard.write([
                     new ClipboardItem({ [blob.type]: blob })
                 ]);
@@ -58,7 +73,7 @@ COPY_BUTTON_SCRIPT = """
 
 COPY_BUTTON_HTML = """
 <div class="dietnb-container" style="position: relative; display: inline-block; max-width: 100%;">
-    <img src="{img_src}" alt="{filename}" class="dietnb-img" style="max-width: 100%; height: auto;">
+    <img src="{img_src}" alt="{filename}" class="dietnb-img" style="max-width: 100%; height: auto;"{img_attrs}>
     <div style="position: absolute; top: 8px; right: 8px; z-index: 10; display: flex; gap: 4px;">
         <button class="dietnb-copy-btn" 
                 style="background: rgba(255, 255, 255, 0.95); 
@@ -90,3 +105,98 @@ COPY_BUTTON_HTML = """
     </div>
 </div>
 """
+
+# Compact output mode: the styles and a delegated click handler are emitted
+# once, and every figure is reduced to COMPACT_HTML.
+COMPACT_ASSETS = """<script>
+(function() {
+    if (window.dietnbAssets) return;
+    window.dietnbAssets = true;
+    // Kept in <head> so the styles survive re-execution of the cell that carried them
+    const style = document.createElement('style');
+    style.id = 'dietnb-style';
+    style.textContent = `
+.dietnb-container { position: relative; display: inline-block; max-width: 100%; }
+.dietnb-img { max-width: 100%; height: auto; }
+.dietnb-actions { position: absolute; top: 8px; right: 8px; z-index: 10; display: flex; gap: 4px; }
+.dietnb-actions > * { background: rgba(255, 255, 255, 0.95); border: 1px solid rgba(0, 0, 0, 0.2);
+    border-radius: 4px; cursor: pointer; padding: 4px 8px; font-size: 13px; text-decoration: none;
+    box-shadow: 0 2px 4px rgba(0,0,0,0.1); transition: all 0.2s;
+    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; }
+.dietnb-actions > *:hover { background: rgba(255,255,255,1); box-shadow: 0 4px 8px rgba(0,0,0,0.15); }`;
+    document.head.appendChild(style);
+
+    function flash(btn, label, title, delay) {
+        btn.innerHTML = label;
+        btn.title = title;
+        setTimeout(() => { btn.innerHTML = '📋'; btn.title = ''; btn.disabled = false; }, delay);
+    }
+
+    document.addEventListener('click', async (e) => {
+        const btn = e.target.closest && e.target.closest('.dietnb-copy-btn');
+        if (!btn || !btn.closest('.dietnb-compact')) return;
+        e.stopPropagation();
+        const img = btn.closest('.dietnb-container').querySelector('.dietnb-img');
+        btn.innerHTML = '⏳';
+        btn.disabled = true;
+        try {
+            // src is the full image; a srcset only holds thumbnails
+            const response = await fetch(img.src);
+            if (!response.ok) throw new Error('Failed to fetch image');
+            let blob = await response.blob();
+            if (blob.type !== 'image/png') {
+                // Clipboards only take PNG; redraw SVG/JPEG/WebP on a canvas
+                let full = img;
+                if (img.currentSrc && img.currentSrc !== img.src) {
+                    full = new Image();
+                    full.src = img.src;
+                    await full.decode();
+                }
+                const canvas = document.createElement('canvas');
+                canvas.width = full.naturalWidth;
+                canvas.height = full.naturalHeight;
+                canvas.getContext('2d').drawImage(full, 0, 0);
+                blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/png'));
+            }
+            await navigator.clipboard.write([new ClipboardItem({ [blob.type]: blob })]);
+            flash(btn, '✅', '', 1500);
+        } catch (err) {
+            console.error('[dietnb] Copy failed:', err);
+            flash(btn, '❌', 'Copy failed: ' + err.message, 2500);
+        }
+    });
+
+    // Images written in the background may not exist yet; retry them, and
+    // fall back to the full image while thumbnails are being written.
+    // Error events do not bubble, so listen in the capture phase.
+    document.addEventListener('error', (e) => {
+        const img = e.target;
+        if (!img.classList || !img.classList.contains('dietnb-img')) return;
+        if (img.hasAttribute('srcset')) {
+            img.removeAttribute('srcset');
+            return;
+        }
+        if (!img.hasAttribute('data-dietnb-async')) return;
+        const n = +(img.dataset.retry || 0);
+        if (n >= 40) return;
+        img.dataset.retry = n + 1;
+        setTimeout(() => { img.src = img.src.split('?')[0] + '?retry=' + (n + 1); }, 250);
+    }, true);
+})();
+</script>
+"""
+
+COMPACT_HTML = (
+    '<div class="dietnb-container dietnb-compact">'
+    '<img src="{img_src}" alt="{filename}" class="dietnb-img"{img_attrs}>'
+    '<div class="dietnb-actions"><button class="dietnb-copy-btn">📋</button>'
+    '<a href="{img_src}" download="{filename}" title="Download image">💾</a></div></div>'
+)
+
+SIDECAR_HTML = (
+    '<div class="dietnb-sidecar-output">'
+    '<pre style="max-height: 24em; overflow: auto; margin: 0;">{preview}</pre>'
+    '<div style="font-size: 12px; opacity: 0.8; margin-top: 4px;">{note} '
+    '<a class="dietnb-sidecar" href="{src}" target="_blank" title="{filename}">'
+    'Open full output ({size})</a></div></div>'
+)
@@ -0,0 +1,96 @@
+"""
+Thumbnails for figure-heavy notebooks (``thumbnail_width``).
+
+Browsers load every ``<img>`` of a notebook when it opens. With thumbnails,
+raster images wider than the configured width are shown through a ``srcset``
+of two downscaled copies (1x and 2x that width) with ``loading="lazy"`` and
+explicit ``width``/``height``, while ``src`` keeps pointing at the full image
+for the copy and download buttons. Thumbnails are named after their image
+(``{stem}.w{width}{ext}``), so they parse to the same cell and execution and
+are cleaned up with it.
+"""
+
+import io
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+RASTER_FORMATS = ("png", "jpeg", "webp")
+_PIL_FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+
+
+def thumbnail_name(name: str, width: int) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.w{width}{ext}"
+
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Returns the pixel size of encoded image bytes (header only), or None."""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+@dataclass(frozen=True)
+class _Plan:
+    """How one image is displayed and which thumbnails it needs."""
+
+    width: int
+    height: int
+    # (file name, pixel width) of each thumbnail to write
+    thumbnails: Tuple[Tuple[str, int], ...] = ()
+    # (file name, density descriptor) of each srcset candidate
+    srcset: Tuple[Tuple[str, str], ...] = ()
+
+
+def plan(name: str, size: Tuple[int, int], width: int) -> _Plan:
+    """Plans the display of an image of ``size`` pixels at ``width`` CSS pixels."""
+    full_width, full_height = size
+    if full_width <= width:
+        return _Plan(full_width, full_height)
+    height = max(1, round(full_height * width / full_width))
+    thumbnails: List[Tuple[str, int]] = [(thumbnail_name(name, width), width)]
+    srcset = [(thumbnails[0][0], "1x")]
+    if full_width > 2 * width:
+        thumbnails.append((thumbnail_name(name, 2 * width), 2 * width))
+        srcset.append((thumbnails[1][0], "2x"))
+    else:
+        srcset.append((name, f"{full_width / width:.3g}x"))
+    return _Plan(width, height, tuple(thumbnails), tuple(srcset))
+
+
+def make_thumbnails(data: bytes, fmt: str, widths: List[int]) -> List[bytes]:
+    """Downscales encoded image bytes to each of ``widths`` pixels, in the same format.
+
+    The image is decoded once. PNG thumbnails are quantized to a 256-color
+    palette: resampling adds many intermediate colors, and without it a
+    thumbnail of a line chart is barely smaller than the full image.
+    """
+    from PIL import Image
+
+    box = getattr(Image, "Resampling", Image).BOX
+    fastoctree = getattr(Image, "Quantize", Image).FASTOCTREE
+    results = []
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif fmt == "png" and image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        for width in widths:
+            if image.width <= width:
+                results.append(data)
+                continue
+            height = max(1, round(image.height * width / image.width))
+            thumbnail = image.resize((width, height), box)
+            buffer = io.BytesIO()
+            if fmt == "png":
+                thumbnail.quantize(256, method=fastoctree).save(buffer, format="PNG")
+            else:
+                thumbnail.save(buffer, format=_PIL_FORMATS[fmt], quality=85)
+            results.append(buffer.getvalue())
+    return results
@@ -0,0 +1,102 @@
+"""
+Bounded background pool used to take figure writes off the cell's critical path.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as _FutureTimeout
+from typing import Callable, List, Optional, Tuple
+
+from . import _stats
+
+
+class _BackgroundWriter:
+    """Runs write jobs on a fixed number of threads with a bounded queue.
+
+    ``submit`` blocks once ``max_pending`` jobs are outstanding so a cell that
+    displays many figures cannot queue an unbounded amount of work.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, name: str = "write"):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"dietnb-{name}")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, Future]] = []
+        self.gauge = f"{name}_queue_depth"
+        self._timer = f"background_{name}"
+
+    @property
+    def pending(self) -> int:
+        """Number of submitted jobs that have not finished yet."""
+        with self._lock:
+            return sum(1 for _, future in self._pending if not future.done())
+
+    def submit(self, label: str, job: Callable[[], None]) -> Future:
+        """Queues ``job``; ``label`` identifies it in failure reports."""
+        self._slots.acquire()
+        return self._enqueue(label, job)
+
+    def try_submit(self, label: str, job: Callable[[], None]) -> Optional[Future]:
+        """Like ``submit`` but returns None instead of blocking when the queue is full."""
+        if not self._slots.acquire(blocking=False):
+            return None
+        return self._enqueue(label, job)
+
+    def _enqueue(self, label: str, job: Callable[[], None]) -> Future:
+        try:
+            future = self._executor.submit(self._run, job)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            # Drop finished jobs that succeeded; failures wait for ``flush``
+            self._pending = [
+                (l, f) for l, f in self._pending if not f.done() or f.exception() is not None
+            ]
+            self._pending.append((label, future))
+            depth = sum(1 for _, f in self._pending if not f.done())
+        _stats.set_gauge(self.gauge, depth)
+        return future
+
+    def _run(self, job: Callable[[], None]) -> None:
+        started = time.perf_counter()
+        try:
+            job()
+        finally:
+            _stats.observe(self._timer, time.perf_counter() - started)
+            self._slots.release()
+
+    def flush(self, timeout: Optional[float] = None) -> List[Tuple[str, BaseException]]:
+        """Waits for all outstanding jobs and returns ``(label, error)`` for failures."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        failures = []
+        unfinished = []
+        for label, future in pending:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                error = future.exception(timeout=remaining)
+            except _FutureTimeout:
+                unfinished.append((label, future))
+                continue
+            except Exception as exc:  # cancelled futures
+                error = exc
+            if error is not None:
+                failures.append((label, error))
+
+        if unfinished:
+            with self._lock:
+                self._pending[:0] = unfinished
+        _stats.set_gauge(self.gauge, len(unfinished))
+        return failures
+
+    def shutdown(self) -> List[Tuple[str, BaseException]]:
+        """Flushes outstanding jobs and stops the worker threads."""
+        failures = self.flush()
+        self._executor.shutdown(wait=True)
+        return failures
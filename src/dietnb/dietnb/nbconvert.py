@@ -0,0 +1,56 @@
+"""
+nbconvert preprocessor that makes dietnb notebooks self-contained.
+
+Images written by dietnb are embedded as ``data:`` URIs and sidecar outputs
+are put back in place, so the exported document no longer depends on the
+notebook's ``X_dietnb_imgs`` folder::
+
+    jupyter nbconvert --to html \\
+        --HTMLExporter.preprocessors=dietnb.nbconvert.InlineFilesPreprocessor notebook.ipynb
+
+Requires nbconvert (``pip install dietnb[nbconvert]``).
+"""
+
+from pathlib import Path
+
+from nbconvert.preprocessors import Preprocessor
+from traitlets import Integer
+
+from ._export import _Prefetcher, inline_html, referenced_urls, resolve_url
+
+__all__ = ["InlineFilesPreprocessor"]
+
+
+class InlineFilesPreprocessor(Preprocessor):
+    """Inlines the images and sidecar files referenced by dietnb outputs."""
+
+    jobs = Integer(0, help="Threads reading files (0: automatic).").tag(config=True)
+
+    def preprocess(self, nb, resources):
+        base_dir = Path(resources.get("metadata", {}).get("path") or ".")
+        outputs = []
+        for cell in nb.cells:
+            for output in cell.get("outputs", ()):
+                value = output.get("data", {}).get("text/html")
+                if value is not None:
+                    outputs.append((output, "".join(value) if isinstance(value, list) else value))
+
+        paths = []
+        for _, html in outputs:
+            for url in referenced_urls(html):
+                path = resolve_url(url, base_dir)
+                if path is not None:
+                    paths.append(path)
+
+        self.inlined = 0
+        self.files = len(paths)
+        prefetch = _Prefetcher(paths, self.jobs or None)
+        try:
+            for output, html in outputs:
+                inlined = inline_html(html, base_dir, prefetch)
+                if inlined is not None:
+                    output["data"]["text/html"] = inlined
+                    self.inlined += 1
+        finally:
+            prefetch.close()
+        return nb, resources
@@ -0,0 +1,137 @@
+import pytest
+
+from dietnb import _config, _core, _manifest, _stats
+from matplotlib.figure import Figure
+
+
+@pytest.fixture(params=["terminal", "zmq", "embed", "qt"], ids=lambda name: f"{name}-shell")
+def ipython_shell(request):
+    """각 IPython 셸 인스턴스를 생성하고 테스트 후 정리한다."""
+    if request.param == "terminal":
+        from IPython.terminal.interactiveshell import TerminalInteractiveShell
+
+        shell_cls = TerminalInteractiveShell
+    elif request.param == "zmq":
+        from ipykernel.zmqshell import ZMQInteractiveShell
+
+        shell_cls = ZMQInteractiveShell
+    elif request.param == "embed":
+        from IPython.terminal.embed import InteractiveShellEmbed
+
+        shell_cls = InteractiveShellEmbed
+    else:
+        qtconsole_module = pytest.importorskip(
+            "qtconsole.inprocess",
+            reason="qtconsole inprocess 지원이 필요합니다."
+        )
+        manager = qtconsole_module.QtInProcessKernelManager()
+        manager.start_kernel()
+        shell = manager.kernel.shell
+        try:
+            yield shell
+        finally:
+            callbacks = getattr(shell.events, "callbacks", {}).get("post_run_cell")
+            if callbacks is not None:
+                callbacks.clear()
+            for attr in ("iopub_thread", "_default_iopub_thread"):
+                thread = getattr(manager.kernel, attr, None)
+                if thread is not None:
+                    try:
+                        thread.stop()
+                    except Exception:
+                        pass
+                    try:
+                        thread.close()
+                    except Exception:
+                        pass
+            manager.shutdown_kernel()
+        return
+
+    # 신규 인스턴스를 강제로 만들기 위해 기존 싱글턴을 비운다.
+    clear_instance = getattr(shell_cls, "clear_instance", None)
+    if clear_instance:
+        clear_instance()
+
+    shell = shell_cls.instance()
+    try:
+        yield shell
+    finally:
+        # 이벤트 핸들러와 싱글턴 상태를 깨끗하게 돌려놓는다.
+        callbacks = shell.events.callbacks.get("post_run_cell")
+        if callbacks is not None:
+            callbacks.clear()
+        if clear_instance:
+            clear_instance()
+
+
+@pytest.fixture
+def terminal_shell():
+    """단일 TerminalInteractiveShell로 빠르게 검증할 때 사용한다."""
+    from IPython.terminal.interactiveshell import TerminalInteractiveShell
+
+    TerminalInteractiveShell.clear_instance()
+    shell = TerminalInteractiveShell.instance()
+    shell.parent_header = {"metadata": {"cellId": "dietnb-test-cell"}}
+    try:
+        yield shell
+    finally:
+        callbacks = shell.events.callbacks.get("post_run_cell")
+        if callbacks is not None:
+            callbacks.clear()
+        TerminalInteractiveShell.clear_instance()
+
+
+@pytest.fixture(autouse=True)
+def restore_matplotlib_repr():
+    """Figure에 적용된 monkey patch를 테스트 후 원복한다."""
+    original_png = getattr(Figure, "_repr_png_", None)
+    original_html = getattr(Figure, "_repr_html_", None)
+    yield
+
+    if original_png is not None:
+        Figure._repr_png_ = original_png
+    elif hasattr(Figure, "_repr_png_"):
+        del Figure._repr_png_
+
+    if original_html is not None:
+        Figure._repr_html_ = original_html
+    elif hasattr(Figure, "_repr_html_"):
+        del Figure._repr_html_
+
+
+@pytest.fixture(autouse=True)
+def reset_registry_state():
+    """_FigureRegistry, 옵션, 통계 등 전역 상태를 비워 다른 테스트와 간섭을 방지한다."""
+    yield
+    _core._registry.clear()
+    _core._registry.set_max_cells(None)
+    if _core._writer is not None:
+        _core._writer.shutdown()
+        _core._writer = None
+    _core._shutdown_optimizer()
+    _core._render_cache = None
+    _core._context_cache = None
+    _core._reset_assets()
+    _manifest.clear()
+    _config.configure()
+    _stats.reset()
+    _stats.open_log(None)
+
+
+@pytest.fixture
+def detected_notebook(tmp_path):
+    notebook = tmp_path / "sample.ipynb"
+    notebook.touch()
+    return notebook
+
+
+@pytest.fixture(autouse=True)
+def patch_notebook_detection(monkeypatch, detected_notebook):
+    monkeypatch.setattr(_core, "_resolve_notebook_path", lambda _ip: detected_notebook)
+
+
+@pytest.fixture(autouse=True)
+def temp_cwd(tmp_path, monkeypatch):
+    """테스트마다 임시 작업 디렉터리를 사용해 생성 파일을 격리한다."""
+    monkeypatch.chdir(tmp_path)
+    yield
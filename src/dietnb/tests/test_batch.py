@@ -0,0 +1,67 @@
+import re
+
+import matplotlib.pyplot as plt
+from matplotlib.ticker import FuncFormatter
+from PIL import Image
+
+import dietnb
+from dietnb import _batch, _core, _stats
+
+
+def _src(html):
+    return re.search(r'<img src="([^"]*)"', html).group(1)
+
+
+def test_batch_renders_figures_on_workers_in_display_order(terminal_shell):
+    """batch 안에서 표시한 그림은 표시 순서대로 출력되고, 재사용된 Figure도 표시 시점의 모습으로 작업 프로세스에서 렌더링된다."""
+    shell = terminal_shell
+    shell.execution_count = 1
+    shell.parent_header = {"metadata": {"cellId": "batch-cell"}}
+    dietnb.activate(shell, dpi=40, output="compact")
+    try:
+        fig, ax = plt.subplots(figsize=(2, 2))
+        outputs = []
+        with dietnb.batch(workers=2):
+            for size in (2, 3, 4):
+                # The same figure is changed between displays
+                fig.set_size_inches(size, 2)
+                outputs.append(fig._repr_html_())
+            # Unpicklable figures fall back to in-process rendering
+            ax.xaxis.set_major_formatter(FuncFormatter(lambda x, pos: f"{x:.0f}"))
+            outputs.append(fig._repr_html_())
+        plt.close(fig)
+
+        image_dir = _core._get_notebook_image_dir(shell)
+        names = [_src(html).rsplit("/", 1)[1] for html in outputs]
+        assert [name.split("_")[1] for name in names] == ["1", "2", "3", "4"]
+        widths = []
+        for name in names:
+            with Image.open(image_dir / name) as image:
+                widths.append(image.width)
+        assert widths[0] < widths[1] < widths[2]
+
+        counters = _stats.snapshot()["counters"]
+        assert counters["figures_batched"] == 3 and counters["batch_unpicklable"] == 1
+        assert _batch.pending() == 0
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_render_workers_batches_every_cell(terminal_shell):
+    """render_workers 옵션은 모든 셀의 그림을 작업 프로세스로 보내고, 셀이 끝날 때 파일이 쓰여 있도록 기다린다."""
+    shell = terminal_shell
+    shell.execution_count = 1
+    shell.parent_header = {"metadata": {"cellId": "auto-cell"}}
+    dietnb.activate(shell, dpi=40, render_workers=1)
+    try:
+        fig, ax = plt.subplots(figsize=(2, 2))
+        ax.plot([0, 1], [1, 0])
+        html = fig._repr_html_()
+        for callback in list(shell.events.callbacks["post_run_cell"]):
+            callback(None)
+
+        image_dir = _core._get_notebook_image_dir(shell)
+        assert (image_dir / _src(html).rsplit("/", 1)[1]).stat().st_size > 0
+        assert _stats.snapshot()["counters"]["figures_batched"] == 1
+    finally:
+        dietnb.deactivate(shell)
@@ -0,0 +1,98 @@
+import numpy as np
+import matplotlib.pyplot as plt
+import pytest
+
+import dietnb
+from dietnb import _core
+
+
+def _noisy_heatmap(figsize):
+    fig, ax = plt.subplots(figsize=figsize)
+    y, x = np.mgrid[0:1:300j, 0:1:300j]
+    noise = np.random.default_rng(0).random((300, 300))
+    ax.imshow(np.sin(12 * x) * np.cos(9 * y) + 0.3 * noise, interpolation="bilinear")
+    return fig
+
+
+def _attr(html, name):
+    return html.split(f'{name}="', 1)[1].split('"', 1)[0]
+
+
+def test_byte_budget_lowers_dpi_until_figure_fits(terminal_shell):
+    """바이트 예산을 넘는 그림은 dpi를 낮춰 다시 그리고, 결정을 data- 속성에 남긴다."""
+    shell = terminal_shell
+    dietnb.activate(shell, max_image_bytes=200_000, min_dpi=10)
+    try:
+        shell.execution_count = 1
+        fig = _noisy_heatmap((8, 6))
+        html = fig._repr_html_()
+        plt.close(fig)
+    finally:
+        dietnb.deactivate(shell)
+
+    image_dir = _core._get_notebook_image_dir(shell)
+    (written,) = image_dir.iterdir()
+    assert written.stat().st_size <= 200_000
+    assert _attr(html, "data-dietnb-budget") == "bytes"
+    assert int(_attr(html, "data-dietnb-dpi")) < 150
+    assert _attr(html, "alt") == written.name
+    counters = dietnb.stats()["counters"]
+    assert counters["budget_bytes"] == 1 and counters["budget_dpi_reduced"] == 1
+
+
+def test_byte_budget_switches_format_at_min_dpi(terminal_shell):
+    """dpi를 더 낮출 수 없으면 다른 포맷으로 바꿔 예산을 맞춘다."""
+    shell = terminal_shell
+    dietnb.activate(shell, max_image_bytes=300_000, min_dpi=150)
+    try:
+        shell.execution_count = 1
+        fig = _noisy_heatmap((8, 6))
+        html = fig._repr_html_()
+        plt.close(fig)
+    finally:
+        dietnb.deactivate(shell)
+
+    assert _attr(html, "data-dietnb-format") in ("webp", "jpeg")
+    assert not _attr(html, "alt").endswith(".png")
+    assert dietnb.stats()["counters"]["budget_format_changed"] == 1
+
+
+def test_pixel_budget_caps_dpi_before_rendering(terminal_shell):
+    """픽셀 예산은 렌더링 전에 dpi를 낮춰 큰 figsize를 제한한다."""
+    shell = terminal_shell
+    dietnb.activate(shell, max_image_pixels=100_000, async_writes=True)
+    try:
+        shell.execution_count = 1
+        fig, ax = plt.subplots(figsize=(40, 30))
+        ax.plot([0, 1], [0, 1])
+        html = fig._repr_html_()
+        plt.close(fig)
+        assert _core._writer.flush() == []
+    finally:
+        dietnb.deactivate(shell)
+
+    assert _attr(html, "data-dietnb-budget") == "pixels"
+    assert int(_attr(html, "data-dietnb-dpi")) == dietnb._config.options.min_dpi
+    assert dietnb.stats()["counters"]["budget_pixels"] == 1
+
+
+def test_figures_within_budget_are_unchanged(terminal_shell):
+    """예산 안의 그림에는 아무 속성도 붙지 않는다."""
+    shell = terminal_shell
+    dietnb.activate(shell, max_image_bytes=10_000_000, max_image_pixels=10_000_000)
+    try:
+        shell.execution_count = 1
+        fig, ax = plt.subplots()
+        ax.plot([0, 1], [0, 1])
+        html = fig._repr_html_()
+        plt.close(fig)
+    finally:
+        dietnb.deactivate(shell)
+    assert "data-dietnb-budget" not in html
+
+
+def test_invalid_budget_options_are_rejected(terminal_shell):
+    """0 이하의 예산이나 min_dpi는 ValueError를 일으킨다."""
+    for kwargs in ({"max_image_bytes": 0}, {"max_image_pixels": -1}, {"min_dpi": 0}):
+        with pytest.raises(ValueError):
+            dietnb.activate(terminal_shell, **kwargs)
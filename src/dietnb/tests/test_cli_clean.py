@@ -0,0 +1,90 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import dietnb
+from dietnb import _cli, _clean
+
+
+def _notebook(path, *srcs):
+    outputs = [
+        {"output_type": "display_data", "metadata": {},
+         "data": {"text/html": [f'<img src="{src}" alt="x" class="dietnb-img">\n']}}
+        for src in srcs
+    ]
+    cells = [{"cell_type": "code", "execution_count": 1, "metadata": {}, "source": [], "outputs": outputs}]
+    path.write_text(json.dumps({"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}))
+
+
+def _image_dir(path, *names):
+    path.mkdir(parents=True)
+    for name in names:
+        (path / name).write_bytes(b"png")
+    return path
+
+
+@pytest.fixture
+def project(tmp_path):
+    _notebook(tmp_path / "a.ipynb", "a_dietnb_imgs/1_1_aaaaaaaaaaaa.png")
+    _image_dir(tmp_path / "a_dietnb_imgs", "1_1_aaaaaaaaaaaa.png", "2_1_bbbbbbbbbbbb.png", "notes.png")
+    (tmp_path / "sub").mkdir()
+    _notebook(tmp_path / "sub" / "b.ipynb", "b_dietnb_imgs/0123456789abcdef0123.png")
+    _image_dir(tmp_path / "sub" / "b_dietnb_imgs", "0123456789abcdef0123.png", "fedcba9876543210fedc.png")
+    _image_dir(tmp_path / "sub" / "renamed_dietnb_imgs", "3_1_cccccccccccc.png")
+    _image_dir(tmp_path / ".hidden" / "x_dietnb_imgs", "1_1_dddddddddddd.png")
+    return tmp_path
+
+
+def _run(capsys, *argv):
+    with pytest.raises(SystemExit) as exit_info:
+        _cli.main(["clean", *argv])
+    return exit_info.value.code, capsys.readouterr().out
+
+
+def test_find_image_dirs_pairs_notebooks_and_orphans(project):
+    """노트북과 이미지 폴더를 짝짓고, 노트북이 없는 폴더는 고아로 찾는다."""
+    pairs = _clean.find_image_dirs([project])
+    assert [(nb.name if nb else None, d.name) for nb, d in pairs] == [
+        ("a.ipynb", "a_dietnb_imgs"),
+        ("b.ipynb", "b_dietnb_imgs"),
+        (None, "renamed_dietnb_imgs"),
+    ]
+    assert _clean.find_image_dirs([project / "a.ipynb"]) == [(project / "a.ipynb", project / "a_dietnb_imgs")]
+
+
+def test_clean_dry_run_reports_json_without_deleting(project, capsys):
+    """--dry-run --json은 삭제 대상만 JSON으로 보고하고 파일은 남긴다."""
+    code, out = _run(capsys, str(project), "--dry-run", "--json", "--jobs", "2")
+    summary = json.loads(out)
+
+    assert code == 0
+    assert summary["dry_run"] and summary["deleted"] == 2
+    assert summary["orphans"] == [str(project / "sub" / "renamed_dietnb_imgs")]
+    assert (project / "a_dietnb_imgs" / "2_1_bbbbbbbbbbbb.png").exists()
+
+
+def test_clean_deletes_unreferenced_and_removes_orphans(project, capsys):
+    """참조되지 않은 이미지를 지우고 --remove-orphans면 고아 폴더도 제거한다."""
+    code, _ = _run(capsys, str(project), "--jobs", "1", "--remove-orphans")
+
+    assert code == 0
+    assert sorted(p.name for p in (project / "a_dietnb_imgs").iterdir()) == ["1_1_aaaaaaaaaaaa.png", "notes.png"]
+    assert [p.name for p in (project / "sub" / "b_dietnb_imgs").iterdir()] == ["0123456789abcdef0123.png"]
+    assert not (project / "sub" / "renamed_dietnb_imgs").exists()
+    assert (project / ".hidden" / "x_dietnb_imgs" / "1_1_dddddddddddd.png").exists()
+
+
+def test_cli_does_not_import_matplotlib_or_ipython():
+    """clean/convert 명령과 작업 프로세스는 matplotlib과 IPython을 불러오지 않는다."""
+    code = (
+        "import sys, dietnb._cli, dietnb._clean, dietnb._convert;"
+        "print([m for m in ('matplotlib', 'IPython', 'dietnb._core') if m in sys.modules])"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=Path(dietnb.__file__).parents[1],
+        capture_output=True, text=True, check=True,
+    )
+    assert completed.stdout.strip() == "[]"
@@ -0,0 +1,66 @@
+import matplotlib.pyplot as plt
+
+import dietnb
+from dietnb import _core
+
+
+def test_resolution_context_is_reused_within_one_execution(terminal_shell, monkeypatch, detected_notebook, tmp_path):
+    """한 번의 셀 실행 동안 노트북 경로 해석은 한 번만 일어나고 입력이 바뀌면 다시 계산된다."""
+    shell = terminal_shell
+    calls = []
+
+    def counting_resolve(ip):
+        calls.append(ip)
+        return detected_notebook
+
+    monkeypatch.setattr(_core, "_resolve_notebook_path", counting_resolve)
+    dietnb.activate(shell)
+    try:
+        shell.execution_count = 1
+        for _ in range(3):
+            fig, ax = plt.subplots()
+            assert fig._repr_html_() is not None
+            plt.close(fig)
+        assert len(calls) == 1
+
+        # A new execution count invalidates the context
+        shell.execution_count = 2
+        fig, ax = plt.subplots()
+        fig._repr_html_()
+        plt.close(fig)
+        assert len(calls) == 2
+
+        # So does a change of the working directory
+        other = tmp_path / "elsewhere"
+        other.mkdir()
+        monkeypatch.chdir(other)
+        fig, ax = plt.subplots()
+        fig._repr_html_()
+        plt.close(fig)
+        assert len(calls) == 3
+
+        counters = dietnb.stats()["counters"]
+        assert counters["context_cache_hits"] == 2
+        assert counters["context_cache_misses"] == 3
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_write_recreates_directory_removed_mid_execution(terminal_shell):
+    """실행 도중 이미지 폴더가 지워져도 다시 만들어 저장한다."""
+    shell = terminal_shell
+    shell.execution_count = 5
+    dietnb.activate(shell)
+    try:
+        fig, ax = plt.subplots()
+        fig._repr_html_()
+        image_dir = _core._get_resolution_context(shell).image_dir
+        for path in image_dir.iterdir():
+            path.unlink()
+        image_dir.rmdir()
+
+        assert fig._repr_html_() is not None
+        assert (image_dir / f"5_2_{_core._get_cell_key(shell)}.png").exists()
+        plt.close(fig)
+    finally:
+        dietnb.deactivate(shell)
@@ -0,0 +1,168 @@
+import base64
+import hashlib
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from dietnb import _cli, _clean, _convert
+
+
+def _png(seed=0, size=96):
+    pixels = np.random.default_rng(seed).integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _b64_lines(data):
+    # Jupyter stores base64 with a trailing newline; split it to exercise list values
+    text = base64.b64encode(data).decode() + "\n"
+    return [text[i:i + 76] for i in range(0, len(text), 76)]
+
+
+def _write_notebook(path, cells):
+    notebook = {"cells": cells, "metadata": {"kernelspec": {"name": "python3"}}, "nbformat": 4, "nbformat_minor": 5}
+    # nbformat's on-disk layout, including non-ASCII text left unescaped
+    path.write_text(json.dumps(notebook, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+def _cell(cell_id, exec_count, *outputs):
+    return {"cell_type": "code", "execution_count": exec_count, "id": cell_id, "metadata": {},
+            "source": ["plt.plot([1, 2])  # 그림"], "outputs": list(outputs)}
+
+
+def _image_output(data, mimetype="image/png", lines=True, metadata=None):
+    value = _b64_lines(data) if lines else base64.b64encode(data).decode()
+    return {"output_type": "display_data", "metadata": metadata or {},
+            "data": {mimetype: value, "text/plain": ["<Figure size 640x480 with 1 Axes>"]}}
+
+
+@pytest.fixture
+def notebook(tmp_path):
+    (tmp_path / "project").mkdir()
+    path = tmp_path / "project" / "analysis.ipynb"
+    _write_notebook(path, [
+        {"cell_type": "markdown", "id": "intro", "metadata": {}, "source": ["# 제목 \"quoted\""]},
+        _cell("cell-one", 3,
+              _image_output(_png(0), metadata={"image/png": {"width": 320, "height": 240}}),
+              _image_output(_png(1), lines=False)),
+        _cell("cell-two", None,
+              {"output_type": "display_data", "metadata": {},
+               "data": {"image/png": _b64_lines(_png(2)), "text/html": ["<b>rich</b>"]}},
+              _image_output(_png(3, size=4))),
+    ])
+    return path
+
+
+def _key(cell_id):
+    return hashlib.sha1(cell_id.encode()).hexdigest()[:12]
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1 << 20])
+def test_convert_notebook_moves_images_and_keeps_everything_else(notebook, chunk_size):
+    """임베드된 PNG를 이미지 폴더로 옮기고 출력은 dietnb HTML로 바꾸며, 나머지 내용은 그대로 둔다."""
+    original = json.loads(notebook.read_text(encoding="utf-8"))
+    report = _convert.convert_notebook(notebook, chunk_size=chunk_size)
+
+    assert report["error"] is None and report["images"] == 2 and report["skipped"] == 2
+    assert report["bytes_reclaimed"] == report["bytes_before"] - notebook.stat().st_size > 0
+
+    image_dir = notebook.with_name("analysis_dietnb_imgs")
+    names = [f"3_1_{_key('cell-one')}.png", f"3_2_{_key('cell-one')}.png"]
+    assert sorted(p.name for p in image_dir.iterdir()) == names
+    assert (image_dir / names[0]).read_bytes() == _png(0)
+    assert (image_dir / names[1]).read_bytes() == _png(1)
+    assert report["image_bytes"] == len(_png(0)) + len(_png(1))
+
+    converted = json.loads(notebook.read_text(encoding="utf-8"))
+    first, second = converted["cells"][1]["outputs"]
+    assert "image/png" not in first["data"]
+    assert f'src="analysis_dietnb_imgs/{names[0]}"' in first["data"]["text/html"]
+    assert 'width="320" height="240"' in first["data"]["text/html"]
+    assert f'alt="{names[1]}"' in second["data"]["text/html"]
+    assert first["data"]["text/plain"] == original["cells"][1]["outputs"][0]["data"]["text/plain"]
+
+    # Apart from the replaced members the file is byte-for-byte the same
+    for output, new in zip(original["cells"][1]["outputs"], (first, second)):
+        output["data"] = {
+            ("text/html" if key == "image/png" else key): (new["data"]["text/html"] if key == "image/png" else value)
+            for key, value in output["data"].items()
+        }
+    assert notebook.read_text(encoding="utf-8") == json.dumps(original, indent=1, ensure_ascii=False) + "\n"
+
+
+def test_convert_dry_run_and_errors_leave_notebook_untouched(notebook):
+    """--dry-run은 예상 절감량만 계산하고, 깨진 노트북은 오류로 보고하며 건드리지 않는다."""
+    before = notebook.read_bytes()
+    report = _convert.convert_notebook(notebook, dry_run=True)
+    assert report["images"] == 2 and report["bytes_reclaimed"] > 0
+    assert notebook.read_bytes() == before
+    assert not notebook.with_name("analysis_dietnb_imgs").exists()
+
+    broken = notebook.with_name("broken.ipynb")
+    broken.write_text(notebook.read_text(encoding="utf-8")[:-200], encoding="utf-8")
+    truncated = broken.read_bytes()
+    report = _convert.convert_notebook(broken)
+    assert report["error"] and report["images"] == 0
+    assert broken.read_bytes() == truncated
+    assert sorted(p.name for p in notebook.parent.iterdir()) == ["analysis.ipynb", "broken.ipynb"]
+
+
+def test_convert_never_overwrites_existing_images(notebook, monkeypatch):
+    """이미지 폴더에 같은 이름의 파일(실행 중인 세션이나 이전 변환)이 있으면 다음 번호를 쓰고 덮어쓰지 않는다."""
+    image_dir = notebook.with_name("analysis_dietnb_imgs")
+    image_dir.mkdir()
+    live = image_dir / f"3_1_{_key('cell-one')}.png"
+    live.write_bytes(b"live session image")
+
+    report = _convert.convert_notebook(notebook)
+    assert report["error"] is None and report["images"] == 2
+    assert live.read_bytes() == b"live session image"
+    assert (image_dir / f"3_2_{_key('cell-one')}.png").read_bytes() == _png(0)
+    assert (image_dir / f"3_3_{_key('cell-one')}.png").read_bytes() == _png(1)
+
+    # A file that appears between planning and writing aborts the conversion
+    other = notebook.with_name("other.ipynb")
+    _write_notebook(other, [_cell("cell-three", 1, _image_output(_png(4)))])
+    before = other.read_bytes()
+    other_dir = other.with_name("other_dietnb_imgs")
+    planned = _convert._plan
+
+    def plan_then_race(*args):
+        plan = planned(*args)
+        for item in plan[0].values():
+            item["filepath"].parent.mkdir(exist_ok=True)
+            item["filepath"].write_bytes(b"written meanwhile")
+        return plan
+
+    monkeypatch.setattr(_convert, "_plan", plan_then_race)
+    report = _convert.convert_notebook(other)
+    assert report["error"] and "appeared" in report["error"]
+    assert other.read_bytes() == before
+    assert [p.read_bytes() for p in other_dir.iterdir()] == [b"written meanwhile"]
+
+
+def test_cli_convert_many_notebooks_then_clean_keeps_images(tmp_path, capsys):
+    """convert 하위 명령은 여러 노트북을 병렬로 변환하고 절감량을 보고하며, clean은 변환된 이미지를 지우지 않는다."""
+    tmp_path = tmp_path / "project"
+    tmp_path.mkdir()
+    for index, folder in enumerate(["", "sub", ".hidden"]):
+        (tmp_path / folder).mkdir(exist_ok=True)
+        _write_notebook(tmp_path / folder / f"nb{index}.ipynb", [_cell(f"c{index}", 1, _image_output(_png(index)))])
+
+    with pytest.raises(SystemExit) as exit_info:
+        _cli.main(["convert", str(tmp_path), "--json", "--jobs", "2", "--compact"])
+    summary = json.loads(capsys.readouterr().out)
+
+    assert exit_info.value.code == 0
+    assert summary["notebooks"] == 2 and summary["images"] == 2 and not summary["errors"]
+    assert summary["bytes_reclaimed"] == summary["bytes_before"] - summary["bytes_after"] > 0
+    html = "".join(json.loads((tmp_path / "nb0.ipynb").read_text())["cells"][0]["outputs"][0]["data"]["text/html"])
+    assert "dietnb-compact" in html and "dietnbAssets" in html
+    assert list((tmp_path / ".hidden").iterdir()) == [tmp_path / ".hidden" / "nb2.ipynb"]
+
+    assert _clean.clean_tree([tmp_path])["deleted"] == 0
+    assert len(list((tmp_path / "sub" / "nb1_dietnb_imgs").iterdir())) == 1
@@ -0,0 +1,131 @@
+import base64
+import json
+import zipfile
+
+import pytest
+
+from dietnb import _cli, _export, _templates
+
+
+def _figure_html(src, filename, attrs=""):
+    return _templates.COPY_BUTTON_HTML.format(img_src=src, filename=filename, img_attrs=attrs) + _templates.COPY_BUTTON_SCRIPT
+
+
+def _output(html):
+    lines = html.splitlines(keepends=True)
+    return {"output_type": "display_data", "metadata": {}, "data": {"text/html": lines, "text/plain": ["<Figure>"]}}
+
+
+@pytest.fixture
+def notebook(tmp_path):
+    (tmp_path / "project").mkdir()
+    path = tmp_path / "project" / "report.ipynb"
+    image_dir = path.with_name("report_dietnb_imgs")
+    image_dir.mkdir()
+    (image_dir / "1_1_aaaaaaaaaaaa.png").write_bytes(b"\x89PNG first")
+    (image_dir / "1_2_aaaaaaaaaaaa.svg").write_bytes(b"<svg>\xea\xb7\xb8\xeb\xa6\xbc</svg>")
+    (image_dir / "2_1_bbbbbbbbbbbb.html").write_text("<table><tr><td>full</td></tr></table>")
+    (image_dir / "9_1_cccccccccccc.png").write_bytes(b"unreferenced")
+    sidecar = _templates.SIDECAR_HTML.format(
+        preview="full", note="Output truncated by dietnb.", src="report_dietnb_imgs/2_1_bbbbbbbbbbbb.html",
+        filename="2_1_bbbbbbbbbbbb.html", size="1 KB",
+    )
+    cells = [
+        {"cell_type": "markdown", "id": "m", "metadata": {}, "source": ["# 결과"]},
+        {"cell_type": "code", "execution_count": 1, "id": "a", "metadata": {}, "source": [], "outputs": [
+            _output(_figure_html("report_dietnb_imgs/1_1_aaaaaaaaaaaa.png", "1_1_aaaaaaaaaaaa.png", ' width="320"')),
+            _output(_figure_html("report_dietnb_imgs/1_2_aaaaaaaaaaaa.svg", "1_2_aaaaaaaaaaaa.svg")),
+            _output(_figure_html("report_dietnb_imgs/missing.png", "missing.png")),
+        ]},
+        {"cell_type": "code", "execution_count": 2, "id": "b", "metadata": {}, "source": [], "outputs": [
+            _output(sidecar),
+            _output("<b>plain html</b>"),
+        ]},
+    ]
+    notebook = {"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}
+    path.write_text(json.dumps(notebook, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+    return path
+
+
+def _html(output):
+    value = output["data"]["text/html"]
+    return "".join(value) if isinstance(value, list) else value
+
+
+@pytest.mark.parametrize("chunk_size", [5, 1 << 20])
+def test_inline_notebook_embeds_referenced_files(notebook, tmp_path, chunk_size):
+    """inline은 이미지를 data URI로, 사이드카 출력을 원래 내용으로 되돌리고 나머지는 그대로 둔다."""
+    target = tmp_path / "shared.ipynb"
+    report = _export.inline_notebook(notebook, target, jobs=2, chunk_size=chunk_size)
+    assert report["outputs"] == 3 and report["files"] == 4
+
+    original = json.loads(notebook.read_text(encoding="utf-8"))
+    inlined = json.loads(target.read_text(encoding="utf-8"))
+    png, svg, missing = inlined["cells"][1]["outputs"]
+    src = _html(png).split('src="', 1)[1].split('"', 1)[0]
+    assert src.startswith("data:image/png;base64,")
+    assert base64.b64decode(src.split(",", 1)[1]) == b"\x89PNG first"
+    assert 'width="320"' in _html(png) and "dietnb-copy-btn" not in _html(png)
+    assert "data:image/svg+xml;base64," in _html(svg)
+    assert missing == original["cells"][1]["outputs"][2]
+
+    sidecar, plain = inlined["cells"][2]["outputs"]
+    assert _html(sidecar) == "<table><tr><td>full</td></tr></table>"
+    assert plain == original["cells"][2]["outputs"][1]
+    assert inlined["cells"][0] == original["cells"][0]
+
+
+def test_cli_bundle_packs_only_referenced_files(notebook, capsys):
+    """bundle 하위 명령은 노트북과 참조된 파일만 상대 경로 그대로 zip으로 묶는다."""
+    with pytest.raises(SystemExit) as exit_info:
+        _cli.main(["bundle", str(notebook), "--json"])
+    (report,) = json.loads(capsys.readouterr().out)
+
+    assert exit_info.value.code == 0
+    assert report["files"] == 3 and report["missing"] == [str(notebook.with_name("report_dietnb_imgs") / "missing.png")]
+    with zipfile.ZipFile(notebook.with_suffix(".zip")) as archive:
+        assert sorted(archive.namelist()) == [
+            "report.ipynb",
+            "report_dietnb_imgs/1_1_aaaaaaaaaaaa.png",
+            "report_dietnb_imgs/1_2_aaaaaaaaaaaa.svg",
+            "report_dietnb_imgs/2_1_bbbbbbbbbbbb.html",
+        ]
+        assert archive.getinfo("report_dietnb_imgs/1_1_aaaaaaaaaaaa.png").compress_type == zipfile.ZIP_STORED
+        assert archive.read("report.ipynb") == notebook.read_bytes()
+
+
+def test_cli_inline_writes_next_to_notebook(notebook, capsys):
+    """inline 하위 명령은 기본적으로 노트북 옆에 X.inline.ipynb를 쓴다."""
+    with pytest.raises(SystemExit) as exit_info:
+        _cli.main(["inline", str(notebook)])
+    assert exit_info.value.code == 0
+    assert "report.inline.ipynb" in capsys.readouterr().out
+    assert "data:image/png;base64," in notebook.with_name("report.inline.ipynb").read_text(encoding="utf-8")
+
+
+def test_nbconvert_preprocessor_inlines_images(notebook):
+    """nbconvert 전처리기는 메모리에 읽은 노트북의 dietnb 출력을 인라인한다."""
+    nbformat = pytest.importorskip("nbformat")
+    pytest.importorskip("nbconvert")
+    from dietnb.nbconvert import InlineFilesPreprocessor
+
+    nb = nbformat.read(str(notebook), as_version=4)
+    preprocessor = InlineFilesPreprocessor(enabled=True)
+    nb, _ = preprocessor.preprocess(nb, {"metadata": {"path": str(notebook.parent)}})
+
+    assert preprocessor.inlined == 3
+    assert "data:image/png;base64," in nb.cells[1].outputs[0].data["text/html"]
+
+
+def test_inline_html_removes_partial_output_on_failure(notebook, monkeypatch):
+    """HTML 변환이 실패하면 임시 파일을 지우고 기존 출력도 건드리지 않는다."""
+    nbconvert = pytest.importorskip("nbconvert")
+    target = notebook.with_name("report.html")
+    target.write_text("previous", encoding="utf-8")
+    # A lone surrogate fails while the temporary file is being written
+    monkeypatch.setattr(nbconvert.HTMLExporter, "from_filename", lambda self, *a, **k: ("<p>\ud800</p>", {}))
+
+    with pytest.raises(UnicodeEncodeError):
+        _export.inline_notebook_html(notebook, target)
+    assert sorted(p.name for p in notebook.parent.iterdir() if p.is_file()) == ["report.html", "report.ipynb"]
+    assert target.read_text(encoding="utf-8") == "previous"
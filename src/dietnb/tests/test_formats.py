@@ -0,0 +1,120 @@
+import io
+
+import numpy as np
+import matplotlib.pyplot as plt
+import pytest
+from PIL import Image
+
+import dietnb
+from dietnb import _core, _formats
+
+
+def _run_post_cell(shell):
+    for callback in list(shell.events.callbacks.get("post_run_cell")):
+        callback(None)
+
+
+def _display(shell, exec_count, draw):
+    shell.execution_count = exec_count
+    fig, ax = plt.subplots()
+    draw(ax)
+    try:
+        return fig._repr_html_()
+    finally:
+        plt.close(fig)
+
+
+def _line(ax):
+    ax.plot([0, 1, 2], [2, 0, 1])
+
+
+def _dense_scatter(ax):
+    rng = np.random.default_rng(0)
+    ax.scatter(rng.random(20_000), rng.random(20_000), s=1)
+
+
+def _heatmap(ax):
+    ax.imshow(np.arange(16).reshape(4, 4))
+
+
+@pytest.mark.parametrize("fmt, ext", [("svg", ".svg"), ("jpeg", ".jpg"), ("webp", ".webp")])
+def test_configured_format_uses_matching_extension(terminal_shell, fmt, ext):
+    """설정한 포맷에 맞는 확장자로 저장하고, 재실행 시 이전 파일을 지운다."""
+    shell = terminal_shell
+    dietnb.activate(shell, format=fmt, dpi=72)
+    try:
+        html = _display(shell, 1, _line)
+        assert f"{ext}\"" in html
+        _display(shell, 2, _line)
+        _run_post_cell(shell)
+
+        image_dir = _core._get_notebook_image_dir(shell)
+        files = sorted(p.name for p in image_dir.iterdir())
+        assert len(files) == 1 and files[0].startswith("2_1_") and files[0].endswith(ext)
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_auto_format_picks_vector_for_sparse_and_raster_for_dense(terminal_shell):
+    """auto 모드는 단순한 그림은 SVG, 점이 많거나 이미지가 있는 그림은 PNG로 저장한다."""
+    shell = terminal_shell
+    dietnb.activate(shell, format="auto")
+    try:
+        html = [_display(shell, 1, draw) for draw in (_line, _dense_scatter, _heatmap)]
+    finally:
+        dietnb.deactivate(shell)
+
+    assert [h.split('alt="', 1)[1].split('"', 1)[0][-4:] for h in html] == [".svg", ".png", ".png"]
+    assert dietnb.stats()["counters"]["format_svg"] == 1
+
+
+def test_figure_elements_counts_primitives():
+    """벡터 요소 수 추정은 선의 점과 컬렉션 크기를 세고, 이미지는 -1로 표시한다."""
+    fig, ax = plt.subplots()
+    try:
+        ax.plot(range(100))
+        sparse = _formats.figure_elements(fig)
+        _dense_scatter(ax)
+        assert _formats.figure_elements(fig) >= sparse + 20_000
+        _heatmap(ax)
+        assert _formats.figure_elements(fig) == -1
+    finally:
+        plt.close(fig)
+
+
+def test_invalid_format_options_are_rejected(terminal_shell):
+    """지원하지 않는 포맷이나 dpi는 ValueError를 일으킨다."""
+    with pytest.raises(ValueError):
+        dietnb.activate(terminal_shell, format="gif")
+    with pytest.raises(ValueError):
+        dietnb.activate(terminal_shell, format="auto", auto_raster_format="svg")
+    with pytest.raises(ValueError):
+        dietnb.activate(terminal_shell, dpi=0)
+
+
+def test_fast_encoder_matches_default_pixels(terminal_shell):
+    """fast 인코더는 기본 인코더와 같은 픽셀을 만들고 인코딩 시간을 기록한다."""
+    fig, ax = plt.subplots()
+    _line(ax)
+    try:
+        dietnb.activate(terminal_shell)
+        default = _core._render_figure(fig, "png", 100)
+        dietnb.activate(terminal_shell, encoder="fast", fast_compress_level=1)
+        fast = _core._render_figure(fig, "png", 100)
+    finally:
+        dietnb.deactivate(terminal_shell)
+        plt.close(fig)
+
+    def pixels(data):
+        return np.asarray(Image.open(io.BytesIO(data)).convert("RGBA"))
+
+    assert np.array_equal(pixels(fast), pixels(default))
+    timings = dietnb.stats()["timings"]
+    assert timings["encode"]["count"] == 1 and timings["render"]["count"] == 2
+
+
+def test_encode_png_rgba_round_trips_transparency():
+    """RGBA 버퍼를 알파 채널까지 손실 없이 PNG로 인코딩한다."""
+    rgba = np.random.default_rng(1).integers(0, 256, size=(7, 5, 4), dtype=np.uint8)
+    data = _formats.encode_png_rgba(memoryview(rgba), compress_level=6)
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(data))), rgba)
@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+import dietnb
+from dietnb import _core, _lazy
+
+PACKAGE_ROOT = Path(dietnb.__file__).parents[1]
+
+SETUP = """
+import json, sys
+from IPython.terminal.interactiveshell import TerminalInteractiveShell
+shell = TerminalInteractiveShell.instance()
+shell.parent_header = {"metadata": {"cellId": "lazy-cell"}}
+import dietnb
+dietnb.activate(shell, lazy=True, format="svg")
+result = {"after_activate": "matplotlib" in sys.modules}
+for callback in shell.events.callbacks["post_run_cell"]:
+    callback(None)
+result["after_cell"] = "matplotlib" in sys.modules
+"""
+
+
+def _run(code, cwd):
+    env = dict(os.environ, MPLBACKEND="Agg")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(PACKAGE_ROOT), env.get("PYTHONPATH")]))
+    completed = subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(SETUP) + textwrap.dedent(code) + "\nprint(json.dumps(result))"],
+        env=env, cwd=cwd, capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("import_line", [
+    "import matplotlib.pyplot as plt\nfig = plt.figure()",
+    "from matplotlib.figure import Figure\nfig = Figure()",
+])
+def test_lazy_activation_patches_when_matplotlib_is_imported(import_line, tmp_path):
+    """lazy 활성화는 matplotlib을 불러오지 않고, 사용자가 불러오는 순간 설정된 옵션으로 Figure를 패치한다."""
+    result = _run(import_line + """
+fig.add_subplot().plot([1, 2])
+result["html"] = fig._repr_html_()
+for callback in shell.events.callbacks["post_run_cell"]:
+    callback(None)
+""", tmp_path)
+    assert result["after_activate"] is False and result["after_cell"] is False
+    assert "dietnb-img" in result["html"] and '.svg"' in result["html"]
+
+
+def test_lazy_activation_is_eager_when_matplotlib_is_loaded(ipython_shell):
+    """matplotlib이 이미 로드되어 있으면 lazy=True도 즉시 패치하고, deactivate는 대기 중인 훅을 제거한다."""
+    dietnb.activate(ipython_shell, lazy=True)
+    try:
+        assert _core._patch_applied and not _lazy.pending()
+    finally:
+        dietnb.deactivate(ipython_shell)
+
+    _lazy.install(lambda: None)
+    dietnb.deactivate(ipython_shell)
+    assert not _lazy.pending() and not any(isinstance(f, _lazy._ImportHook) for f in sys.meta_path)
+
+
+def test_lazy_activation_moves_large_outputs_without_plotting(tmp_path):
+    """lazy 활성화에서도 sidecar 훅은 바로 설치되고, 옮길 만큼 큰 출력이 나올 때만 matplotlib을 불러온다."""
+    result = _run("""
+dietnb.activate(shell, lazy=True, sidecar_min_bytes=1000)
+data, _ = shell.display_formatter.format("short")
+result["small"] = sorted(data)
+result["after_small"] = "matplotlib" in sys.modules
+data, _ = shell.display_formatter.format("x" * 5000)
+result["html"] = data.get("text/html", "")
+result["patched"] = sys.modules["dietnb._core"]._patch_applied
+for callback in shell.events.callbacks["post_run_cell"]:
+    callback(None)
+""", tmp_path)
+    assert result["small"] == ["text/plain"] and result["after_small"] is False
+    assert "dietnb-" in result["html"] and result["patched"] is True
+    (sidecar,) = tmp_path.rglob("*.txt")
+    assert sidecar.read_text() == "'" + "x" * 5000 + "'"
@@ -0,0 +1,227 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import matplotlib.pyplot as plt
+import pytest
+
+import dietnb
+from dietnb import _config, _core, _manifest
+
+
+def _run_post_cell(shell):
+    for callback in list(shell.events.callbacks.get("post_run_cell")):
+        callback(None)
+
+
+def _show(shell, exec_count, cell_id="cell-a"):
+    shell.execution_count = exec_count
+    shell.parent_header = {"metadata": {"cellId": cell_id}}
+    fig, ax = plt.subplots()
+    ax.plot([0, 1], [0, exec_count])
+    try:
+        return fig._repr_html_()
+    finally:
+        plt.close(fig)
+
+
+def test_reruns_use_manifest_instead_of_listing_directory(terminal_shell, monkeypatch):
+    """재실행 시 이전 이미지 삭제는 디렉터리 목록 조회 없이 매니페스트로 처리된다."""
+    shell = terminal_shell
+    dietnb.activate(shell)
+    try:
+        _show(shell, 1)
+        _run_post_cell(shell)
+
+        scans = []
+        original_scandir = os.scandir
+
+        def counting_scandir(path):
+            scans.append(path)
+            return original_scandir(path)
+
+        monkeypatch.setattr(os, "scandir", counting_scandir)
+        for exec_count in range(2, 6):
+            _show(shell, exec_count)
+            _run_post_cell(shell)
+        assert scans == []
+
+        image_dir = _core._get_notebook_image_dir(shell)
+        assert [p.name.split("_")[0] for p in image_dir.glob("*.png")] == ["5"]
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_manifest_rescans_after_external_changes(terminal_shell):
+    """커널 밖에서 파일이 바뀌면 디렉터리 mtime으로 감지해 다시 읽는다."""
+    shell = terminal_shell
+    dietnb.activate(shell)
+    try:
+        _show(shell, 1)
+        _run_post_cell(shell)
+        image_dir = _core._get_notebook_image_dir(shell)
+        (image_dir / "8_1_0123456789ab.png").write_bytes(b"older")
+        (image_dir / "9_1_0123456789ab.png").write_bytes(b"latest")
+
+        result = dietnb.clean_unused()
+        assert [os.path.basename(path) for path in result["deleted"]] == ["8_1_0123456789ab.png"]
+        assert len(result["kept"]) == 2
+
+        manifest = _manifest.get_manifest(_core._directory_key(image_dir))
+        assert set(manifest.records()) == {p.name for p in image_dir.glob("*.png")}
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_parse_cell_key():
+    """파일 이름에서 셀 키를 추출한다."""
+    assert _manifest.parse_cell_key("12_3_abcdef012345.png") == "abcdef012345"
+    assert _manifest.parse_cell_key("0123456789abcdef0123.png") is None
+    assert _manifest.parse_cell_key("notes") is None
+
+
+def test_shared_files_are_orphaned_by_last_reference(tmp_path):
+    """여러 셀이 공유하는 파일은 마지막 참조가 사라질 때만 삭제 대상이 된다."""
+    manifest = _manifest._DirectoryManifest(tmp_path)
+    (tmp_path / "shared.png").write_bytes(b"png")
+    manifest.add("shared.png", "a", 1, 1, 3, None)
+    manifest.add("shared.png", "b", 2, 1, 3, None)
+
+    assert manifest.release_cell("a") == set()
+    assert manifest.pop_orphans() == set()
+    assert manifest.release_cell("b") == {"shared.png"}
+    assert manifest.pop_orphans() == {"shared.png"}
+
+
+def test_persistent_manifest_survives_kernel_restart(terminal_shell):
+    """커널 재시작 후에도 각 셀의 최신 이미지는 유지하고 이전 실행 이미지만 정리한다."""
+    shell = terminal_shell
+    dietnb.activate(shell, persistent_manifest=True, storage="content")
+    try:
+        _show(shell, 1, "cell-a")
+        _show(shell, 2, "cell-b")
+        _run_post_cell(shell)
+        image_dir = _core._get_notebook_image_dir(shell)
+        assert (image_dir / _manifest.MANIFEST_FILENAME).exists()
+        kept = {p.name for p in image_dir.glob("*.png")}
+
+        # Simulate a restart: in-memory state is gone, an old leftover remains
+        _core._registry.clear()
+        _manifest.clear()
+        (image_dir / "0123456789abcdef0123.png").write_bytes(b"unreferenced")
+
+        result = dietnb.clean_unused()
+        assert [os.path.basename(path) for path in result["deleted"]] == ["0123456789abcdef0123.png"]
+        assert {p.name for p in image_dir.glob("*.png")} == kept
+
+        usage = dietnb.disk_usage()
+        assert usage["persistent"] and usage["files"] == 2 and usage["unreferenced_files"] == 0
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_persistent_manifest_is_shared_between_kernels(tmp_path):
+    """같은 디렉터리에 쓰는 두 커널은 서로의 기록을 본다."""
+    first = _manifest._DirectoryManifest(tmp_path, persistent=True)
+    second = _manifest._DirectoryManifest(tmp_path, persistent=True)
+    try:
+        assert second.files_for_cell("a") == set()
+        (tmp_path / "1_1_a.png").write_bytes(b"png")
+        first.add("1_1_a.png", "a", 1, 1, 3, "hash")
+        first.settle()
+
+        assert second.files_for_cell("a") == {"1_1_a.png"}
+        assert second.records()["1_1_a.png"].content_hash == "hash"
+
+        with sqlite3.connect(tmp_path / _manifest.MANIFEST_FILENAME) as conn:
+            rows = conn.execute("SELECT name, cell_key, exec_count, fig_index, size FROM files").fetchall()
+        assert rows == [("1_1_a.png", "a", 1, 1, 3)]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_rerun_keeps_files_written_by_other_live_kernels(tmp_path):
+    """다른 커널이 이 커널 시작 후에 쓴 파일은 재실행으로 삭제하지 않고, 이전 세션 파일만 삭제한다."""
+    old, fresh = tmp_path / "1_1_a.png", tmp_path / "2_1_a.png"
+    old.write_bytes(b"png")
+    fresh.write_bytes(b"png")
+    os.utime(old, (_manifest.PROCESS_START - 60, _manifest.PROCESS_START - 60))
+    manifest = _manifest._DirectoryManifest(tmp_path)
+
+    assert manifest.release_cell("a") == {"1_1_a.png", "2_1_a.png"}
+    assert manifest.pop_orphans() == {"1_1_a.png"}
+    assert "2_1_a.png" in manifest.records()
+
+
+def test_files_of_exited_writers_are_deleted(tmp_path, monkeypatch):
+    """영구 매니페스트에 기록된 작성 커널이 종료되었으면 그 파일을 삭제하고, 살아 있으면 남긴다."""
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                            capture_output=True, text=True, check=True)
+    writers = {"1_1_a.png": f"{_manifest.HOSTNAME}:{exited.stdout.strip()}",
+               "1_2_a.png": f"{_manifest.HOSTNAME}:{os.getppid()}"}
+    writer = _manifest._DirectoryManifest(tmp_path, persistent=True)
+    for name, writer_id in writers.items():
+        (tmp_path / name).write_bytes(b"png")
+        monkeypatch.setattr(_manifest, "WRITER_ID", writer_id)
+        writer.add(name, "a", 1, int(name[2]), 3, None)
+    writer.close()
+    monkeypatch.undo()
+
+    manifest = _manifest._DirectoryManifest(tmp_path, persistent=True)
+    try:
+        assert manifest.release_cell("a") == set(writers)
+        assert manifest.pop_orphans() == {"1_1_a.png"}
+    finally:
+        manifest.close()
+
+
+def test_namespace_separates_parallel_runs(terminal_shell, monkeypatch):
+    """namespace는 파일 이름에 들어가 같은 셀을 실행하는 병렬 실행끼리 파일을 덮어쓰지 않게 한다."""
+    shell = terminal_shell
+    monkeypatch.setenv("DIETNB_NAMESPACE", "run-7")
+    dietnb.activate(shell)
+    try:
+        _show(shell, 1)
+        _show(shell, 2)
+        _run_post_cell(shell)
+        image_dir = _core._get_notebook_image_dir(shell)
+        (name,) = [p.name for p in image_dir.glob("*.png")]
+        assert name.startswith("2_1_run-7_")
+        assert _manifest.parse_cell_key(name) == _core._get_cell_key(shell)
+    finally:
+        dietnb.deactivate(shell)
+
+    assert _config.configure(namespace="kernel").namespace == _config.KERNEL_NAMESPACE
+    with pytest.raises(ValueError):
+        _config.configure(namespace="a/b")
+
+
+def test_rerun_cleanup_is_scoped_to_the_namespace(terminal_shell):
+    """재실행 정리는 이 커널의 namespace 파일만 지우고, 다른 namespace나 namespace 없는 파일은 clean_unused에 맡긴다."""
+    shell = terminal_shell
+    dietnb.activate(shell, namespace="run-1")
+    try:
+        shell.parent_header = {"metadata": {"cellId": "cell-a"}}
+        image_dir = _core._get_notebook_image_dir(shell)
+        image_dir.mkdir(parents=True, exist_ok=True)
+        key = _core._get_cell_key(shell)
+        others = [f"1_1_{key}.png", f"1_1_run-2_{key}.png"]
+        for name in others:
+            # Earlier runs, so only the namespace keeps them from rerun cleanup
+            (image_dir / name).write_bytes(b"png")
+            os.utime(image_dir / name, (_manifest.PROCESS_START - 60,) * 2)
+        assert [_manifest.parse_namespace(name) for name in others] == [None, "run-2"]
+
+        _show(shell, 1)
+        _run_post_cell(shell)
+        _show(shell, 2)
+        _run_post_cell(shell)
+        assert {p.name for p in image_dir.glob("*.png")} == {f"2_1_run-1_{key}.png", *others}
+
+        result = dietnb.clean_unused()
+        assert sorted(os.path.basename(path) for path in result["deleted"]) == others
+        assert {p.name for p in image_dir.glob("*.png")} == {f"2_1_run-1_{key}.png"}
+    finally:
+        dietnb.deactivate(shell)
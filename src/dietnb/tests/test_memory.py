@@ -0,0 +1,62 @@
+import matplotlib.pyplot as plt
+
+import dietnb
+from dietnb import _stats
+
+
+def _run_post_cell(shell):
+    for callback in list(shell.events.callbacks.get("post_run_cell")):
+        callback(None)
+
+
+def _show_in_loop(shell, count):
+    shell.execution_count = 1
+    shell.parent_header = {"metadata": {"cellId": "memory-cell"}}
+    figures = []
+    for index in range(count):
+        fig, ax = plt.subplots(figsize=(2, 2))
+        ax.plot([0, 1], [0, index])
+        fig._repr_html_()
+        figures.append(fig)
+    return figures
+
+
+def test_release_figures_closes_each_figure_after_it_is_saved(terminal_shell):
+    """release_figures 옵션은 저장한 그림을 바로 pyplot에서 닫고 렌더러 버퍼를 놓는다."""
+    shell = terminal_shell
+    dietnb.activate(shell, dpi=40, release_figures=True)
+    try:
+        figures = _show_in_loop(shell, 3)
+        assert plt.get_fignums() == []
+        assert all("renderer" not in vars(fig.canvas) for fig in figures)
+        assert _stats.snapshot()["counters"]["figures_released"] == 3
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_figures_stay_open_until_the_cell_ends_by_default(terminal_shell):
+    """기본값에서는 셀이 끝날 때까지 그림이 pyplot에 남는다."""
+    shell = terminal_shell
+    dietnb.activate(shell, dpi=40)
+    try:
+        _show_in_loop(shell, 2)
+        assert len(plt.get_fignums()) == 2
+        _run_post_cell(shell)
+        assert plt.get_fignums() == []
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_memory_report_has_one_entry_per_cell(terminal_shell):
+    """memory_report 옵션은 셀마다 그림 수, 동시에 열린 그림의 최댓값과 RSS를 기록한다."""
+    shell = terminal_shell
+    dietnb.activate(shell, dpi=40, memory_report=True)
+    try:
+        _show_in_loop(shell, 3)
+        _run_post_cell(shell)
+        (entry,) = dietnb.memory_report()
+        assert entry["figures"] == 3 and entry["open_figures_peak"] == 3
+        assert entry["rss_peak_mib"] >= entry["rss_start_mib"] > 0
+        assert entry["rss_growth_mib"] >= 0
+    finally:
+        dietnb.deactivate(shell)
@@ -0,0 +1,105 @@
+import io
+
+import numpy as np
+import matplotlib.pyplot as plt
+import pytest
+from IPython.display import Image as IPythonImage
+from PIL import Image
+
+import dietnb
+from dietnb import _core
+
+
+def _noise_png(size=64):
+    pixels = np.random.default_rng(0).integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def kernel_shell(terminal_shell):
+    """커널처럼 모든 MIME 타입을 출력하도록 설정한 셸."""
+    formatter = terminal_shell.display_formatter
+    formatter.active_types = formatter.format_types
+    return terminal_shell
+
+
+def _run_post_cell(shell):
+    for callback in list(shell.events.callbacks.get("post_run_cell")):
+        callback(None)
+
+
+def test_pil_image_output_is_written_to_image_directory(kernel_shell):
+    """PIL 이미지의 PNG 출력도 그림처럼 파일로 저장하고 같은 HTML을 반환한다."""
+    shell = kernel_shell
+    dietnb.activate(shell, externalize_min_bytes=4096)
+    try:
+        shell.execution_count = 1
+        image = Image.open(io.BytesIO(_noise_png()))
+        data, metadata = shell.display_formatter.format(image)
+    finally:
+        dietnb.deactivate(shell)
+
+    assert "image/png" not in data and "text/plain" in data
+    assert 'class="dietnb-img"' in data["text/html"]
+    image_dir = _core._get_notebook_image_dir(shell)
+    (written,) = image_dir.iterdir()
+    assert written.name.startswith("1_1_") and written.suffix == ".png"
+    assert written.name in data["text/html"]
+    assert dietnb.stats()["counters"]["images_externalized"] == 1
+
+
+def test_ipython_image_keeps_size_and_follows_cell_cleanup(kernel_shell):
+    """IPython Image(base64 JPEG 포함)의 크기 정보를 유지하고, 셀 재실행 시 이전 파일을 지운다."""
+    shell = kernel_shell
+    pixels = np.random.default_rng(1).integers(0, 256, size=(128, 128, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG")
+    dietnb.activate(shell, externalize_min_bytes=4096)
+    try:
+        shell.execution_count = 1
+        fig, ax = plt.subplots()
+        fig_html = fig._repr_html_()
+        plt.close(fig)
+        data, _ = shell.display_formatter.format(IPythonImage(data=buffer.getvalue(), format="jpeg", width=120))
+        assert ' width="120"' in data["text/html"] and "image/jpeg" not in data
+
+        shell.execution_count = 2
+        shell.display_formatter.format(IPythonImage(data=buffer.getvalue(), format="jpeg"))
+        _run_post_cell(shell)
+    finally:
+        dietnb.deactivate(shell)
+
+    assert "1_1_" in fig_html and "1_2_" in data["text/html"]
+    image_dir = _core._get_notebook_image_dir(shell)
+    assert [p.name[:4] for p in image_dir.iterdir()] == ["2_1_"]
+
+
+def test_small_images_and_figures_are_left_alone(kernel_shell):
+    """임계값보다 작은 이미지는 그대로 두고, Figure는 PNG를 만들지 않는다."""
+    shell = kernel_shell
+    dietnb.activate(shell, externalize_min_bytes=1_000_000)
+    try:
+        shell.execution_count = 1
+        data, _ = shell.display_formatter.format(Image.open(io.BytesIO(_noise_png())))
+        assert "image/png" in data and "text/html" not in data
+
+        fig, ax = plt.subplots()
+        data, _ = shell.display_formatter.format(fig)
+        plt.close(fig)
+        assert "image/png" not in data and 'class="dietnb-img"' in data["text/html"]
+    finally:
+        dietnb.deactivate(shell)
+    assert not hasattr(shell.display_formatter.format, "__dietnb_original__")
+
+
+def test_externalizing_is_off_by_default(kernel_shell):
+    """기본값(externalize_min_bytes=None)에서는 훅을 설치하지 않고 기존처럼 PNG 포매터를 끈다."""
+    shell = kernel_shell
+    dietnb.activate(shell)
+    try:
+        assert not hasattr(shell.display_formatter.format, "__dietnb_original__")
+        assert shell.display_formatter.formatters["image/png"].enabled is False
+    finally:
+        dietnb.deactivate(shell)
@@ -0,0 +1,125 @@
+import base64
+import json
+import os
+import tracemalloc
+
+import matplotlib.pyplot as plt
+import pytest
+
+import dietnb
+from dietnb import _core, _nbscan
+
+
+def _html_output(src):
+    return {
+        "output_type": "display_data",
+        "metadata": {},
+        "data": {
+            "text/html": [
+                '<div class="dietnb-container">\n',
+                f'    <img src="{src}" alt="x" class="dietnb-img" style="max-width: 100%;">\n',
+                "</div>",
+            ],
+            "text/plain": ['<Figure size 640x480 with 1 Axes "quoted" \\ >'],
+        },
+    }
+
+
+def _write_notebook(path, outputs_per_cell):
+    cells = [
+        {"cell_type": "code", "execution_count": i, "metadata": {}, "source": ['print("\\\\")\n'], "outputs": outputs}
+        for i, outputs in enumerate(outputs_per_cell, start=1)
+    ]
+    path.write_text(
+        json.dumps({"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}, indent=1, ensure_ascii=False),
+        encoding="utf-8",
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [5, 64, 4096])
+def test_scanner_collects_sources_across_chunk_boundaries(tmp_path, chunk_size):
+    """청크 경계가 문자열·이스케이프 중간에 걸려도 dietnb 이미지 src를 모두 찾는다."""
+    notebook = tmp_path / "nb.ipynb"
+    _write_notebook(notebook, [
+        [_html_output("nb_dietnb_imgs/1_1_aaaaaaaaaaaa.png")],
+        [_html_output("nb_dietnb_imgs/%ED%95%9C%EA%B8%80.png?retry=3"),
+         {"output_type": "execute_result", "execution_count": 2, "metadata": {},
+          "data": {"text/html": '<img class="dietnb-img" src="nb_dietnb_imgs/직접.png">'}}],
+        [{"output_type": "display_data", "metadata": {},
+          "data": {"text/html": '<img class="other" src="not_ours.png">', "text/plain": "nb_dietnb_imgs/x.png"}}],
+    ])
+
+    assert _nbscan.referenced_image_names(notebook, chunk_size) == {"1_1_aaaaaaaaaaaa.png", "한글.png", "직접.png"}
+
+
+def test_scanner_memory_is_bounded_by_chunk_not_notebook(tmp_path):
+    """큰 base64 출력이 많은 노트북도 전체를 메모리에 올리지 않고 스캔한다."""
+    notebook = tmp_path / "big.ipynb"
+    payload = base64.b64encode(os.urandom(256 * 1024)).decode()
+    outputs = []
+    for i in range(40):
+        output = _html_output(f"big_dietnb_imgs/{i}_1_bbbbbbbbbbbb.png")
+        output["data"]["image/png"] = payload
+        outputs.append([output])
+    _write_notebook(notebook, outputs)
+    assert notebook.stat().st_size > 10 * 1024 * 1024
+
+    tracemalloc.start()
+    try:
+        names = _nbscan.referenced_image_names(notebook, chunk_size=64 * 1024)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(names) == 40
+    assert peak < 2 * 1024 * 1024
+
+
+def _show(shell, exec_count, cell_id):
+    shell.execution_count = exec_count
+    shell.parent_header = {"metadata": {"cellId": cell_id}}
+    fig, ax = plt.subplots()
+    ax.plot([0, 1], [0, exec_count])
+    try:
+        return fig._repr_html_()
+    finally:
+        plt.close(fig)
+
+
+def test_clean_unused_notebook_mode_keeps_saved_references(terminal_shell, detected_notebook):
+    """notebook 모드는 저장된 노트북이 참조하는 이미지와 현재 세션 이미지만 남긴다."""
+    shell = terminal_shell
+    dietnb.activate(shell)
+    try:
+        saved_html = _show(shell, 1, "cell-a")
+        image_dir = _core._get_notebook_image_dir(shell)
+        saved_src = saved_html.split('src="', 1)[1].split('"', 1)[0]
+        _write_notebook(detected_notebook, [[_html_output(saved_src)]])
+
+        # Latest image of a cell from an earlier session, no longer in the notebook
+        (image_dir / "7_1_cccccccccccc.png").write_bytes(b"old")
+        _core._registry.clear()
+
+        preview = dietnb.clean_unused(mode="notebook", dry_run=True)
+        assert preview["dry_run"]
+        assert [os.path.basename(p) for p in preview["deleted"]] == ["7_1_cccccccccccc.png"]
+        assert (image_dir / "7_1_cccccccccccc.png").exists()
+
+        # Session mode would keep it as the latest run of its cell
+        assert dietnb.clean_unused(dry_run=True)["deleted"] == []
+
+        result = dietnb.clean_unused(mode="notebook")
+        assert [os.path.basename(p) for p in result["deleted"]] == ["7_1_cccccccccccc.png"]
+        assert {p.name for p in image_dir.glob("*.png")} == {os.path.basename(saved_src)}
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_clean_unused_rejects_unknown_mode(terminal_shell):
+    """알 수 없는 정리 모드는 ValueError를 일으킨다."""
+    dietnb.activate(terminal_shell)
+    try:
+        with pytest.raises(ValueError):
+            dietnb.clean_unused(mode="everything")
+    finally:
+        dietnb.deactivate(terminal_shell)
@@ -0,0 +1,108 @@
+import io
+from pathlib import Path
+
+import numpy as np
+import matplotlib.pyplot as plt
+from PIL import Image
+
+import dietnb
+from dietnb import _core, _manifest, _optimize
+
+
+def _pixels(data):
+    with Image.open(io.BytesIO(data)) as image:
+        return np.asarray(image.convert("RGBA"))
+
+
+def _line_chart_png():
+    fig, ax = plt.subplots()
+    ax.plot([0, 1, 2, 3], [1, 3, 2, 4], color="tab:blue")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=100)
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def test_flat_chart_is_optimized_losslessly():
+    """색이 적은 차트는 픽셀 변화 없이 더 작은 PNG로 다시 인코딩된다."""
+    data = _line_chart_png()
+    smaller = _optimize.optimize_png(data)
+
+    assert smaller is not None and len(smaller) < len(data)
+    assert np.array_equal(_pixels(smaller), _pixels(data))
+
+
+def test_quantization_respects_tolerance():
+    """색이 많은 이미지는 허용 오차 안에서만 팔레트로 양자화한다."""
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, size=(64, 64, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(noise).save(buffer, format="PNG", compress_level=0)
+    data = buffer.getvalue()
+
+    lossless = _optimize.optimize_png(data)
+    assert lossless is None or np.array_equal(_pixels(lossless), _pixels(data))
+    lossy = _optimize.optimize_png(data, tolerance=255)
+    assert lossy is not None and len(lossy) < len(data)
+
+
+def test_optimize_file_keeps_files_changed_meanwhile(tmp_path, monkeypatch):
+    """최적화 중 원본이 바뀌면 교체하지 않는다."""
+    target = tmp_path / "1_1_aaaaaaaaaaaa.png"
+    target.write_bytes(_line_chart_png())
+
+    def rewrite_meanwhile(data, tolerance):
+        target.write_bytes(b"rewritten by a rerun")
+        return b"smaller"
+
+    monkeypatch.setattr(_optimize, "optimize_png", rewrite_meanwhile)
+    assert _optimize.optimize_file(target) == 0
+    assert target.read_bytes() == b"rewritten by a rerun"
+    assert list(tmp_path.glob(".*.tmp")) == []
+
+
+def test_optimize_job_tolerates_files_deleted_right_after_rewriting(tmp_path, monkeypatch):
+    """재작성 직후 재실행으로 파일이 지워져도 최적화 작업은 예외 없이 끝나고, 그 밖의 오류는 실패로 센다."""
+    target = tmp_path / "1_1_aaaaaaaaaaaa.png"
+    manifest = _manifest._DirectoryManifest(tmp_path)
+
+    def optimize_then_delete(path, tolerance):
+        path.unlink(missing_ok=True)
+        return 100
+
+    monkeypatch.setattr(_optimize, "optimize_file", optimize_then_delete)
+    _core._optimize_image(manifest, target, 0)
+    assert "images_optimized" not in dietnb.stats()["counters"]
+
+    def deny_stat(self, **kwargs):
+        raise PermissionError(str(self))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Path, "stat", deny_stat)
+        _core._optimize_image(manifest, target, 0)
+    assert dietnb.stats()["counters"]["optimize_failures"] == 1
+
+
+def test_optimize_option_rewrites_images_in_background(terminal_shell):
+    """optimize 옵션은 셀 종료를 기다리지 않고 백그라운드에서 이미지를 줄이고 절감량을 보고한다."""
+    shell = terminal_shell
+    dietnb.activate(shell, optimize=True)
+    try:
+        shell.execution_count = 1
+        fig, ax = plt.subplots()
+        ax.plot([0, 1, 2, 3], [1, 3, 2, 4])
+        rendered = _core._render_figure(fig, "png", 150)
+        fig._repr_html_()
+        plt.close(fig)
+        assert _core._optimizer.flush() == []
+
+        image_dir = _core._get_notebook_image_dir(shell)
+        (written,) = image_dir.glob("*.png")
+        assert len(written.read_bytes()) < len(rendered)
+        assert np.array_equal(_pixels(written.read_bytes()), _pixels(rendered))
+
+        saved = dietnb.stats()["counters"]["optimize_bytes_saved"]
+        assert saved > 0
+        assert dietnb.disk_usage()["optimized_bytes_saved"] == saved
+    finally:
+        dietnb.deactivate(shell)
@@ -0,0 +1,84 @@
+import json
+
+import matplotlib.pyplot as plt
+import pytest
+
+import dietnb
+from dietnb import _core, _templates
+
+FIGURES = 1000
+
+
+def _notebook_bytes(shell, output, monkeypatch):
+    """Displays FIGURES figures and returns the size of the resulting notebook outputs."""
+    # Only the HTML around the image matters here, so skip rasterization
+    monkeypatch.setattr(_core, "_render_figure", lambda fig, fmt, dpi: b"\x89PNG")
+    dietnb.activate(shell, output=output)
+    fig, ax = plt.subplots()
+    outputs = []
+    try:
+        for exec_count in range(1, FIGURES + 1):
+            shell.execution_count = exec_count
+            shell.parent_header = {"metadata": {"cellId": f"cell-{exec_count}"}}
+            html = fig._repr_html_()
+            outputs.append({"output_type": "display_data", "data": {"text/html": html}, "metadata": {}})
+    finally:
+        plt.close(fig)
+        dietnb.deactivate(shell)
+    return len(json.dumps({"cells": [{"outputs": outputs}]}, indent=1).encode())
+
+
+def test_compact_output_shrinks_notebook_bytes_per_figure(terminal_shell, monkeypatch):
+    """compact 모드는 1,000개 그림의 노트북 크기를 full 모드보다 크게 줄인다."""
+    full = _notebook_bytes(terminal_shell, "full", monkeypatch) / FIGURES
+    _core._registry.clear()
+    compact = _notebook_bytes(terminal_shell, "compact", monkeypatch) / FIGURES
+    # About 4.8 KB per figure in full mode against 0.5 KB in compact mode
+    assert full / compact > 8
+
+
+def test_compact_assets_are_emitted_once_and_after_owner_reruns(terminal_shell):
+    """에셋은 세션의 첫 그림에만 붙고, 그 셀을 다시 실행하면 새 출력에 다시 붙는다."""
+    shell = terminal_shell
+    dietnb.activate(shell, output="compact")
+    try:
+        def display(exec_count, cell_id):
+            shell.execution_count = exec_count
+            shell.parent_header = {"metadata": {"cellId": cell_id}}
+            fig, ax = plt.subplots()
+            try:
+                return fig._repr_html_()
+            finally:
+                plt.close(fig)
+
+        first = display(1, "cell-a")
+        same_execution = display(1, "cell-a")
+        other_cell = display(2, "cell-b")
+        owner_rerun = display(3, "cell-a")
+    finally:
+        dietnb.deactivate(shell)
+
+    assert first.startswith(_templates.COMPACT_ASSETS)
+    assert "<script>" not in same_execution and "<script>" not in other_cell
+    assert owner_rerun.startswith(_templates.COMPACT_ASSETS)
+    assert 'class="dietnb-container dietnb-compact"' in other_cell
+
+
+def test_compact_async_images_use_delegated_retry(terminal_shell):
+    """compact 모드의 비동기 이미지는 인라인 onerror 대신 data 속성만 가진다."""
+    shell = terminal_shell
+    dietnb.activate(shell, output="compact", async_writes=True)
+    try:
+        shell.execution_count = 1
+        fig, ax = plt.subplots()
+        html = fig._repr_html_()
+        plt.close(fig)
+    finally:
+        dietnb.deactivate(shell)
+    assert "data-dietnb-async" in html and "onerror" not in html
+
+
+def test_invalid_output_mode_is_rejected(terminal_shell):
+    """지원하지 않는 output 값은 ValueError를 일으킨다."""
+    with pytest.raises(ValueError):
+        dietnb.activate(terminal_shell, output="minimal")
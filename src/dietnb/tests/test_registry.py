@@ -0,0 +1,42 @@
+from dietnb import _core
+
+
+def test_registry_indices_and_fresh_executions():
+    """실행 번호가 바뀔 때만 새 실행으로 보고 인덱스를 1부터 다시 센다."""
+    registry = _core._FigureRegistry()
+    assert registry.register("dir", "cell", 1) == (1, True)
+    assert registry.register("dir", "cell", 1) == (2, False)
+    assert registry.register("dir", "cell", 2) == (1, True)
+    assert registry.register("other", "cell", 2) == (1, True)
+    assert registry.active_cell_keys("dir") == {"cell"}
+    assert registry.active_cell_keys("missing") == set()
+
+
+def test_registry_lru_cap_forgets_least_recent_cells():
+    """추적 셀 수 상한을 넘으면 가장 오래 실행되지 않은 셀을 잊는다."""
+    registry = _core._FigureRegistry(max_cells=2)
+    for exec_count, cell in enumerate(["a", "b", "a", "c"], start=1):
+        registry.register("dir", cell, exec_count)
+
+    assert len(registry) == 2
+    assert registry.active_cell_keys("dir") == {"a", "c"}
+
+    registry.set_max_cells(1)
+    assert registry.active_cell_keys("dir") == {"c"}
+
+
+def test_registry_clear_matches_a_fresh_registry():
+    """clear() 뒤의 LRU 순서는 새 레지스트리와 같다."""
+    cleared = _core._FigureRegistry(max_cells=2)
+    for exec_count, cell in enumerate(["a", "b", "c"], start=1):
+        cleared.register("dir", cell, exec_count)
+    cleared.clear()
+
+    fresh = _core._FigureRegistry(max_cells=2)
+    for registry in (cleared, fresh):
+        for exec_count, (dir_key, cell) in enumerate([("x", "a"), ("y", "b"), ("x", "c")], start=1):
+            registry.register(dir_key, cell, exec_count)
+
+    assert cleared._tick == fresh._tick == 3
+    for dir_key in ("x", "y"):
+        assert cleared.active_cell_keys(dir_key) == fresh.active_cell_keys(dir_key)
@@ -0,0 +1,138 @@
+import matplotlib.pyplot as plt
+import pytest
+from matplotlib.ticker import FuncFormatter
+
+import dietnb
+from dietnb import _cache, _core
+
+# Read by a tick formatter below; changing it changes the rendered figure
+UNIT = "m"
+
+
+def _show(shell, exec_count, y):
+    shell.execution_count = exec_count
+    fig, ax = plt.subplots()
+    ax.plot([0, 1], y)
+    try:
+        return fig._repr_html_()
+    finally:
+        plt.close(fig)
+
+
+def test_unchanged_figure_skips_rendering_on_rerun(terminal_shell, monkeypatch):
+    """같은 셀을 재실행했을 때 그림이 바뀌지 않았다면 렌더링을 건너뛴다."""
+    shell = terminal_shell
+    renders = []
+    original_render = _core._render_figure
+
+    def counting_render(fig, fmt, dpi):
+        renders.append(fig)
+        return original_render(fig, fmt, dpi)
+
+    monkeypatch.setattr(_core, "_render_figure", counting_render)
+    dietnb.activate(shell, render_cache=True)
+    try:
+        _show(shell, 1, [0, 1])
+        html = _show(shell, 2, [0, 1])
+        assert len(renders) == 1
+        assert "2_1_" in html
+
+        image_dir = _core._get_notebook_image_dir(shell)
+        (saved,) = list(image_dir.glob("*.png"))
+        assert saved.name.startswith("2_1_")
+
+        _show(shell, 3, [1, 0])
+        assert len(renders) == 2
+
+        counters = dietnb.stats()["counters"]
+        assert counters["render_cache_hits"] == 1
+        assert counters["render_cache_misses"] == 2
+    finally:
+        dietnb.deactivate(shell)
+
+
+@pytest.mark.parametrize("options", [{"async_writes": True}, {"async_writes": True, "format": "svg"}])
+def test_each_figure_counts_one_cache_lookup(terminal_shell, options):
+    """비동기 쓰기나 SVG 경로에서도 그림마다 캐시 적중/실패를 한 번만 센다."""
+    shell = terminal_shell
+    dietnb.activate(shell, render_cache=True, **options)
+    try:
+        for exec_count, y in enumerate([[0, 1], [0, 1], [1, 0]], start=1):
+            _show(shell, exec_count, y)
+            for callback in list(shell.events.callbacks.get("post_run_cell")):
+                callback(None)
+
+        counters = dietnb.stats()["counters"]
+        assert (counters["render_cache_hits"], counters["render_cache_misses"]) == (1, 2)
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_render_cache_evicts_least_recently_used_entries():
+    """항목 수와 바이트 한도를 넘으면 가장 오래 쓰지 않은 항목부터 제거한다."""
+    cache = _cache._RenderCache(max_entries=2, max_bytes=10)
+    cache.put("a", "fa", b"1234")
+    cache.put("b", "fb", b"1234")
+    assert cache.get("a", "fa") == b"1234"
+    cache.put("c", "fc", b"1234")
+    assert cache.get("b", "fb") is None
+    assert cache.get("a", "fa") == b"1234"
+    assert cache.get("a", "other") is None
+
+    cache.put("d", "fd", b"123456789")
+    assert len(cache) == 1
+    assert cache.nbytes == 9
+
+
+def test_fingerprint_tracks_data_and_rcparams():
+    """데이터나 rcParams가 바뀌면 지문도 달라진다."""
+    def make(y):
+        fig, ax = plt.subplots()
+        ax.plot([0, 1], y)
+        return fig
+
+    figs = [make([0, 1]), make([0, 1]), make([0, 2])]
+    try:
+        first, same, changed = (_cache.figure_fingerprint(f, "png", 150) for f in figs)
+        assert first == same
+        assert first != changed
+        assert _cache.figure_fingerprint(figs[0], "png", 72) != first
+        with plt.rc_context({"lines.linewidth": 7}):
+            assert _cache.figure_fingerprint(figs[0], "png", 150) != first
+    finally:
+        for fig in figs:
+            plt.close(fig)
+
+
+def test_formatter_reading_a_global_is_never_served_from_cache(terminal_shell, monkeypatch):
+    """포맷터 함수가 읽는 전역 변수는 지문에 담기지 않으므로, 사용자 함수가 있는 그림은 캐시하지 않는다."""
+    shell = terminal_shell
+    renders = []
+    original_render = _core._render_figure
+
+    def counting_render(fig, fmt, dpi):
+        renders.append(fig)
+        return original_render(fig, fmt, dpi)
+
+    def show(exec_count):
+        shell.execution_count = exec_count
+        fig, ax = plt.subplots()
+        ax.plot([0, 1], [0, 1])
+        ax.xaxis.set_major_formatter(FuncFormatter(lambda x, pos: f"{x:.0f} {UNIT}"))
+        try:
+            return fig._repr_html_()
+        finally:
+            plt.close(fig)
+
+    monkeypatch.setattr(_core, "_render_figure", counting_render)
+    dietnb.activate(shell, render_cache=True)
+    try:
+        show(1)
+        monkeypatch.setitem(globals(), "UNIT", "km")
+        show(2)
+        assert len(renders) == 2
+        counters = dietnb.stats()["counters"]
+        assert counters.get("render_cache_hits", 0) == 0
+        assert counters["render_cache_uncacheable"] == 2
+    finally:
+        dietnb.deactivate(shell)
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+from IPython.display import JSON
+
+import dietnb
+from dietnb import _core, _nbscan
+
+
+class _WideTable:
+    """DataFrame처럼 큰 HTML과 짧은 텍스트 표현을 가진 객체."""
+
+    def _repr_html_(self):
+        rows = "".join(f"<tr><td>{i}</td><td>value {i}</td></tr>" for i in range(5000))
+        return f"<table>{rows}</table>"
+
+    def __repr__(self):
+        return "<WideTable 5000 rows>"
+
+
+@pytest.fixture
+def kernel_shell(terminal_shell):
+    """커널처럼 모든 MIME 타입을 출력하도록 설정한 셸."""
+    formatter = terminal_shell.display_formatter
+    formatter.active_types = formatter.format_types
+    return terminal_shell
+
+
+def _run_post_cell(shell):
+    for callback in list(shell.events.callbacks.get("post_run_cell")):
+        callback(None)
+
+
+def test_large_html_output_moves_to_sidecar_and_is_cleaned_on_rerun(kernel_shell):
+    """큰 HTML 출력은 사이드카 파일로 옮기고 미리보기와 링크만 남기며, 재실행 시 정리된다."""
+    shell = kernel_shell
+    dietnb.activate(shell, sidecar_min_bytes=10_000, sidecar_preview_chars=200)
+    try:
+        shell.execution_count = 1
+        data, _ = shell.display_formatter.format(_WideTable())
+        image_dir = _core._get_notebook_image_dir(shell)
+        (sidecar,) = image_dir.iterdir()
+        assert sidecar.suffix == ".html" and "value 4999" in sidecar.read_text()
+        assert len(data["text/html"]) < 1000 and 'class="dietnb-sidecar"' in data["text/html"]
+        assert sidecar.name in data["text/html"] and "&lt;WideTable 5000 rows&gt;" in data["text/html"]
+
+        shell.execution_count = 2
+        shell.display_formatter.format(_WideTable())
+        _run_post_cell(shell)
+    finally:
+        dietnb.deactivate(shell)
+    assert [p.name[:4] for p in image_dir.iterdir()] == ["2_1_"]
+    assert dietnb.stats()["counters"]["sidecars_written"] == 2
+
+
+def test_large_json_and_text_outputs_use_matching_extensions(kernel_shell):
+    """큰 JSON과 긴 텍스트 출력은 각각 .json, .txt 파일이 되고, 작은 출력은 그대로 둔다."""
+    shell = kernel_shell
+    payload = {"values": list(range(5000))}
+    dietnb.activate(shell, sidecar_min_bytes=10_000)
+    try:
+        shell.execution_count = 1
+        shell.display_formatter.format(JSON(payload))
+        data, _ = shell.display_formatter.format("log line\n" * 3000)
+        assert len(data["text/plain"]) <= 2000
+        small, _ = shell.display_formatter.format([1, 2, 3])
+    finally:
+        dietnb.deactivate(shell)
+
+    assert small == {"text/plain": "[1, 2, 3]"}
+    image_dir = _core._get_notebook_image_dir(shell)
+    files = {p.suffix: p for p in image_dir.iterdir()}
+    assert set(files) == {".json", ".txt"}
+    assert json.loads(files[".json"].read_text()) == payload
+    assert files[".txt"].read_text() == repr("log line\n" * 3000)
+
+
+def test_sidecar_output_captures_long_logs(kernel_shell, capsys):
+    """sidecar_output은 긴 로그만 사이드카로 보내고 짧은 출력은 그대로 출력한다."""
+    shell = kernel_shell
+    dietnb.activate(shell)
+    try:
+        shell.execution_count = 1
+        with dietnb.sidecar_output(min_bytes=1000):
+            print("short")
+        with dietnb.sidecar_output(min_bytes=1000):
+            for step in range(500):
+                print(f"step {step}: loss=0.1")
+    finally:
+        dietnb.deactivate(shell)
+
+    assert "short" in capsys.readouterr().out
+    image_dir = _core._get_notebook_image_dir(shell)
+    (log,) = image_dir.iterdir()
+    assert log.suffix == ".txt" and log.read_text().count("\n") == 500
+
+
+def test_notebook_scan_keeps_linked_sidecars(tmp_path):
+    """노트북 스캔은 사이드카 링크가 가리키는 파일도 참조된 것으로 본다."""
+    html = '<div><pre>x</pre><a class="dietnb-sidecar" href="nb_dietnb_imgs/3_1_abcdefabcdef.html">Open</a></div>'
+    notebook = tmp_path / "nb.ipynb"
+    outputs = [{"output_type": "display_data", "metadata": {}, "data": {"text/html": html}}]
+    notebook.write_text(json.dumps({"cells": [{"cell_type": "code", "outputs": outputs}]}))
+    assert _nbscan.referenced_image_names(notebook) == {"3_1_abcdefabcdef.html"}
@@ -0,0 +1,63 @@
+import json
+
+import matplotlib.pyplot as plt
+
+import dietnb
+from dietnb import _core
+
+
+def _display(shell, exec_count):
+    shell.execution_count = exec_count
+    fig, ax = plt.subplots()
+    ax.plot([0, 1], [1, 0])
+    try:
+        return fig._repr_html_()
+    finally:
+        plt.close(fig)
+
+
+def test_stats_report_stages_bytes_and_deletions(terminal_shell):
+    """단계별 타이머와 기록/삭제 바이트 수가 stats()에 집계된다."""
+    shell = terminal_shell
+    dietnb.activate(shell)
+    try:
+        _display(shell, 1)
+        _display(shell, 2)
+    finally:
+        dietnb.deactivate(shell)
+
+    snapshot = dietnb.stats()
+    counters, timings = snapshot["counters"], snapshot["timings"]
+    image_dir = _core._get_notebook_image_dir(shell)
+    (written,) = image_dir.iterdir()
+    assert counters["figures_saved"] == 2 and counters["files_deleted"] == 1
+    assert counters["bytes_written"] >= written.stat().st_size
+    for stage in ("resolve", "registry", "save", "template"):
+        assert timings[f"stage_{stage}"]["count"] == 2
+    assert timings["stage_cleanup"]["count"] == 2
+    assert timings["write"]["count"] == 2
+
+
+def test_failures_are_counted_and_logged(terminal_shell, tmp_path, monkeypatch):
+    """렌더링 실패는 삼키지 않고 stats()와 JSON 로그에 남긴다."""
+    log = tmp_path / "dietnb-stats.jsonl"
+
+    def broken_render(fig, fmt, dpi):
+        raise RuntimeError("boom")
+
+    shell = terminal_shell
+    dietnb.activate(shell, stats_log=str(log))
+    try:
+        _display(shell, 1)
+        monkeypatch.setattr(_core, "_render_figure", broken_render)
+        assert _display(shell, 2) is None
+    finally:
+        dietnb.deactivate(shell)
+
+    assert dietnb.stats()["counters"]["figure_failures"] == 1
+    events = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [event["event"] for event in events] == ["figure", "figure_failed"]
+    figure, failure = events
+    assert figure["bytes"] > 0 and figure["format"] == "png"
+    assert set(figure["ms"]) >= {"stage_resolve", "stage_save", "figure_latency"}
+    assert failure["stage"] == "save" and "boom" in failure["error"]
@@ -0,0 +1,110 @@
+import matplotlib.pyplot as plt
+
+import dietnb
+from dietnb import _core
+
+
+def _run_post_cell(shell):
+    for callback in list(shell.events.callbacks.get("post_run_cell")):
+        callback(None)
+
+
+def _show(shell, exec_count, cell_id, y):
+    shell.execution_count = exec_count
+    shell.parent_header = {"metadata": {"cellId": cell_id}}
+    fig, ax = plt.subplots()
+    ax.plot([0, 1], y)
+    try:
+        html = fig._repr_html_()
+    finally:
+        plt.close(fig)
+    return html.split('src="')[1].split('"')[0]
+
+
+def test_content_storage_dedupes_identical_figures(terminal_shell):
+    """내용이 같은 그림은 재실행과 다른 셀에서도 같은 파일을 공유하고 다시 쓰지 않는다."""
+    shell = terminal_shell
+    dietnb.activate(shell, storage="content")
+    try:
+        first_src = _show(shell, 1, "cell-a", [0, 1])
+        _run_post_cell(shell)
+        image_dir = _core._get_notebook_image_dir(shell)
+        (stored,) = list(image_dir.glob("*.png"))
+        mtime = stored.stat().st_mtime_ns
+
+        assert _show(shell, 2, "cell-a", [0, 1]) == first_src
+        _run_post_cell(shell)
+        assert _show(shell, 3, "cell-b", [0, 1]) == first_src
+        _run_post_cell(shell)
+
+        assert list(image_dir.glob("*.png")) == [stored]
+        assert stored.stat().st_mtime_ns == mtime
+        assert dietnb.stats()["counters"]["dedupe_hits"] == 2
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_content_storage_removes_unreferenced_files_after_rerun(terminal_shell):
+    """재실행으로 더 이상 참조되지 않는 파일만 셀 종료 시 삭제된다."""
+    shell = terminal_shell
+    dietnb.activate(shell, storage="content")
+    try:
+        shared_src = _show(shell, 1, "cell-a", [0, 1])
+        _show(shell, 2, "cell-b", [0, 1])
+        _run_post_cell(shell)
+
+        new_src = _show(shell, 3, "cell-a", [1, 0])
+        _run_post_cell(shell)
+
+        image_dir = _core._get_notebook_image_dir(shell)
+        names = {p.name for p in image_dir.glob("*.png")}
+        # cell-b still references the shared file
+        assert names == {shared_src.split("/")[-1], new_src.split("/")[-1]}
+
+        _show(shell, 4, "cell-b", [2, 3])
+        _run_post_cell(shell)
+        names = {p.name for p in image_dir.glob("*.png")}
+        assert shared_src.split("/")[-1] not in names
+        assert len(names) == 2
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_content_storage_survives_clean_unused_and_outside_changes(terminal_shell):
+    """영구 매니페스트가 없어도 디렉터리를 다시 읽을 때 내용 주소 파일의 참조를 잃지 않는다."""
+    shell = terminal_shell
+    dietnb.activate(shell, storage="content")
+    try:
+        first = _show(shell, 1, "cell-a", [0, 1]).split("/")[-1]
+        _run_post_cell(shell)
+        image_dir = _core._get_notebook_image_dir(shell)
+
+        result = dietnb.clean_unused()
+        assert result["deleted"] == [] and len(result["kept"]) == 1
+        assert (image_dir / first).exists()
+
+        # A change from outside the kernel makes the manifest rescan the directory
+        (image_dir / "notes.txt").write_text("kept")
+        second = _show(shell, 2, "cell-a", [1, 0]).split("/")[-1]
+        _run_post_cell(shell)
+        assert {p.name for p in image_dir.glob("*.png")} == {second}
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_content_storage_dedupes_identical_svg_figures(terminal_shell):
+    """SVG에는 날짜나 무작위 id가 들어가지 않으므로, 같은 그림은 다른 셀에서도 하나의 파일을 공유한다."""
+    shell = terminal_shell
+    dietnb.activate(shell, storage="content", format="svg")
+    try:
+        first_src = _show(shell, 1, "cell-a", [0, 1])
+        _run_post_cell(shell)
+        assert _show(shell, 2, "cell-b", [0, 1]) == first_src
+        _run_post_cell(shell)
+
+        image_dir = _core._get_notebook_image_dir(shell)
+        (stored,) = list(image_dir.glob("*.svg"))
+        assert "<dc:date>" not in stored.read_text()
+        assert dietnb.stats()["counters"]["dedupe_hits"] == 1
+    finally:
+        dietnb.deactivate(shell)
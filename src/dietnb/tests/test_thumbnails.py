@@ -0,0 +1,78 @@
+import re
+
+import matplotlib.pyplot as plt
+from PIL import Image
+
+import dietnb
+from dietnb import _core, _export, _thumbnails
+
+
+def _run_post_cell(shell):
+    for callback in list(shell.events.callbacks.get("post_run_cell")):
+        callback(None)
+
+
+def _show(shell, exec_count, figsize=(6.4, 4.8)):
+    shell.execution_count = exec_count
+    shell.parent_header = {"metadata": {"cellId": "thumb-cell"}}
+    fig, ax = plt.subplots(figsize=figsize)
+    ax.plot([0, 1], [0, exec_count])
+    try:
+        return fig._repr_html_()
+    finally:
+        plt.close(fig)
+
+
+def _attr(html, name):
+    return re.search(rf'<img [^>]*\b{name}="([^"]*)"', html).group(1)
+
+
+def test_thumbnails_are_lazy_srcset_candidates_cleaned_with_their_image(terminal_shell):
+    """썸네일은 srcset 1x/2x로 지연 로드되고, src는 원본을 가리키며, 재실행 시 원본과 함께 삭제된다."""
+    shell = terminal_shell
+    dietnb.activate(shell, dpi=100, thumbnail_width=200)
+    try:
+        html = _show(shell, 1)
+        # The cell ends only once its thumbnails are on disk
+        _run_post_cell(shell)
+        image_dir = _core._get_notebook_image_dir(shell)
+        (full,) = [p for p in image_dir.glob("*.png") if ".w" not in p.name]
+
+        assert _attr(html, "src").endswith(full.name)
+        assert _attr(html, "loading") == "lazy" and _attr(html, "width") == "200"
+        with Image.open(full) as image:
+            assert int(_attr(html, "height")) == round(image.height * 200 / image.width)
+        one, two = [candidate.split(" ") for candidate in _attr(html, "srcset").split(", ")]
+        assert one[1] == "1x" and two[1] == "2x"
+        for (url, _), width in ((one, 200), (two, 400)):
+            with Image.open(image_dir / url.rsplit("/", 1)[1]) as thumbnail:
+                assert thumbnail.width == width
+        assert html.count("onerror=") == 1
+        assert len(_export.referenced_urls(html, thumbnails=True)) == 3
+
+        for exec_count in (2, 3):
+            _show(shell, exec_count)
+            _run_post_cell(shell)
+        assert sorted(p.name.split("_")[0] for p in image_dir.glob("*.png")) == ["3", "3", "3"]
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_small_images_only_get_their_size(terminal_shell):
+    """썸네일 너비보다 작은 이미지는 썸네일 없이 크기와 loading 속성만 받는다."""
+    shell = terminal_shell
+    dietnb.activate(shell, dpi=50, thumbnail_width=800, output="compact")
+    try:
+        html = _show(shell, 1, figsize=(2, 1))
+        assert _attr(html, "loading") == "lazy" and " srcset=" not in html
+        assert int(_attr(html, "width")) <= 100
+    finally:
+        dietnb.deactivate(shell)
+
+
+def test_plan_uses_full_image_as_2x_when_it_is_small_enough():
+    """원본이 2배 너비보다 작으면 2x 후보로 원본을 쓰고 썸네일은 하나만 만든다."""
+    plan = _thumbnails.plan("1_1_a.png", (300, 150), 200)
+    assert (plan.width, plan.height) == (200, 100)
+    assert plan.thumbnails == (("1_1_a.w200.png", 200),)
+    assert plan.srcset == (("1_1_a.w200.png", "1x"), ("1_1_a.png", "1.5x"))
@@ -0,0 +1,117 @@
+import warnings
+
+import matplotlib.pyplot as plt
+import pytest
+
+import dietnb
+from dietnb import _core
+
+
+def _run_post_cell(shell):
+    for callback in list(shell.events.callbacks.get("post_run_cell")):
+        callback(None)
+
+
+def test_async_writes_return_html_before_file_is_flushed(terminal_shell):
+    """비동기 모드에서 HTML을 먼저 반환하고 셀 종료 시 파일이 모두 기록되는지 확인한다."""
+    shell = terminal_shell
+    shell.execution_count = 3
+    dietnb.activate(shell, async_writes=True, max_workers=2, max_pending=2)
+    try:
+        figures = []
+        for offset in range(5):
+            fig, ax = plt.subplots()
+            ax.plot([0, 1], [offset, offset + 1])
+            figures.append(fig)
+            html = fig._repr_html_()
+            assert html is not None
+            assert "3_%d_" % (offset + 1) in html
+            assert "onerror" in html
+
+        _run_post_cell(shell)
+
+        image_dir = _core._get_notebook_image_dir(shell)
+        assert sorted(p.name.split("_")[1] for p in image_dir.glob("*.png")) == ["1", "2", "3", "4", "5"]
+
+        stats = dietnb.stats()
+        assert stats["counters"]["figures_saved"] == 5
+        assert stats["timings"]["figure_latency"]["count"] == 5
+        assert stats["timings"]["background_write"]["count"] == 5
+        assert stats["gauges"]["write_queue_depth"]["current"] == 0
+        assert 1 <= stats["gauges"]["write_queue_depth"]["peak"] <= 2
+    finally:
+        for fig in figures:
+            plt.close(fig)
+        dietnb.deactivate(shell)
+
+
+def test_async_writes_keep_the_figure_as_displayed(terminal_shell):
+    """비동기 모드에서도 표시 시점의 그림이 저장되어, 이후 셀에서 그림을 바꿔도 이미 표시된 이미지는 바뀌지 않는다."""
+    shell = terminal_shell
+    shell.execution_count = 1
+    dietnb.activate(shell, async_writes=True, dpi=40)
+    fig, ax = plt.subplots(figsize=(2, 2))
+    line, = ax.plot([0, 1], [0, 1])
+    try:
+        expected = []
+        for index in range(4):
+            line.set_ydata([index, 0])
+            fig.set_size_inches(2 + index, 2)
+            expected.append(_core._render_figure(fig, "png", 40))
+            html = fig._repr_html_()
+            assert "1_%d_" % (index + 1) in html
+        # Keep drawing on the figure while the pool is encoding
+        line.set_ydata([9, 9])
+        fig.set_size_inches(8, 8)
+
+        _run_post_cell(shell)
+        image_dir = _core._get_notebook_image_dir(shell)
+        written = sorted(image_dir.glob("*.png"), key=lambda p: p.name.split("_")[1])
+        assert [p.read_bytes() for p in written] == expected
+    finally:
+        plt.close(fig)
+        dietnb.deactivate(shell)
+
+
+def test_async_write_failures_are_reported_on_flush(terminal_shell, monkeypatch):
+    """백그라운드 저장 실패가 셀 종료 시 경고로 보고되는지 확인한다."""
+    shell = terminal_shell
+    dietnb.activate(shell, async_writes=True)
+    fig, ax = plt.subplots()
+
+    def broken_write(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(_core, "_write_image", broken_write)
+    try:
+        assert fig._repr_html_() is not None
+        with pytest.warns(RuntimeWarning, match="disk full"):
+            _run_post_cell(shell)
+        assert dietnb.stats()["counters"]["write_failures"] == 1
+    finally:
+        plt.close(fig)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            dietnb.deactivate(shell)
+
+
+def test_activate_rejects_unknown_options(terminal_shell):
+    """알 수 없는 옵션은 TypeError로 거부되어야 한다."""
+    with pytest.raises(TypeError):
+        dietnb.activate(terminal_shell, no_such_option=True)
+
+
+def test_image_writes_are_atomic(tmp_path, monkeypatch):
+    """이미지는 임시 파일에 쓴 뒤 이름을 바꾸므로, 실패해도 기존 파일이 깨지거나 임시 파일이 남지 않는다."""
+    target = tmp_path / "1_1_a.png"
+    _core._write_image(target, b"first")
+    assert target.read_bytes() == b"first"
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(_core.os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        _core._write_image(target, b"second")
+    assert target.read_bytes() == b"first"
+    assert [p.name for p in tmp_path.iterdir() if p.name != "sample.ipynb"] == ["1_1_a.png"]